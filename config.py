@@ -16,13 +16,93 @@ AP_MARGIN_CELLS = 2 # Số ô cách mép
 P_TX_MAX_RSSI = -30     # dBm (RSSI tối đa khi ở rất gần AP, không vật cản)
 PATH_LOSS_EXPONENT_N = 2.8 # Hệ số suy hao đường truyền
 SHELF_ATTENUATION_DB = 4.0 # Suy hao qua mỗi đơn vị kệ hàng/vật cản (dB)
+# Suy hao (dB) khi tia đi qua một ô, theo vật liệu của ô (xem rssi_simulation.build_attenuation_raster).
+# Mã ô không thuộc nhóm nào dùng SHELF_ATTENUATION_DB.
+MATERIAL_ATTENUATION_DB = {
+    "wall": 8.0,  # OBSTACLE_ID: tường, cột
+    "stall": 4.0, # STALL_ID_START..STALL_ID_END: quầy/kệ hàng
+    "item": 6.0,  # >= ITEM_ID_START: ô chứa hàng hóa (hàng xếp dày, nhiều nước/kim loại)
+}
 NOISE_STD_DEV_DB = 0.2     # Độ lệch chuẩn của nhiễu Gaussian (dB)
 MIN_RSSI_THRESHOLD = -95   # Ngưỡng RSSI tối thiểu có thể phát hiện
 
+# --- Mô hình nhiễu (xem noise_models.py) ---
+NOISE_MODEL = "iid"        # "iid" | "shadowing" (tương quan không gian) | "temporal" (tương quan theo thời gian)
+NOISE_SEED = None          # Số nguyên để mô phỏng lặp lại được; None = ngẫu nhiên mỗi lần chạy
+SHADOW_FADING_CORR_DISTANCE_M = 4.0 # Khoảng cách tương quan của bóng mờ (m)
+SHADOW_FADING_IID_FRACTION = 0.3    # Tỉ lệ phương sai nhiễu độc lập mỗi lần đo (phần còn lại là bóng mờ)
+TEMPORAL_FADING_CORR_DISTANCE_M = 2.0 # Quãng đường (m) để fading của xe đẩy giảm tương quan còn 1/e
+
+# --- Bộ đệm fingerprint trên đĩa ---
+FINGERPRINT_CACHE_DIR = ".fingerprint_cache" # Thư mục chứa các file .npy đã tạo
+
+# --- Định dạng lưu trữ fingerprint (xem fingerprint_storage.py) ---
+FINGERPRINT_STORAGE_MODE = "float32" # "float32" | "int8" (1 byte/giá trị) | "float16" (2 byte/giá trị)
+FINGERPRINT_INT8_STEP_DB = 0.5       # Bước lượng tử của chế độ int8 (dB)
+
 # --- Tham số KNN ---
 K_NEIGHBORS = 3
 USE_WEIGHTED_KNN = True
 EPSILON_WEIGHT = 1e-6 # Giá trị nhỏ để tránh chia cho 0 trong weighted KNN
+USE_KNN_INDEX = True  # Dựng KD-tree (fingerprint_index.py) thay cho tìm kiếm vét cạn mỗi lần quét
+KNN_INDEX_TYPE = "kdtree" # "kdtree" (chính xác) | "ivf" (xấp xỉ, cho bản đồ nhiều AP, xem IVF_NPROBE)
+KDTREE_LEAF_SIZE = 32 # Số điểm tối đa trong một lá của KD-tree
+KNN_BATCH_MAX_BYTES = 64 * 1024 * 1024 # Giới hạn ma trận khoảng cách tạm của predict_locations_knn_batch
+
+# --- Tìm kiếm xấp xỉ IVF (fingerprint_index.FingerprintIVFIndex), cho bản đồ nhiều AP ---
+IVF_NUM_LISTS = None              # Số cụm; None = khoảng 4 * sqrt(số fingerprint)
+IVF_NPROBE = 8                    # Số cụm duyệt mỗi truy vấn: lớn hơn = độ phủ cao hơn, chậm hơn
+IVF_KMEANS_ITERATIONS = 10
+IVF_TRAIN_POINTS_PER_LIST = 64    # Số điểm mẫu mỗi cụm dùng để huấn luyện k-means
+IVF_ASSIGN_CHUNK_ROWS = 8192
+
+# --- Bám vết KNN theo chuyển động (localization_algorithms.KNNTracker) ---
+USE_MOTION_GATED_TRACKING = True
+TRACKING_RADIUS_M = 4.0              # Chỉ xét fingerprint trong bán kính này quanh ước tính trước (m)
+TRACKING_MIN_RADIUS_CELLS = 3        # Bán kính tối thiểu (ô): vài ô cho độ trễ của ước tính trước cộng một bước đi
+TRACKING_FALLBACK_DISTANCE_DB = 6.0  # Láng giềng gần nhất xa hơn ngưỡng này (dB) -> tìm toàn bản đồ
+TRACKING_BUCKET_SIZE_CELLS = 8       # Kích thước mỗi xô của chỉ mục không gian (ô lưới)
+
+# --- Bộ lọc hạt (particle_filter.py) ---
+USE_PARTICLE_FILTER = False          # True: dùng bộ lọc hạt thay cho KNNTracker khi xe di chuyển
+PARTICLE_COUNT = 2000
+PARTICLE_MOTION_STD_M = 3.0          # Độ lệch chuẩn bước di chuyển của hạt giữa hai lần quét (m), xe đi tới một ô mỗi lần
+PARTICLE_RSSI_SIGMA_DB = 0.5         # Độ lệch chuẩn của likelihood RSSI (dB), cỡ nhiễu fingerprint + quan sát
+PARTICLE_RESAMPLE_THRESHOLD = 0.5    # Lấy mẫu lại khi số hạt hiệu dụng < ngưỡng * PARTICLE_COUNT
+PARTICLE_RANDOM_FRACTION = 0.01      # Tỉ lệ hạt rải lại ngẫu nhiên sau mỗi lần lấy mẫu lại
+PARTICLE_SEED = None
+
+# --- Bộ đệm kết quả định vị (localization_algorithms.LocalizationResultCache) ---
+USE_RESULT_CACHE = True
+RESULT_CACHE_MAX_ENTRIES = 4096      # Số lần quét (đã lượng tử) tối đa được ghi nhớ
+RESULT_CACHE_QUANTIZATION_DB = 0.5   # Bước làm tròn RSSI (dB) khi tạo khóa; lớn hơn -> nhiều hit hơn, kém chính xác hơn
+
+# --- Trilateration theo mô hình (trilateration.py), dùng khi chưa có fingerprint ---
+TRILATERATION_ITERATIONS = 20       # Số bước Levenberg-Marquardt
+TRILATERATION_DAMPING = 1e-2        # Hệ số tắt dần Levenberg-Marquardt ban đầu (tỉ lệ với đường chéo)
+TRILATERATION_OBSTRUCTED_WEIGHT = 0.0 # Trọng số phần dư khi ở gần AP hơn khoảng cách đảo từ RSSI (có thể do vật cản)
+
+# --- Dịch vụ định vị (localization_service.py) ---
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_MAX_BATCH_SIZE = 256          # Số lần quét tối đa trong một lô
+SERVICE_MAX_BATCH_WAIT_MS = 2.0       # Thời gian chờ gom lô tối đa (ms)
+SERVICE_P99_LATENCY_BUDGET_MS = 20.0  # Ngân sách độ trễ p99 (ms); thời gian chờ gom lô được rút ngắn để giữ mức này
+SERVICE_DROP_STALE_SCANS = True       # Quá tải: trả lỗi cho lần quét đã chờ quá ngân sách thay vì để hàng đợi dồn lên
+SERVICE_STATS_WINDOW = 10000          # Số phép đo gần nhất dùng cho thống kê độ trễ
+
+# --- Bảng quãng đường giữa các mặt hàng (item_distances.py) ---
+ITEM_DISTANCE_BFS_BATCH_SIZE = 4      # Số điểm tiếp cận được BFS cùng lúc (lớn hơn -> ít vòng lặp Python hơn, tốn bộ nhớ hơn)
+ITEM_DISTANCE_STORE_PREDECESSORS = False # Giữ mảng hướng BFS (1 byte/ô cho mỗi điểm) để dựng đường đi không cần A*
+
+# --- Dẫn đường theo flow field (flow_fields.py) ---
+USE_FLOW_FIELD_ROUTING = False        # True: dẫn đường theo trường khoảng cách-tới-đích (nhiều xe cùng tới một mặt hàng)
+FLOW_FIELD_CACHE_MAX_MB = 64          # Tổng bộ nhớ tối đa của các trường được giữ trong bộ đệm LRU
+
+# --- Tìm đường phân cấp HPA* (hierarchical_pathfinding.py), cho bản đồ độ phân giải cao ---
+USE_HIERARCHICAL_PATHFINDING = False  # True: dẫn đường bằng HPA* (nhanh hơn trên lưới lớn, đường gần tối ưu)
+HPA_CLUSTER_SIZE = 32                 # Cạnh mỗi cụm (ô)
+HPA_ENTRANCE_SPACING = 8              # Khoảng cách tối đa (ô) giữa các lối vào trên một đoạn biên đi được; nhỏ hơn -> đường gần tối ưu hơn, đồ thị lớn hơn
 
 # --- Màu sắc cho trực quan hóa ---
 COLOR_PATH_ON_MAP = 'white'
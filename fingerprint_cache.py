@@ -0,0 +1,116 @@
+# fingerprint_cache.py
+import hashlib
+import json
+import os
+import numpy as np
+import config
+import rssi_simulation
+
+# Tăng số này mỗi khi công thức tạo fingerprint thay đổi để vô hiệu hóa mọi bộ đệm cũ
+FINGERPRINT_FORMAT_VERSION = 3
+
+def radio_model_params():
+    """Trả về dict các tham số mô hình vô tuyến hiện tại (đọc trực tiếp từ config)."""
+    return {key: getattr(config, key) for key in rssi_simulation.RADIO_MODEL_CONFIG_KEYS}
+
+def compute_fingerprint_cache_key(grid_map, access_points, extra=None):
+    """
+    Băm grid_map, danh sách AP và các tham số mô hình vô tuyến thành một khóa hex.
+    Bất kỳ thay đổi nào của bố cục, vị trí AP hay hằng số trong config đều cho ra khóa khác.
+    extra: dict tùy chọn (ví dụ seed) được đưa thêm vào khóa.
+    """
+    grid = np.ascontiguousarray(grid_map)
+    hasher = hashlib.sha256()
+    hasher.update(f"v{FINGERPRINT_FORMAT_VERSION}".encode())
+    hasher.update(f"{grid.dtype.str}{grid.shape}".encode())
+    hasher.update(grid.tobytes())
+    hasher.update(np.asarray(access_points, dtype=np.int64).reshape(-1, 2).tobytes())
+    params = radio_model_params()
+    if extra:
+        params.update({f"extra.{k}": v for k, v in extra.items()})
+    hasher.update(json.dumps(params, sort_keys=True, default=repr).encode())
+    return hasher.hexdigest()
+
+def _cache_paths(cache_dir, key):
+    base = os.path.join(cache_dir, f"fingerprints_{key[:24]}")
+    return base + ".npy", base + ".json"
+
+def _load_if_valid(npy_path, meta_path, key, expected_shape):
+    """Đọc bộ đệm nếu siêu dữ liệu khớp với khóa và kích thước mong đợi, ngược lại trả về None."""
+    if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("key") != key:
+            print(f"Bộ đệm fingerprint {npy_path} không khớp khóa, bỏ qua.")
+            return None
+        fingerprints = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError) as e:
+        print(f"Không đọc được bộ đệm fingerprint {npy_path}: {e}")
+        return None
+    if fingerprints.shape != tuple(expected_shape) or fingerprints.dtype != np.float32:
+        print(f"Bộ đệm fingerprint {npy_path} có kích thước/kiểu {fingerprints.shape}/{fingerprints.dtype} "
+              f"không khớp {tuple(expected_shape)}/float32, bỏ qua.")
+        return None
+    return fingerprints
+
+def _save(npy_path, meta_path, key, fingerprints):
+    """Ghi nguyên tử: ghi ra file tạm rồi os.replace, để tiến trình khác không đọc phải file dở dang."""
+    os.makedirs(os.path.dirname(npy_path) or ".", exist_ok=True)
+    tmp_npy = f"{npy_path}.{os.getpid()}.tmp"
+    tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_npy, "wb") as f:
+        np.save(f, np.asarray(fingerprints, dtype=np.float32))
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump({
+            "key": key,
+            "shape": list(fingerprints.shape),
+            "format_version": FINGERPRINT_FORMAT_VERSION,
+            "radio_model": radio_model_params(),
+        }, f, ensure_ascii=False, indent=2, default=repr)
+    # Ghi .npy trước, .json sau: .json chỉ xuất hiện khi .npy đã hoàn chỉnh
+    os.replace(tmp_npy, npy_path)
+    os.replace(tmp_meta, meta_path)
+
+def cached_fingerprints(grid_map, access_points, generate_fn, cache_dir=None, extra_key=None):
+    """
+    Trả về tensor fingerprint (hàng, cột, AP) từ bộ đệm trên đĩa nếu có, ngược lại gọi
+    generate_fn() để tạo, lưu lại dưới dạng .npy và trả về kết quả vừa tạo.
+    Khi trúng bộ đệm, mảng được mở bằng np.load(mmap_mode='r') (chỉ đọc).
+    cache_dir: thư mục bộ đệm, mặc định config.FINGERPRINT_CACHE_DIR.
+    """
+    cache_dir = cache_dir or config.FINGERPRINT_CACHE_DIR
+    key = compute_fingerprint_cache_key(grid_map, access_points, extra_key)
+    npy_path, meta_path = _cache_paths(cache_dir, key)
+    expected_shape = (grid_map.shape[0], grid_map.shape[1], len(access_points))
+
+    fingerprints = _load_if_valid(npy_path, meta_path, key, expected_shape)
+    if fingerprints is not None:
+        print(f"Đã nạp fingerprints từ bộ đệm: {npy_path}")
+        return fingerprints
+
+    fingerprints = generate_fn()
+    if not isinstance(fingerprints, np.ndarray):
+        raise TypeError(f"generate_fn phải trả về np.ndarray, nhận được {type(fingerprints)}")
+    try:
+        _save(npy_path, meta_path, key, fingerprints)
+        print(f"Đã lưu fingerprints vào bộ đệm: {npy_path}")
+    except OSError as e:
+        print(f"Cảnh báo: Không ghi được bộ đệm fingerprint ({e}).")
+    return fingerprints
+
+def load_or_generate_fingerprints(supermarket_map_obj, cache_dir=None, seed=None, workers=None):
+    """
+    Như rssi_simulation.generate_rssi_fingerprints_from_map nhưng đi qua bộ đệm trên đĩa.
+    """
+    return cached_fingerprints(
+        supermarket_map_obj.grid_map,
+        supermarket_map_obj.access_points,
+        lambda: rssi_simulation.generate_rssi_fingerprints_from_map(
+            supermarket_map_obj, seed=seed, workers=workers
+        ),
+        cache_dir=cache_dir,
+        # Chế độ song song dùng chuỗi nhiễu khác (theo từng phần), không dùng chung bộ đệm
+        extra_key={"seed": seed, "tiled_noise": workers is not None},
+    )
@@ -0,0 +1,230 @@
+# fingerprint_index.py
+# Chỉ mục KD-tree trên không gian vector RSSI (mỗi điểm là một ô có fingerprint).
+# Xây một lần cho mỗi bản đồ vô tuyến; truy vấn K láng giềng duyệt cây theo thứ tự
+# "gần nhất trước" và cắt bỏ các nút có hộp bao xa hơn láng giềng thứ K hiện tại.
+# Khoảng cách ở lá được tính bằng đúng công thức của FingerprintMatrix.squared_distances
+# nên kết quả trùng với tìm kiếm vét cạn (sai khác chỉ có thể ở các điểm cách đều nhau).
+import heapq
+import math
+import numpy as np
+import config
+from fingerprint_storage import FingerprintMatrix
+
+class FingerprintKDTree:
+    """
+    KD-tree lưu dạng mảng: nút i bao các điểm perm[node_start[i]:node_end[i]],
+    hộp bao (node_lo[i], node_hi[i]); nút trong có hai con node_left[i], node_right[i] (-1 ở lá).
+    Các điểm được sắp lại theo thứ tự lá (self.points = values[perm]) để mỗi lá là một lát cắt
+    liên tục; chỉ số trả về và cells_r/cells_c theo thứ tự gốc của FingerprintMatrix.
+    """
+
+    def __init__(self, fingerprints_data, leaf_size=None):
+        matrix = fingerprints_data if hasattr(fingerprints_data, "squared_distances") \
+            else FingerprintMatrix(fingerprints_data)
+        values = matrix.values
+        if values.dtype != np.float32:
+            # Dạng gọn (int8/float16) được giải nén để xây cây
+            values = np.asarray(matrix._decode(values), dtype=np.float32)
+        self.shape = matrix.shape
+        self.leaf_size = max(1, int(config.KDTREE_LEAF_SIZE if leaf_size is None else leaf_size))
+
+        num_points = values.shape[0]
+        perm = np.arange(num_points)
+        starts, ends, lefts, rights, los, his = [], [], [], [], [], []
+        stack = [(0, num_points, -1, False)] # (start, end, nút cha, là con phải)
+        while stack:
+            start, end, parent, is_right = stack.pop()
+            node = len(starts)
+            subset = values[perm[start:end]]
+            lo = subset.min(axis=0) if end > start else np.zeros(values.shape[1], dtype=np.float32)
+            hi = subset.max(axis=0) if end > start else np.zeros(values.shape[1], dtype=np.float32)
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            los.append(lo)
+            his.append(hi)
+            if parent >= 0:
+                (rights if is_right else lefts)[parent] = node
+            if end - start <= self.leaf_size:
+                continue
+            split_dim = int(np.argmax(hi - lo))
+            if hi[split_dim] == lo[split_dim]:
+                continue # Mọi điểm trùng nhau: giữ làm lá
+            mid = (start + end) // 2
+            order = np.argpartition(subset[:, split_dim], mid - start)
+            perm[start:end] = perm[start:end][order]
+            stack.append((mid, end, node, True))
+            stack.append((start, mid, node, False))
+
+        self.node_start = np.array(starts, dtype=np.int64)
+        self.node_end = np.array(ends, dtype=np.int64)
+        self.node_left = np.array(lefts, dtype=np.int64)
+        self.node_right = np.array(rights, dtype=np.int64)
+        self.node_lo = np.array(los, dtype=np.float64).reshape(len(starts), values.shape[1])
+        self.node_hi = np.array(his, dtype=np.float64).reshape(len(starts), values.shape[1])
+        self.perm = perm
+        self.points = np.ascontiguousarray(values[perm])
+        self.cells_r, self.cells_c = matrix.cell_positions() # Theo thứ tự gốc
+
+    @property
+    def num_aps(self):
+        return self.shape[2]
+
+    @property
+    def num_points(self):
+        return self.points.shape[0]
+
+    def _box_distance_sq(self, node, query):
+        gap = np.maximum(self.node_lo[node] - query, 0.0) + np.maximum(query - self.node_hi[node], 0.0)
+        return float(gap @ gap)
+
+    def query(self, observed_rssi, k):
+        """
+        K láng giềng gần nhất của vector quan sát.
+        Trả về (chỉ số điểm theo thứ tự của FingerprintMatrix, bình phương khoảng cách float32),
+        sắp xếp tăng dần theo khoảng cách (hòa thì theo chỉ số).
+        """
+        query = np.asarray(observed_rssi, dtype=np.float32)
+        if query.shape[0] != self.num_aps:
+            raise ValueError("Các vector RSSI phải có cùng độ dài")
+        k = min(int(k), self.num_points)
+        best_idx = np.empty(0, dtype=np.int64) # Chỉ số trong self.points
+        best_dist_sq = np.empty(0, dtype=np.float32)
+        if k <= 0:
+            return self.perm[best_idx], best_dist_sq
+
+        query64 = query.astype(np.float64)
+        worst = math.inf
+        heap = [(self._box_distance_sq(0, query64), 0)]
+        while heap:
+            box_dist_sq, node = heapq.heappop(heap)
+            # Biên dưới của hộp (float64) so với khoảng cách float32: chừa một khoảng nhỏ do làm tròn
+            if box_dist_sq > worst * (1 + 1e-6) + 1e-6:
+                break
+            left = self.node_left[node]
+            if left >= 0:
+                right = self.node_right[node]
+                heapq.heappush(heap, (self._box_distance_sq(left, query64), left))
+                heapq.heappush(heap, (self._box_distance_sq(right, query64), right))
+                continue
+
+            start, end = self.node_start[node], self.node_end[node]
+            diff = self.points[start:end] - query
+            dist_sq = np.einsum('ij,ij->i', diff, diff)
+            cand_idx = np.concatenate([best_idx, np.arange(start, end)])
+            cand_dist_sq = np.concatenate([best_dist_sq, dist_sq])
+            keep = np.lexsort((self.perm[cand_idx], cand_dist_sq))[:k]
+            best_idx, best_dist_sq = cand_idx[keep], cand_dist_sq[keep]
+            if best_idx.shape[0] == k:
+                worst = float(best_dist_sq[-1])
+        return self.perm[best_idx], best_dist_sq
+
+    def query_neighbours(self, observed_rssi, k):
+        """Như query nhưng trả về list ((hàng, cột), khoảng cách) giống predict_location_knn."""
+        point_idx, dist_sq = self.query(observed_rssi, k)
+        return [((int(self.cells_r[i]), int(self.cells_c[i])), math.sqrt(float(d)))
+                for i, d in zip(point_idx, dist_sq)]
+
+def _squared_distances_to(points, centers):
+    """Bình phương khoảng cách (len(points), len(centers)) theo khai triển ||a||^2 + ||b||^2 - 2ab."""
+    dist_sq = np.einsum('ij,ij->i', points, points)[:, None] - 2 * (points @ centers.T)
+    dist_sq += np.einsum('ij,ij->i', centers, centers)[None, :]
+    return np.maximum(dist_sq, 0.0)
+
+class FingerprintIVFIndex:
+    """
+    Chỉ mục xấp xỉ dạng inverted file (IVF) cho bản đồ nhiều AP (30-100 AP/beacon), nơi KD-tree
+    mất hiệu quả: các vector được chia thành num_lists cụm bằng k-means; mỗi truy vấn chỉ
+    duyệt nprobe cụm có tâm gần nhất rồi tính khoảng cách chính xác trong các cụm đó.
+    nprobe là núm chỉnh độ phủ/tốc độ: nprobe = num_lists cho kết quả giống tìm kiếm vét cạn.
+    """
+
+    def __init__(self, fingerprints_data, num_lists=None, nprobe=None, seed=0):
+        matrix = fingerprints_data if hasattr(fingerprints_data, "squared_distances") \
+            else FingerprintMatrix(fingerprints_data)
+        values = matrix.values
+        if values.dtype != np.float32:
+            values = np.asarray(matrix._decode(values), dtype=np.float32)
+        self.shape = matrix.shape
+        self.cells_r, self.cells_c = matrix.cell_positions() # Theo thứ tự gốc
+        num_points = values.shape[0]
+        if num_lists is None:
+            num_lists = config.IVF_NUM_LISTS or int(round(4 * math.sqrt(num_points)))
+        self.num_lists = max(1, min(int(num_lists), num_points)) if num_points else 0
+        self.nprobe = config.IVF_NPROBE if nprobe is None else nprobe
+
+        self.centroids = self._train_kmeans(values, np.random.default_rng(seed))
+        # Gán từng điểm vào cụm gần nhất (theo khối để giới hạn bộ nhớ)
+        assignment = np.empty(num_points, dtype=np.int64)
+        centroids32 = self.centroids.astype(np.float32)
+        for start in range(0, num_points, config.IVF_ASSIGN_CHUNK_ROWS):
+            chunk = values[start:start + config.IVF_ASSIGN_CHUNK_ROWS]
+            assignment[start:start + config.IVF_ASSIGN_CHUNK_ROWS] = np.argmin(
+                _squared_distances_to(chunk, centroids32), axis=1)
+        # Lưu các điểm theo cụm liền nhau (dạng CSR): cụm l là points[list_starts[l]:list_starts[l + 1]]
+        self.point_ids = np.argsort(assignment, kind='stable')
+        self.points = np.ascontiguousarray(values[self.point_ids])
+        self.list_starts = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=self.num_lists))])
+        self.centroids32 = centroids32
+
+    def _train_kmeans(self, values, rng):
+        """K-means (Lloyd) trên một mẫu ngẫu nhiên của các vector; trả về tâm float64 (num_lists, AP)."""
+        if self.num_lists == 0:
+            return np.empty((0, values.shape[1]))
+        sample_size = min(values.shape[0], max(config.IVF_TRAIN_POINTS_PER_LIST * self.num_lists, self.num_lists))
+        sample = values[rng.choice(values.shape[0], sample_size, replace=False)] # float32: nhân ma trận nhanh gấp đôi
+        centroids = sample[rng.choice(sample_size, self.num_lists, replace=False)].astype(np.float64)
+        for _ in range(config.IVF_KMEANS_ITERATIONS):
+            labels = np.argmin(_squared_distances_to(sample, centroids.astype(np.float32)), axis=1)
+            counts = np.bincount(labels, minlength=self.num_lists)
+            sums = np.column_stack([np.bincount(labels, weights=sample[:, j], minlength=self.num_lists)
+                                    for j in range(sample.shape[1])])
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+            # Cụm rỗng lấy lại một điểm mẫu ngẫu nhiên làm tâm
+            num_empty = int((~nonempty).sum())
+            if num_empty:
+                centroids[~nonempty] = sample[rng.choice(sample_size, num_empty, replace=False)]
+        return centroids
+
+    @property
+    def num_aps(self):
+        return self.shape[2]
+
+    @property
+    def num_points(self):
+        return self.points.shape[0]
+
+    def query(self, observed_rssi, k, nprobe=None):
+        """
+        K láng giềng (xấp xỉ) của vector quan sát trong nprobe cụm gần nhất.
+        Trả về (chỉ số điểm theo thứ tự của FingerprintMatrix, bình phương khoảng cách float32).
+        """
+        query = np.asarray(observed_rssi, dtype=np.float32)
+        if query.shape[0] != self.num_aps:
+            raise ValueError("Các vector RSSI phải có cùng độ dài")
+        nprobe = max(1, min(self.nprobe if nprobe is None else nprobe, self.num_lists))
+        if self.num_points == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        centroid_diff = self.centroids32 - query
+        centroid_dist_sq = np.einsum('ij,ij->i', centroid_diff, centroid_diff)
+        probe = np.argpartition(centroid_dist_sq, nprobe - 1)[:nprobe] if nprobe < self.num_lists \
+            else np.arange(self.num_lists)
+        ranges = [(self.list_starts[l], self.list_starts[l + 1]) for l in probe]
+        candidates = np.concatenate([np.arange(s, e) for s, e in ranges])
+        diff = self.points[candidates] - query
+        dist_sq = np.einsum('ij,ij->i', diff, diff)
+        actual_k = min(int(k), candidates.shape[0])
+        nearest = np.argpartition(dist_sq, actual_k - 1)[:actual_k] if actual_k < candidates.shape[0] \
+            else np.arange(candidates.shape[0])
+        point_ids = self.point_ids[candidates[nearest]]
+        order = np.lexsort((point_ids, dist_sq[nearest]))
+        return point_ids[order], dist_sq[nearest][order]
+
+    def query_neighbours(self, observed_rssi, k):
+        """Như query nhưng trả về list ((hàng, cột), khoảng cách) giống predict_location_knn."""
+        point_idx, dist_sq = self.query(observed_rssi, k)
+        return [((int(self.cells_r[i]), int(self.cells_c[i])), math.sqrt(float(d)))
+                for i, d in zip(point_idx, dist_sq)]
@@ -0,0 +1,221 @@
+# fingerprint_storage.py
+# Định dạng lưu trữ gọn cho tensor fingerprint (hàng, cột, AP).
+# RSSI luôn nằm trong [MIN_RSSI_THRESHOLD, P_TX_MAX_RSSI] (chỉ ~65 dB), nên có thể lượng tử hóa:
+#   "int8":    mã int8 = round((rssi - MIN_RSSI_THRESHOLD) / bước) - 128   (1 byte / giá trị)
+#   "float16": giá trị float16                                              (2 byte / giá trị)
+# Cả hai dùng một bitmask (np.packbits) đánh dấu ô có fingerprint thay cho NaN.
+import numpy as np
+import config
+
+STORAGE_MODES = ("float32", "int8", "float16")
+_INT8_CODE_OFFSET = 128 # Mã của MIN_RSSI_THRESHOLD là -128
+
+# Số hàng fingerprint xử lý mỗi khối khi tính khoảng cách, để mảng tạm nằm gọn trong cache
+DISTANCE_CHUNK_ROWS = 8192
+
+class FingerprintMatrix:
+    """
+    Tensor fingerprint float32 trải phẳng một lần: các ô hợp lệ (không NaN) thành ma trận
+    liên tục (N, AP) cùng ánh xạ chỉ số -> (hàng, cột) qua cells_r, cells_c.
+    Cùng giao diện với CompactFingerprints để KNN dùng chung một đường tính.
+    """
+    mode = "float32"
+
+    def __init__(self, fingerprints_array):
+        fingerprints_array = np.asarray(fingerprints_array)
+        self.shape = fingerprints_array.shape
+        valid = ~np.any(np.isnan(fingerprints_array), axis=2) if self.shape[2] else \
+            np.zeros(self.shape[:2], dtype=bool)
+        self.cells_r, self.cells_c = np.nonzero(valid)
+        self.values = np.ascontiguousarray(fingerprints_array[self.cells_r, self.cells_c, :], dtype=np.float32)
+        self._values_float64 = None
+        self._squared_norms = None
+
+    @property
+    def num_aps(self):
+        return self.shape[2]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.cells_r.nbytes + self.cells_c.nbytes
+
+    def valid_mask(self):
+        """Mảng bool (hàng, cột): ô nào có fingerprint."""
+        mask = np.zeros(self.shape[:2], dtype=bool)
+        mask[self.cells_r, self.cells_c] = True
+        return mask
+
+    def cell_positions(self):
+        """(cells_r, cells_c) của các điểm theo thứ tự hàng của values."""
+        return self.cells_r, self.cells_c
+
+    def to_float32(self):
+        """Dựng lại tensor float32 (hàng, cột, AP) với NaN ở ô không hợp lệ."""
+        fingerprints_array = np.full(self.shape, np.nan, dtype=np.float32)
+        fingerprints_array[self.cells_r, self.cells_c, :] = self.values
+        return fingerprints_array
+
+    def squared_distances(self, observed_rssi):
+        """
+        Bình phương khoảng cách Euclide (dB^2, float32) từ vector quan sát tới mọi ô hợp lệ,
+        theo thứ tự của (self.cells_r, self.cells_c), tính theo từng khối.
+        """
+        observed = np.asarray(observed_rssi, dtype=np.float32)
+        num_points = self.values.shape[0]
+        dist_sq = np.empty(num_points, dtype=np.float32)
+        for start in range(0, num_points, DISTANCE_CHUNK_ROWS):
+            chunk = self.values[start:start + DISTANCE_CHUNK_ROWS] - observed
+            dist_sq[start:start + DISTANCE_CHUNK_ROWS] = np.einsum('ij,ij->i', chunk, chunk)
+        return dist_sq
+
+    def decode_rows(self, indices):
+        """Giá trị float32 (len(indices), AP) của các điểm có chỉ số `indices`."""
+        return self.values[indices]
+
+    def squared_norms(self):
+        """
+        Bình phương chuẩn float64 (N,) từng hàng, cho khai triển ||a||^2 + ||b||^2 - 2ab khi tính
+        khoảng cách theo lô; tính một lần rồi giữ lại (cùng bản float64 của ma trận).
+        """
+        if self._squared_norms is None:
+            self._values_float64 = np.asarray(self.values, dtype=np.float64)
+            self._squared_norms = np.einsum('ij,ij->i', self._values_float64, self._values_float64)
+        return self._squared_norms
+
+    def dot_products(self, queries):
+        """Tích vô hướng float64 (M, N) giữa các vector truy vấn (M, AP) và mọi hàng."""
+        self.squared_norms()
+        return queries @ self._values_float64.T
+
+class CompactFingerprints:
+    """
+    Tensor fingerprint đã lượng tử hóa. Các ô hợp lệ cũng được trải phẳng thành ma trận
+    liên tục (N, AP) để tính khoảng cách trực tiếp trên dữ liệu gọn (không giãn ra float64).
+    Vị trí các điểm không được lưu riêng mà suy ra từ valid_bits (theo thứ tự hàng -> cột),
+    nên nbytes là toàn bộ bộ nhớ của dạng gọn.
+    """
+
+    def __init__(self, fingerprints_array, mode="int8", step_db=None):
+        if mode not in ("int8", "float16"):
+            raise ValueError(f"Chế độ lưu trữ gọn không hợp lệ: '{mode}'. Chọn 'int8' hoặc 'float16'.")
+        fingerprints_array = np.asarray(fingerprints_array)
+        self.mode = mode
+        self.shape = fingerprints_array.shape
+        self.step_db = float(config.FINGERPRINT_INT8_STEP_DB if step_db is None else step_db)
+        self.min_rssi = float(config.MIN_RSSI_THRESHOLD)
+
+        valid = ~np.any(np.isnan(fingerprints_array), axis=2) if self.shape[2] else \
+            np.zeros(self.shape[:2], dtype=bool)
+        self.valid_bits = np.packbits(valid, axis=None) # 1 bit / ô
+        values = fingerprints_array[valid]
+
+        if mode == "int8":
+            max_code = 127
+            if (config.P_TX_MAX_RSSI - self.min_rssi) / self.step_db - _INT8_CODE_OFFSET > max_code:
+                raise ValueError(f"Bước lượng tử {self.step_db} dB quá nhỏ cho dải RSSI "
+                                 f"[{self.min_rssi}, {config.P_TX_MAX_RSSI}] với int8.")
+            codes = np.rint((values - self.min_rssi) / self.step_db) - _INT8_CODE_OFFSET
+            self.values = np.clip(codes, -_INT8_CODE_OFFSET, max_code).astype(np.int8)
+        else:
+            self.values = np.ascontiguousarray(values, dtype=np.float16)
+        self._squared_norms = None
+
+    @property
+    def num_aps(self):
+        return self.shape[2]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.valid_bits.nbytes
+
+    def valid_mask(self):
+        """Mảng bool (hàng, cột): ô nào có fingerprint."""
+        num_cells = self.shape[0] * self.shape[1]
+        return np.unpackbits(self.valid_bits, count=num_cells).astype(bool).reshape(self.shape[:2])
+
+    def cell_positions(self):
+        """(cells_r, cells_c) của các điểm theo thứ tự hàng của values, giải ra từ valid_bits."""
+        return np.nonzero(self.valid_mask())
+
+    @property
+    def cells_r(self):
+        return self.cell_positions()[0]
+
+    @property
+    def cells_c(self):
+        return self.cell_positions()[1]
+
+    def _decode(self, values):
+        if self.mode == "int8":
+            return (values.astype(np.float32) + _INT8_CODE_OFFSET) * self.step_db + self.min_rssi
+        return values.astype(np.float32)
+
+    def to_float32(self):
+        """Giải nén về tensor float32 (hàng, cột, AP) với NaN ở ô không hợp lệ."""
+        fingerprints_array = np.full(self.shape, np.nan, dtype=np.float32)
+        fingerprints_array[self.valid_mask()] = self._decode(self.values)
+        return fingerprints_array
+
+    def squared_distances(self, observed_rssi):
+        """
+        Bình phương khoảng cách Euclide (dB^2, float32) từ vector quan sát tới mọi ô hợp lệ,
+        theo thứ tự của (self.cells_r, self.cells_c).
+        Chế độ int8: quan sát được lượng tử hóa cùng bước, hiệu và tổng tính bằng số nguyên
+        (int16/int32); chế độ float16: tính bằng float32 theo từng khối.
+        """
+        observed = np.asarray(observed_rssi, dtype=np.float32)
+        num_points = self.values.shape[0]
+        dist_sq = np.empty(num_points, dtype=np.float32)
+        if self.mode == "int8":
+            observed_codes = np.clip(np.rint((observed - self.min_rssi) / self.step_db) - _INT8_CODE_OFFSET,
+                                     -_INT8_CODE_OFFSET, 127).astype(np.int16)
+            scale = np.float32(self.step_db ** 2)
+            for start in range(0, num_points, DISTANCE_CHUNK_ROWS):
+                chunk = self.values[start:start + DISTANCE_CHUNK_ROWS].astype(np.int16) - observed_codes
+                dist_sq[start:start + DISTANCE_CHUNK_ROWS] = np.einsum(
+                    'ij,ij->i', chunk, chunk, dtype=np.int32) * scale
+        else:
+            for start in range(0, num_points, DISTANCE_CHUNK_ROWS):
+                chunk = self.values[start:start + DISTANCE_CHUNK_ROWS].astype(np.float32) - observed
+                dist_sq[start:start + DISTANCE_CHUNK_ROWS] = np.einsum('ij,ij->i', chunk, chunk)
+        return dist_sq
+
+    def decode_rows(self, indices):
+        """Giá trị float32 (len(indices), AP) của các điểm có chỉ số `indices` (giải nén)."""
+        return self._decode(self.values[indices])
+
+    def squared_norms(self):
+        """
+        Bình phương chuẩn float64 (N,) từng hàng (đã giải nén), tính một lần theo từng khối
+        rồi giữ lại; chỉ N số, không giữ bản giải nén của cả ma trận.
+        """
+        if self._squared_norms is None:
+            norms_sq = np.empty(self.values.shape[0], dtype=np.float64)
+            for start in range(0, self.values.shape[0], DISTANCE_CHUNK_ROWS):
+                chunk = self._decode(self.values[start:start + DISTANCE_CHUNK_ROWS]).astype(np.float64)
+                norms_sq[start:start + DISTANCE_CHUNK_ROWS] = np.einsum('ij,ij->i', chunk, chunk)
+            self._squared_norms = norms_sq
+        return self._squared_norms
+
+    def dot_products(self, queries):
+        """
+        Tích vô hướng float64 (M, N) giữa các vector truy vấn (M, AP) và mọi hàng. Chỉ giải nén
+        từng khối DISTANCE_CHUNK_ROWS hàng, nên bộ nhớ tạm không phụ thuộc N.
+        """
+        products = np.empty((queries.shape[0], self.values.shape[0]), dtype=np.float64)
+        for start in range(0, self.values.shape[0], DISTANCE_CHUNK_ROWS):
+            chunk = self._decode(self.values[start:start + DISTANCE_CHUNK_ROWS]).astype(np.float64)
+            products[:, start:start + DISTANCE_CHUNK_ROWS] = queries @ chunk.T
+        return products
+
+def to_storage_mode(fingerprints_array, mode=None):
+    """
+    Chuyển tensor fingerprint float32 sang định dạng lưu trữ config.FINGERPRINT_STORAGE_MODE
+    (hoặc `mode`). "float32" trả về nguyên mảng đầu vào.
+    """
+    mode = config.FINGERPRINT_STORAGE_MODE if mode is None else mode
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Chế độ lưu trữ không hợp lệ: '{mode}'. Chọn một trong {STORAGE_MODES}.")
+    if mode == "float32":
+        return fingerprints_array
+    return CompactFingerprints(fingerprints_array, mode)
@@ -0,0 +1,128 @@
+# flow_fields.py
+# Dẫn đường theo trường dòng chảy (flow field): khi nhiều xe đẩy cùng được dẫn tới một mặt hàng
+# (ví dụ lúc khuyến mãi), thay vì giải A* cho từng xe, một BFS ngược từ điểm đích cho trường
+# khoảng cách-tới-đích trên toàn cửa hàng; đường đi của mọi xe chỉ là đi xuống dần theo trường đó.
+# Các trường được giữ trong bộ đệm LRU giới hạn theo bộ nhớ, khóa theo (điểm đích, phiên bản bố cục).
+import collections
+import numpy as np
+import config
+import grid_pathfinding
+
+class FlowField:
+    """
+    Trường khoảng cách (số bước) từ mọi ô tới target_rc trên lưới phẳng có viền của
+    grid_pathfinding.GridAStar; -1 ở vật cản và ô không tới được.
+    Kiểu số nguyên nhỏ nhất chứa được mọi khoảng cách (int16 nếu đủ) để tiết kiệm bộ nhớ.
+    """
+
+    def __init__(self, grid_astar, target_rc, layout_version=None):
+        self.target_rc = (int(target_rc[0]), int(target_rc[1]))
+        self.layout_version = layout_version
+        self.num_rows, self.num_cols, self.stride = grid_astar.num_rows, grid_astar.num_cols, grid_astar.stride
+        distances, _ = grid_pathfinding.bfs_distance_fields(grid_astar.walkable_flat, grid_astar.stride,
+                                                            [grid_astar.node_id(self.target_rc)])
+        distances = distances[0]
+        if distances.max() < np.iinfo(np.int16).max:
+            distances = distances.astype(np.int16)
+        self.distances = distances
+        self._offsets = grid_pathfinding.neighbour_offsets(self.stride).tolist()
+
+    @property
+    def nbytes(self):
+        return self.distances.nbytes
+
+    def _node_id(self, node_rc):
+        return (node_rc[0] + 1) * self.stride + node_rc[1] + 1
+
+    def distance_from(self, start_rc):
+        """Số bước từ start_rc tới đích, hoặc None nếu không tới được (hoặc ngoài lưới)."""
+        if not (0 <= start_rc[0] < self.num_rows and 0 <= start_rc[1] < self.num_cols):
+            return None
+        distance = self.distances.item(self._node_id(start_rc))
+        return None if distance < 0 else distance
+
+    def route_from(self, start_rc):
+        """
+        Đường đi ngắn nhất (danh sách (hàng, cột) từ start_rc tới đích, gồm cả hai đầu) bằng cách
+        mỗi bước đi sang láng giềng có khoảng cách nhỏ hơn 1; None nếu không tới được.
+        """
+        distance = self.distance_from(start_rc)
+        if distance is None:
+            return None
+        distances, offsets, stride = self.distances, self._offsets, self.stride
+        node = self._node_id(start_rc)
+        path = [(int(start_rc[0]), int(start_rc[1]))]
+        while distance > 0:
+            distance -= 1
+            for offset in offsets:
+                if distances.item(node + offset) == distance:
+                    node += offset
+                    break
+            r, c = divmod(node, stride)
+            path.append((r - 1, c - 1))
+        return path
+
+class FlowFieldCache:
+    """
+    Bộ đệm LRU các FlowField, giới hạn tổng bộ nhớ max_bytes (mặc định theo
+    config.FLOW_FIELD_CACHE_MAX_MB), khóa theo (điểm đích, layout_version).
+    Khi bố cục đổi phiên bản, các trường của phiên bản cũ bị xóa (không còn dùng được nữa).
+    Một trường lớn hơn cả max_bytes vẫn được tính và trả về nhưng không được lưu.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = int(config.FLOW_FIELD_CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self._fields = collections.OrderedDict() # (đích, phiên bản) -> FlowField, mục dùng gần nhất ở cuối
+        self._layout_version = None
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        """Xóa mọi trường đã lưu (bộ đếm được giữ nguyên)."""
+        if self._fields:
+            self.invalidations += 1
+        self._fields.clear()
+        self.total_bytes = 0
+
+    def get_field(self, supermarket_map_obj, target_rc):
+        """FlowField tới target_rc cho bố cục hiện tại của supermarket_map_obj (tính nếu chưa có)."""
+        if supermarket_map_obj.layout_version != self._layout_version:
+            self.invalidate()
+            self._layout_version = supermarket_map_obj.layout_version
+        key = ((int(target_rc[0]), int(target_rc[1])), supermarket_map_obj.layout_version)
+        field = self._fields.get(key)
+        if field is not None:
+            self.hits += 1
+            self._fields.move_to_end(key)
+            return field
+        self.misses += 1
+        field = FlowField(supermarket_map_obj.get_grid_astar(), target_rc, supermarket_map_obj.layout_version)
+        if field.nbytes <= self.max_bytes:
+            self._fields[key] = field
+            self.total_bytes += field.nbytes
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._fields.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+                self.evictions += 1
+        return field
+
+    def find_path(self, supermarket_map_obj, start_rc, target_rc):
+        """Đường đi từ start_rc tới target_rc theo trường (đã lưu hoặc mới tính) của target_rc, hoặc None."""
+        return self.get_field(supermarket_map_obj, target_rc).route_from(start_rc)
+
+    def stats(self):
+        """Số trường, bộ nhớ đang dùng, hit/miss/eviction/invalidation và tỉ lệ hit."""
+        lookups = self.hits + self.misses
+        return {
+            "fields": len(self._fields),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,185 @@
+# grid_pathfinding.py
+# Tìm đường A* tự viết trên lưới, không cần thư viện pathfinding: ô được đánh số nguyên theo
+# chỉ số phẳng, lưới đi được là mảng uint8 phẳng có viền vật cản 1 ô (nên không phải kiểm tra
+# biên khi duyệt láng giềng), g-score và nút cha nằm trong mảng cấp phát sẵn, hàng đợi ưu tiên
+# dùng heapq. Đi ngang/dọc, mỗi bước chi phí 1, heuristic Manhattan.
+import heapq
+import numpy as np
+
+# g-score lưu dưới dạng khóa search_base + g, với search_base giảm dần qua mỗi lần tìm: ô chưa được
+# thăm trong lần tìm hiện tại luôn có khóa lớn hơn mọi khóa mới, nên một phép so sánh vừa kiểm tra
+# "chưa thăm" vừa kiểm tra "tìm được g nhỏ hơn", và không phải xóa mảng giữa các lần tìm.
+_SEARCH_KEY_STRIDE = 1 << 32 # Lớn hơn mọi độ dài đường đi có thể
+_MAX_SEARCHES = 1 << 29 # Sau số lần tìm này các mảng được khởi tạo lại
+_UNVISITED_KEY = (_MAX_SEARCHES + 1) * _SEARCH_KEY_STRIDE
+_BLOCKED_KEY = -1 # Ô vật cản: không khóa nào nhỏ hơn, nên không bao giờ được cập nhật
+
+class GridAStar:
+    """
+    A* dùng lại được cho một mặt nạ đi được cố định (rows, cols).
+    Mảng g-score/nút cha được cấp phát một lần và không bị xóa giữa các lần tìm
+    (xem _SEARCH_KEY_STRIDE); vật cản được mã hóa ngay trong mảng g-score nên mỗi láng giềng
+    chỉ cần một lần tra mảng.
+    """
+
+    def __init__(self, walkable_mask):
+        walkable_mask = np.asarray(walkable_mask, dtype=bool)
+        self.num_rows, self.num_cols = walkable_mask.shape
+        self.stride = self.num_cols + 2 # Số cột của lưới có viền
+        padded = np.zeros((self.num_rows + 2, self.stride), dtype=np.uint8)
+        padded[1:-1, 1:-1] = walkable_mask
+        self.walkable_flat = padded.ravel()
+        self._walkable = self.walkable_flat.tobytes() # Truy cập từng phần tử trong vòng lặp Python nhanh hơn ndarray
+        self._parent = [-1] * self.walkable_flat.shape[0]
+        # Số bit đủ chứa chỉ số nút, cũng đủ chứa mọi g (đường đi không dài hơn số ô)
+        self._node_bits = max(1, int(self.walkable_flat.shape[0]).bit_length())
+        self._reset_scores()
+        self.last_expanded = 0 # Số nút đã mở rộng ở lần tìm gần nhất
+
+    def _reset_scores(self):
+        self._g_keys = np.where(self.walkable_flat == 1, _UNVISITED_KEY, _BLOCKED_KEY).tolist()
+        self._search_id = 0
+
+    def node_id(self, node_rc):
+        """Chỉ số phẳng (trong lưới có viền) của ô (hàng, cột)."""
+        return (node_rc[0] + 1) * self.stride + node_rc[1] + 1
+
+    def node_rc(self, node_id):
+        r, c = divmod(node_id, self.stride)
+        return r - 1, c - 1
+
+    def is_walkable(self, node_rc):
+        return 0 <= node_rc[0] < self.num_rows and 0 <= node_rc[1] < self.num_cols \
+            and self._walkable[self.node_id(node_rc)] == 1
+
+    def find_path(self, start_rc, end_rc):
+        """
+        Đường đi ngắn nhất dạng danh sách (hàng, cột) từ start_rc tới end_rc (gồm cả hai đầu),
+        hoặc None nếu không có đường. Hai đầu phải là ô đi được (xem is_walkable).
+        """
+        if self._search_id >= _MAX_SEARCHES:
+            self._reset_scores()
+        self._search_id += 1
+        search_base = (_MAX_SEARCHES - self._search_id) * _SEARCH_KEY_STRIDE
+        g_keys, parent, stride = self._g_keys, self._parent, self.stride
+
+        start, goal = self.node_id(start_rc), self.node_id(end_rc)
+        goal_r, goal_c = divmod(goal, stride)
+        start_r, start_c = divmod(start, stride)
+        g_keys[start], parent[start] = search_base, -1
+        # Mỗi phần tử heap là một số nguyên (f, g_max - g, nút) ghép bit, so sánh nhanh hơn tuple:
+        # nhỏ nhất theo f, cùng f thì ưu tiên nút đi xa hơn (g lớn hơn)
+        node_bits = self._node_bits
+        node_mask = (1 << node_bits) - 1
+        g_max = node_mask
+        f_shift = 2 * node_bits
+        open_heap = [(abs(start_r - goal_r) + abs(start_c - goal_c)) << f_shift | g_max << node_bits | start]
+        heappush, heappop = heapq.heappush, heapq.heappop
+        expanded = 0
+        found = False
+        while open_heap:
+            entry = heappop(open_heap)
+            node = entry & node_mask
+            if node == goal:
+                found = True
+                break
+            g = g_max - ((entry >> node_bits) & node_mask)
+            if search_base + g > g_keys[node]:
+                continue # Mục cũ: nút đã được đưa vào heap lại với g nhỏ hơn
+            expanded += 1
+            next_g = g + 1
+            next_key = search_base + next_g
+            next_g_bits = (g_max - next_g) << node_bits
+            # Heuristic của 4 láng giềng suy ra từ tọa độ của nút, không cần divmod cho từng láng giềng
+            r, c = divmod(node, stride)
+            h_r, h_c = abs(r - goal_r), abs(c - goal_c)
+            for neighbour, h in ((node - stride, abs(r - 1 - goal_r) + h_c), (node + stride, abs(r + 1 - goal_r) + h_c),
+                                 (node - 1, h_r + abs(c - 1 - goal_c)), (node + 1, h_r + abs(c + 1 - goal_c))):
+                if g_keys[neighbour] > next_key:
+                    g_keys[neighbour] = next_key
+                    parent[neighbour] = node
+                    heappush(open_heap, (next_g + h) << f_shift | next_g_bits | neighbour)
+        self.last_expanded = expanded
+        if not found:
+            return None
+
+        path = []
+        node = goal
+        while node != -1:
+            r, c = divmod(node, stride)
+            path.append((r - 1, c - 1))
+            node = parent[node]
+        path.reverse()
+        return path
+
+# Độ lệch chỉ số phẳng của 4 láng giềng được tính theo stride; mã hướng k (0..3) trong mảng
+# hướng của bfs_distance_fields là chỉ số của độ lệch đã dùng để tới ô
+NO_DIRECTION = 255
+
+def neighbour_offsets(stride):
+    return np.array([-stride, stride, -1, 1], dtype=np.int64)
+
+def bfs_distance_fields(walkable_flat, stride, source_ids, with_directions=False, stop_ids=None):
+    """
+    BFS (mỗi bước chi phí 1, đi ngang/dọc) từ từng ô nguồn trên lưới phẳng có viền walkable_flat
+    (xem GridAStar). Các nguồn được duyệt cùng lúc: B trường khoảng cách đặt nối tiếp trong một
+    mảng phẳng B*N, viền vật cản ngăn các trường lấn sang nhau, nên mỗi mức BFS của cả B nguồn
+    chỉ là vài phép toán mảng.
+    Trả về (distances, directions): distances là mảng int32 (B, N), -1 cho ô không tới được hoặc
+    vật cản; directions (nếu with_directions) là mảng uint8 (B, N) mã hướng bước cuối cùng tới
+    mỗi ô (NO_DIRECTION ở nguồn/ô không tới được), dùng để dựng lại đường đi (xem trace_bfs_path).
+    Với stop_ids (chỉ số phẳng), BFS dừng sớm khi mọi nguồn đã tới mọi ô trong stop_ids; khi đó
+    chỉ khoảng cách (và hướng) tới các ô đó, cùng các ô gần hơn, là đầy đủ.
+    """
+    walkable_flat = np.asarray(walkable_flat, dtype=bool)
+    num_nodes = walkable_flat.shape[0]
+    source_ids = np.asarray(source_ids, dtype=np.int64).reshape(-1)
+    num_sources = source_ids.shape[0]
+    offsets = neighbour_offsets(stride)
+
+    # -2: vật cản, -1: chưa thăm
+    distances = np.where(np.tile(walkable_flat, num_sources), -1, -2).astype(np.int32)
+    directions = np.full(num_sources * num_nodes, NO_DIRECTION, dtype=np.uint8) if with_directions else None
+    frontier = np.arange(num_sources, dtype=np.int64) * num_nodes + source_ids
+    frontier = frontier[distances[frontier] == -1]
+    distances[frontier] = 0
+    slot = np.empty(distances.shape[0], dtype=np.int64) # Dùng để khử trùng lặp không cần sắp xếp
+    if stop_ids is not None:
+        stop_ids = (np.arange(num_sources, dtype=np.int64)[:, None] * num_nodes
+                    + np.asarray(stop_ids, dtype=np.int64).reshape(1, -1)).ravel()
+        stop_ids = stop_ids[distances[stop_ids] != -2] # Ô vật cản không bao giờ tới được
+    level = 0
+    while frontier.size:
+        if stop_ids is not None and (distances[stop_ids] >= 0).all():
+            break
+        level += 1
+        candidates = (frontier[:, None] + offsets[None, :]).ravel()
+        fresh = np.flatnonzero(distances[candidates] == -1) # fresh % 4 là mã hướng
+        candidates = candidates[fresh]
+        # Một ô có thể được nhiều ô của frontier chạm tới: giữ lần xuất hiện cuối cùng
+        positions = np.arange(candidates.shape[0])
+        slot[candidates] = positions
+        unique = slot[candidates] == positions
+        frontier = candidates[unique]
+        distances[frontier] = level
+        if with_directions:
+            directions[frontier] = fresh[unique] & 3
+    distances[distances == -2] = -1
+    distances = distances.reshape(num_sources, num_nodes)
+    if with_directions:
+        directions = directions.reshape(num_sources, num_nodes)
+    return distances, directions
+
+def trace_bfs_path(directions, stride, target_id):
+    """
+    Dựng lại đường đi từ nguồn tới target_id theo mảng hướng (một hàng của bfs_distance_fields).
+    Trả về danh sách chỉ số phẳng từ nguồn tới target_id, hoặc None nếu không tới được.
+    """
+    offsets = neighbour_offsets(stride).tolist()
+    path = [target_id]
+    node = target_id
+    while directions[node] != NO_DIRECTION:
+        node -= offsets[directions[node]]
+        path.append(node)
+    path.reverse()
+    return path
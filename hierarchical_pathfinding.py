@@ -0,0 +1,264 @@
+# hierarchical_pathfinding.py
+# Tìm đường phân cấp (HPA*) cho bản đồ độ phân giải cao: lưới được chia thành các cụm vuông
+# cluster_size ô; trên mỗi biên giữa hai cụm kề nhau, mỗi đoạn đi qua được sinh ra các cặp ô
+# lối vào (entrance) ở giữa đoạn, hoặc ở hai đầu và cách đều nhau nếu đoạn dài. Quãng đường
+# giữa các lối vào trong cùng một cụm được tính trước bằng BFS giới hạn trong cụm. Một truy vấn
+# tìm đường trên đồ thị trừu tượng (lối vào + điểm đầu/cuối) trước, rồi mới tinh chỉnh từng
+# chặng ngắn trên lưới bằng grid_pathfinding.GridAStar.
+# Khi bố cục đổi (ví dụ thêm gian hàng), chỉ các cụm chứa ô thay đổi và cụm kề chúng được dựng lại.
+import heapq
+import numpy as np
+import config
+import grid_pathfinding
+
+def _padded_flat(walkable_block):
+    """Mặt nạ một cụm thành mảng phẳng có viền vật cản 1 ô (cùng dạng GridAStar.walkable_flat) và stride."""
+    padded = np.zeros((walkable_block.shape[0] + 2, walkable_block.shape[1] + 2), dtype=bool)
+    padded[1:-1, 1:-1] = walkable_block
+    return padded.ravel(), padded.shape[1]
+
+class HierarchicalPathfinder:
+    """
+    Đồ thị trừu tượng HPA* cho một mặt nạ đi được (rows, cols).
+    Nút trừu tượng là chỉ số phẳng r * cols + c của ô lối vào. Cạnh giữa hai cụm (chi phí 1) nối
+    cặp ô lối vào hai bên một biên; cạnh trong cụm mang quãng đường BFS giữa hai lối vào của cụm
+    (chỉ đi trong cụm). Đường tìm được gần tối ưu (có thể dài hơn đường ngắn nhất một chút, do
+    chỉ đi qua biên cụm tại các lối vào).
+    grid_astar: GridAStar của cùng mặt nạ, dùng để tinh chỉnh các chặng (xem refine).
+    """
+
+    def __init__(self, walkable_mask, grid_astar=None, cluster_size=None, entrance_spacing=None):
+        self.cluster_size = config.HPA_CLUSTER_SIZE if cluster_size is None else cluster_size
+        self.entrance_spacing = config.HPA_ENTRANCE_SPACING if entrance_spacing is None else entrance_spacing
+        self.walkable_mask = np.array(walkable_mask, dtype=bool)
+        self.num_rows, self.num_cols = self.walkable_mask.shape
+        self.num_cluster_rows = -(-self.num_rows // self.cluster_size)
+        self.num_cluster_cols = -(-self.num_cols // self.cluster_size)
+        self.grid_astar = grid_pathfinding.GridAStar(self.walkable_mask) if grid_astar is None else grid_astar
+        self._transitions = {} # khóa biên -> danh sách cặp (nút, nút) hai bên biên
+        self._intra_edges = {} # (hàng cụm, cột cụm) -> {nút: [(nút, chi phí), ...]}
+        for border in self._all_borders():
+            self._transitions[border] = self._find_transitions(border)
+        for cluster in self._all_clusters():
+            self._intra_edges[cluster] = self._connect_cluster(cluster)
+        self._build_graph()
+
+    # --- Cụm và biên ---
+
+    def _all_clusters(self):
+        return [(cr, cc) for cr in range(self.num_cluster_rows) for cc in range(self.num_cluster_cols)]
+
+    def _all_borders(self):
+        # ("h", cr, cc): biên dưới của cụm (cr, cc); ("v", cr, cc): biên phải của cụm (cr, cc)
+        borders = [("h", cr, cc) for cr in range(self.num_cluster_rows - 1) for cc in range(self.num_cluster_cols)]
+        borders += [("v", cr, cc) for cr in range(self.num_cluster_rows) for cc in range(self.num_cluster_cols - 1)]
+        return borders
+
+    def _cluster_bounds(self, cluster):
+        cr, cc = cluster
+        r0, c0 = cr * self.cluster_size, cc * self.cluster_size
+        return r0, c0, min(r0 + self.cluster_size, self.num_rows), min(c0 + self.cluster_size, self.num_cols)
+
+    def cluster_of(self, node_rc):
+        return node_rc[0] // self.cluster_size, node_rc[1] // self.cluster_size
+
+    def _cluster_borders(self, cluster):
+        cr, cc = cluster
+        borders = [("h", cr - 1, cc), ("h", cr, cc), ("v", cr, cc - 1), ("v", cr, cc)]
+        return [border for border in borders if self._is_border(border)]
+
+    def _is_border(self, border):
+        kind, cr, cc = border
+        if kind == "h":
+            return 0 <= cr < self.num_cluster_rows - 1 and 0 <= cc < self.num_cluster_cols
+        return 0 <= cr < self.num_cluster_rows and 0 <= cc < self.num_cluster_cols - 1
+
+    def _find_transitions(self, border):
+        """
+        Các cặp ô lối vào trên một biên: mỗi đoạn liên tục mà cả hai bên biên đều đi được sinh
+        một cặp ở giữa đoạn nếu đoạn ngắn hơn entrance_spacing, nếu không thì các cặp ở hai đầu
+        và cách đều nhau không quá entrance_spacing ô. Đường đi qua biên ở ô không phải lối vào
+        phải vòng qua lối vào gần nhất, nên lối vào thưa làm đường dài hơn đường ngắn nhất.
+        """
+        kind, cr, cc = border
+        r0, c0, r1, c1 = self._cluster_bounds((cr, cc))
+        if kind == "h":
+            side_a, side_b = self.walkable_mask[r1 - 1, c0:c1], self.walkable_mask[r1, c0:c1]
+            to_pair = lambda i: ((r1 - 1) * self.num_cols + c0 + i, r1 * self.num_cols + c0 + i)
+        else:
+            side_a, side_b = self.walkable_mask[r0:r1, c1 - 1], self.walkable_mask[r0:r1, c1]
+            to_pair = lambda i: ((r0 + i) * self.num_cols + c1 - 1, (r0 + i) * self.num_cols + c1)
+        open_cells = np.concatenate([[False], side_a & side_b, [False]])
+        edges = np.flatnonzero(np.diff(open_cells.astype(np.int8)))
+        transitions = []
+        for start, end in zip(edges[0::2].tolist(), edges[1::2].tolist()): # đoạn [start, end)
+            if end - start < self.entrance_spacing:
+                transitions.append(to_pair((start + end - 1) // 2))
+                continue
+            num_gaps = -(-(end - 1 - start) // self.entrance_spacing)
+            positions = sorted({start + round(i * (end - 1 - start) / num_gaps) for i in range(num_gaps + 1)})
+            transitions += [to_pair(position) for position in positions]
+        return transitions
+
+    def _cluster_entrances(self, cluster):
+        """Các nút lối vào nằm trong cụm (theo các biên của cụm)."""
+        entrances = set()
+        for border in self._cluster_borders(cluster):
+            for node_a, node_b in self._transitions.get(border, ()):
+                for node in (node_a, node_b):
+                    if self.cluster_of(divmod(node, self.num_cols)) == cluster:
+                        entrances.add(node)
+        return sorted(entrances)
+
+    def _cluster_distances(self, cluster, source_nodes, target_nodes):
+        """
+        Quãng đường BFS (chỉ đi trong cụm) từ mỗi nút nguồn tới mỗi nút đích của cùng cụm:
+        mảng int32 (nguồn, đích), -1 nếu không tới được.
+        """
+        r0, c0, r1, c1 = self._cluster_bounds(cluster)
+        walkable_flat, stride = _padded_flat(self.walkable_mask[r0:r1, c0:c1])
+        to_local = lambda node: (node // self.num_cols - r0 + 1) * stride + node % self.num_cols - c0 + 1
+        distances, _ = grid_pathfinding.bfs_distance_fields(
+            walkable_flat, stride, [to_local(node) for node in source_nodes])
+        return distances[:, [to_local(node) for node in target_nodes]]
+
+    def _connect_cluster(self, cluster):
+        entrances = self._cluster_entrances(cluster)
+        edges = {node: [] for node in entrances}
+        if len(entrances) > 1:
+            distances = self._cluster_distances(cluster, entrances, entrances).tolist()
+            for i, node_a in enumerate(entrances):
+                for j, node_b in enumerate(entrances):
+                    if i != j and distances[i][j] > 0:
+                        edges[node_a].append((node_b, distances[i][j]))
+        return edges
+
+    def _build_graph(self):
+        graph = {}
+        for edges in self._intra_edges.values():
+            for node, neighbours in edges.items():
+                graph.setdefault(node, []).extend(neighbours)
+        for transitions in self._transitions.values():
+            for node_a, node_b in transitions:
+                graph.setdefault(node_a, []).append((node_b, 1))
+                graph.setdefault(node_b, []).append((node_a, 1))
+        self._graph = graph
+
+    @property
+    def num_abstract_nodes(self):
+        return len(self._graph)
+
+    # --- Cập nhật tăng dần ---
+
+    def update(self, walkable_mask, grid_astar=None):
+        """
+        Cập nhật theo mặt nạ mới: chỉ các biên của cụm có ô thay đổi được tìm lại lối vào, và chỉ
+        các cụm đó cùng cụm kề (có lối vào trên các biên này) được tính lại quãng đường trong cụm.
+        Trả về số cụm đã dựng lại.
+        """
+        walkable_mask = np.asarray(walkable_mask, dtype=bool)
+        if grid_astar is not None:
+            self.grid_astar = grid_astar
+        changed_r, changed_c = np.nonzero(walkable_mask != self.walkable_mask)
+        if changed_r.size == 0:
+            return 0
+        self.walkable_mask = walkable_mask.copy()
+        if grid_astar is None:
+            self.grid_astar = grid_pathfinding.GridAStar(self.walkable_mask)
+        changed_clusters = set(zip((changed_r // self.cluster_size).tolist(), (changed_c // self.cluster_size).tolist()))
+        borders = {border for cluster in changed_clusters for border in self._cluster_borders(cluster)}
+        for border in borders:
+            self._transitions[border] = self._find_transitions(border)
+        rebuilt = set(changed_clusters)
+        for kind, cr, cc in borders: # Cụm ở cả hai bên biên có thể có lối vào mới/mất lối vào
+            rebuilt.add((cr, cc))
+            rebuilt.add((cr + 1, cc) if kind == "h" else (cr, cc + 1))
+        for cluster in rebuilt:
+            self._intra_edges[cluster] = self._connect_cluster(cluster)
+        self._build_graph()
+        return len(rebuilt)
+
+    # --- Truy vấn ---
+
+    def _endpoint_edges(self, node, cluster):
+        """Cạnh tạm từ một điểm đầu/cuối tới các lối vào trong cụm của nó."""
+        entrances = self._cluster_entrances(cluster)
+        if not entrances:
+            return []
+        distances = self._cluster_distances(cluster, [node], entrances)[0].tolist()
+        return [(entrance, distance) for entrance, distance in zip(entrances, distances) if distance >= 0]
+
+    def find_abstract_path(self, start_rc, end_rc):
+        """
+        Tìm trên đồ thị trừu tượng (A* với heuristic Manhattan): danh sách nút (chỉ số phẳng
+        r * cols + c) từ điểm đầu qua các lối vào tới điểm cuối, hoặc None.
+        """
+        num_cols = self.num_cols
+        start, goal = start_rc[0] * num_cols + start_rc[1], end_rc[0] * num_cols + end_rc[1]
+        if start == goal:
+            return [start]
+        start_cluster, goal_cluster = self.cluster_of(start_rc), self.cluster_of(end_rc)
+        start_edges = self._endpoint_edges(start, start_cluster)
+        # Cạnh ngược (lối vào -> điểm cuối): khoảng cách đối xứng
+        goal_edges = {entrance: distance for entrance, distance in self._endpoint_edges(goal, goal_cluster)}
+        if start_cluster == goal_cluster: # Có thể đi thẳng trong cụm
+            direct = self._cluster_distances(start_cluster, [start], [goal])[0, 0]
+            if direct >= 0:
+                start_edges.append((goal, int(direct)))
+        if start in goal_edges: # Điểm đầu trùng một lối vào của cụm đích
+            start_edges.append((goal, goal_edges[start]))
+
+        goal_r, goal_c = end_rc
+        heuristic = lambda node: abs(node // num_cols - goal_r) + abs(node % num_cols - goal_c)
+        g_scores, parents = {start: 0}, {start: None}
+        open_heap = [(heuristic(start), 0, start)]
+        graph = self._graph
+        while open_heap:
+            _, g, node = heapq.heappop(open_heap)
+            if node == goal:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return path[::-1]
+            if g > g_scores[node]:
+                continue # Mục cũ
+            neighbours = graph.get(node, ())
+            if node == start: # Điểm đầu có thể chính là một lối vào: giữ cả các cạnh của nó trong đồ thị
+                neighbours = start_edges + list(neighbours)
+            if node in goal_edges:
+                neighbours = list(neighbours) + [(goal, goal_edges[node])]
+            for neighbour, cost in neighbours:
+                next_g = g + cost
+                if next_g < g_scores.get(neighbour, next_g + 1):
+                    g_scores[neighbour] = next_g
+                    parents[neighbour] = node
+                    heapq.heappush(open_heap, (next_g + heuristic(neighbour), next_g, neighbour))
+        return None
+
+    def refine(self, abstract_path):
+        """
+        Đường đi trên lưới (danh sách (hàng, cột)) qua các nút trừu tượng: hai nút kề nhau qua
+        biên cụm là một bước; các chặng còn lại (trong một cụm) được tìm bằng GridAStar.
+        """
+        path = [divmod(abstract_path[0], self.num_cols)]
+        for node_a, node_b in zip(abstract_path, abstract_path[1:]):
+            rc_a, rc_b = divmod(node_a, self.num_cols), divmod(node_b, self.num_cols)
+            if abs(rc_a[0] - rc_b[0]) + abs(rc_a[1] - rc_b[1]) == 1:
+                path.append(rc_b)
+                continue
+            leg = self.grid_astar.find_path(rc_a, rc_b)
+            if leg is None:
+                return None
+            path.extend(leg[1:])
+        return path
+
+    def find_path(self, start_rc, end_rc):
+        """
+        Đường đi (danh sách (hàng, cột) gồm cả hai đầu) từ start_rc tới end_rc, hoặc None.
+        Hai đầu phải là ô đi được.
+        """
+        abstract_path = self.find_abstract_path(start_rc, end_rc)
+        if abstract_path is None:
+            return None
+        return self.refine(abstract_path)
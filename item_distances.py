@@ -0,0 +1,125 @@
+# item_distances.py
+# Bảng quãng đường đi bộ giữa các điểm tiếp cận mặt hàng (SupermarketMap.approachable_item_locations):
+# mỗi điểm tiếp cận là một nút cố định, nên chạy một BFS từ mỗi điểm trên mặt nạ đi được
+# (grid_pathfinding.bfs_distance_fields) là biết quãng đường giữa mọi cặp điểm. Sau đó lộ trình
+# nhiều điểm dừng và truy vấn "mặt hàng gần nhất" chỉ còn là tra bảng, không phải chạy lại A*.
+import numpy as np
+import config
+import grid_pathfinding
+
+class ItemDistanceTable:
+    """
+    Ma trận quãng đường (số bước ô) giữa mọi điểm tiếp cận mặt hàng của một bố cục.
+    spots: danh sách (hàng, cột) các điểm tiếp cận (không trùng lặp);
+    distances: mảng int32 (S, S), -1 nếu hai điểm không đi tới nhau được;
+    item_spots: tên mặt hàng -> danh sách chỉ số điểm tiếp cận của mặt hàng đó.
+    Với with_predecessors=True, giữ thêm mảng hướng BFS (1 byte mỗi ô cho mỗi điểm) để dựng lại
+    đường đi giữa hai điểm mà không cần tìm đường.
+    Bảng ứng với bố cục tại layout_version; dùng SupermarketMap.get_item_distance_table()
+    để có bảng luôn khớp với bố cục hiện tại.
+    """
+
+    def __init__(self, supermarket_map_obj, with_predecessors=False, batch_size=None):
+        batch_size = config.ITEM_DISTANCE_BFS_BATCH_SIZE if batch_size is None else batch_size
+        self.layout_version = supermarket_map_obj.layout_version
+        self.with_predecessors = with_predecessors
+        self._grid = supermarket_map_obj.get_grid_astar()
+
+        self.item_spots = {}
+        self.spots = []
+        self.spot_index = {}
+        for item_name, item_spots in supermarket_map_obj.approachable_item_locations.items():
+            for spot in item_spots:
+                spot = (int(spot[0]), int(spot[1]))
+                if spot not in self.spot_index:
+                    self.spot_index[spot] = len(self.spots)
+                    self.spots.append(spot)
+                self.item_spots.setdefault(item_name, []).append(self.spot_index[spot])
+        self._item_names = {item_name.lower(): item_name for item_name in self.item_spots}
+
+        num_spots = len(self.spots)
+        spot_ids = np.array([self._grid.node_id(spot) for spot in self.spots], dtype=np.int64)
+        self.distances = np.full((num_spots, num_spots), -1, dtype=np.int32)
+        self._directions = [None] * num_spots
+        # Điểm tiếp cận có thể đã bị vật cản đè lên sau khi được ghi nhận: coi như không tới được
+        reachable = np.array([self._grid.is_walkable(spot) for spot in self.spots], dtype=bool)
+        sources = np.flatnonzero(reachable)
+        for start in range(0, sources.shape[0], batch_size):
+            batch = sources[start:start + batch_size]
+            fields, directions = grid_pathfinding.bfs_distance_fields(
+                self._grid.walkable_flat, self._grid.stride, spot_ids[batch], with_directions=with_predecessors)
+            self.distances[batch] = fields[:, spot_ids]
+            if with_predecessors:
+                for i, spot_directions in zip(batch.tolist(), directions):
+                    self._directions[i] = spot_directions
+
+    def canonical_item_name(self, item_name):
+        return self._item_names.get(item_name.lower())
+
+    def spot_distance(self, spot_a, spot_b):
+        """Số bước đi giữa hai điểm tiếp cận, hoặc None nếu không đi được hay không phải điểm tiếp cận."""
+        i, j = self.spot_index.get(tuple(spot_a)), self.spot_index.get(tuple(spot_b))
+        if i is None or j is None or self.distances[i, j] < 0:
+            return None
+        return int(self.distances[i, j])
+
+    def item_distance(self, item_a, item_b):
+        """
+        Quãng đường ngắn nhất giữa hai mặt hàng (tên không phân biệt hoa thường), xét mọi cặp
+        điểm tiếp cận. Trả về (số bước, điểm tiếp cận của item_a, điểm tiếp cận của item_b) hoặc None.
+        """
+        name_a, name_b = self.canonical_item_name(item_a), self.canonical_item_name(item_b)
+        if name_a is None or name_b is None:
+            return None
+        spots_a, spots_b = self.item_spots[name_a], self.item_spots[name_b]
+        block = self.distances[np.ix_(spots_a, spots_b)]
+        block = np.where(block < 0, np.iinfo(np.int32).max, block)
+        a, b = np.unravel_index(np.argmin(block), block.shape)
+        if self.distances[spots_a[a], spots_b[b]] < 0:
+            return None
+        return int(block[a, b]), self.spots[spots_a[a]], self.spots[spots_b[b]]
+
+    def nearest_items(self, item_or_spot, count=1):
+        """
+        Các mặt hàng gần nhất theo quãng đường đi bộ, tính từ một mặt hàng (tên) hoặc một điểm
+        tiếp cận (hàng, cột). Trả về tối đa `count` bộ (tên mặt hàng, số bước, điểm tiếp cận),
+        tăng dần theo số bước; mặt hàng xuất phát không được tính.
+        """
+        if isinstance(item_or_spot, str):
+            source_name = self.canonical_item_name(item_or_spot)
+            if source_name is None:
+                return []
+            source_spots = self.item_spots[source_name]
+        else:
+            source_name = None
+            spot = self.spot_index.get(tuple(item_or_spot))
+            if spot is None:
+                return []
+            source_spots = [spot]
+
+        # Quãng đường từ nguồn tới từng điểm: min theo các điểm tiếp cận của nguồn
+        from_source = self.distances[source_spots]
+        from_source = np.where(from_source < 0, np.iinfo(np.int32).max, from_source).min(axis=0)
+        candidates = []
+        for item_name, item_spots in self.item_spots.items():
+            if item_name == source_name:
+                continue
+            best = min(item_spots, key=lambda j: from_source[j])
+            if from_source[best] != np.iinfo(np.int32).max:
+                candidates.append((item_name, int(from_source[best]), self.spots[best]))
+        candidates.sort(key=lambda candidate: candidate[1])
+        return candidates[:count]
+
+    def path_between_spots(self, spot_a, spot_b):
+        """
+        Đường đi (danh sách (hàng, cột), gồm cả hai đầu) giữa hai điểm tiếp cận: dựng lại từ mảng
+        hướng BFS nếu có (with_predecessors), nếu không thì tìm bằng A* trên lưới của bảng.
+        Trả về None nếu không đi được.
+        """
+        i, j = self.spot_index.get(tuple(spot_a)), self.spot_index.get(tuple(spot_b))
+        if i is None or j is None or self.distances[i, j] < 0:
+            return None
+        if self._directions[i] is None:
+            return self._grid.find_path(self.spots[i], self.spots[j])
+        path_ids = grid_pathfinding.trace_bfs_path(self._directions[i], self._grid.stride, self._grid.node_id(self.spots[j]))
+        return [self._grid.node_rc(node_id) for node_id in path_ids]
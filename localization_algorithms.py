@@ -1,12 +1,18 @@
 # localization_algorithms.py
+import collections
 import math
+import time
+import numpy as np
 import config
-from supermarket_model import PATHWAY_ID # Import ID cần thiết
+from fingerprint_storage import CompactFingerprints, FingerprintMatrix
+from fingerprint_index import FingerprintKDTree, FingerprintIVFIndex
 
 from pathfinding.core.diagonal_movement import DiagonalMovement
-from pathfinding.core.grid import Grid as PathfindingGrid # Đổi tên để rõ ràng
 from pathfinding.finder.a_star import AStarFinder
 
+# Các chỉ mục dựng sẵn trả lời truy vấn bằng query_neighbours(observed_rssi, k)
+KNN_INDEX_TYPES = (FingerprintKDTree, FingerprintIVFIndex)
+
 def rssi_distance_euclidean(rssi_vec1, rssi_vec2):
     """Tính khoảng cách Euclide giữa hai vector RSSI."""
     if len(rssi_vec1) != len(rssi_vec2):
@@ -14,8 +20,64 @@ def rssi_distance_euclidean(rssi_vec1, rssi_vec2):
     squared_diff_sum = sum([(v1 - v2)**2 for v1, v2 in zip(rssi_vec1, rssi_vec2)])
     return math.sqrt(squared_diff_sum)
 
+_fingerprint_matrix_cache = (None, None) # (mảng tensor gốc, FingerprintMatrix) của lần gọi gần nhất
+
+def as_fingerprint_matrix(fingerprints_data):
+    """
+    Trả về dạng ma trận (N, AP) để tính KNN: FingerprintMatrix/CompactFingerprints giữ nguyên,
+    tensor (hàng, cột, AP) được trải phẳng một lần và ghi nhớ cho các lần gọi sau với cùng mảng.
+    Nếu tensor bị sửa tại chỗ, hãy tự tạo lại FingerprintMatrix.
+    """
+    global _fingerprint_matrix_cache
+    if isinstance(fingerprints_data, (FingerprintMatrix, CompactFingerprints)):
+        return fingerprints_data
+    cached_array, cached_matrix = _fingerprint_matrix_cache
+    if cached_array is fingerprints_data:
+        return cached_matrix
+    matrix = FingerprintMatrix(fingerprints_data)
+    _fingerprint_matrix_cache = (fingerprints_data, matrix)
+    return matrix
+
+def _matrix_knn_neighbours(observed_rssi, fingerprint_matrix, k):
+    """
+    K láng giềng gần nhất trên FingerprintMatrix/CompactFingerprints: mọi khoảng cách
+    được tính trong một biểu thức vector hóa, top K chọn bằng np.argpartition.
+    Trả về list ((hàng, cột), khoảng cách) đã sắp xếp tăng dần.
+    """
+    if len(observed_rssi) != fingerprint_matrix.num_aps:
+        raise ValueError("Các vector RSSI phải có cùng độ dài")
+    dist_sq = fingerprint_matrix.squared_distances(observed_rssi)
+    actual_k = min(k, dist_sq.shape[0])
+    if actual_k <= 0:
+        return []
+    nearest_idx = np.argpartition(dist_sq, actual_k - 1)[:actual_k]
+    nearest_idx = nearest_idx[np.argsort(dist_sq[nearest_idx], kind='stable')]
+    cells_r, cells_c = fingerprint_matrix.cell_positions()
+    return [((int(cells_r[i]), int(cells_c[i])), math.sqrt(float(dist_sq[i])))
+            for i in nearest_idx]
+
 def predict_location_knn(observed_rssi, fingerprints_data, k, weighted=False, epsilon=1e-6):
-    """Dự đoán vị trí dựa trên KNN."""
+    """
+    Dự đoán vị trí dựa trên KNN.
+    fingerprints_data: tensor (hàng, cột, AP) từ generate_rssi_fingerprints_from_map,
+                       fingerprint_storage.FingerprintMatrix / CompactFingerprints,
+                       fingerprint_index.FingerprintKDTree / FingerprintIVFIndex (chỉ mục dựng sẵn),
+                       hoặc dict (hàng, cột) -> vector RSSI.
+    """
+    if isinstance(fingerprints_data, KNN_INDEX_TYPES):
+        k_nearest = fingerprints_data.query_neighbours(observed_rssi, k)
+        if not k_nearest:
+            print("Lỗi KNN: Không có điểm nào trong fingerprint map.")
+            return None
+        return _knn_centroid(k_nearest, weighted, epsilon)
+
+    if isinstance(fingerprints_data, (np.ndarray, FingerprintMatrix, CompactFingerprints)):
+        k_nearest = _matrix_knn_neighbours(observed_rssi, as_fingerprint_matrix(fingerprints_data), k)
+        if not k_nearest:
+            print("Lỗi KNN: Không có điểm nào trong fingerprint map.")
+            return None
+        return _knn_centroid(k_nearest, weighted, epsilon)
+
     if not fingerprints_data:
         print("Lỗi KNN: Dữ liệu fingerprint trống.")
         return None
@@ -37,7 +99,11 @@ def predict_location_knn(observed_rssi, fingerprints_data, k, weighted=False, ep
         print("Lỗi KNN: Không có láng giềng nào để chọn (actual_k = 0).")
         return None
     k_nearest = distances_to_fingerprints[:actual_k]
+    return _knn_centroid(k_nearest, weighted, epsilon)
 
+def _knn_centroid(k_nearest, weighted, epsilon):
+    """Trọng tâm (có hoặc không trọng số 1/khoảng cách) của k láng giềng ((hàng, cột), khoảng cách)."""
+    actual_k = len(k_nearest)
 
     if not weighted:
         sum_r, sum_c = 0, 0
@@ -66,44 +132,455 @@ def predict_location_knn(observed_rssi, fingerprints_data, k, weighted=False, ep
             estimated_c = weighted_sum_c / sum_weights
     return (estimated_r, estimated_c)
 
+def _batch_centroids(cells_rc, distances, weighted, epsilon):
+    """
+    Phiên bản vector hóa của _knn_centroid cho nhiều truy vấn.
+    cells_rc: (M, K, 2) tọa độ láng giềng; distances: (M, K) khoảng cách RSSI. Trả về (M, 2).
+    """
+    if not weighted:
+        return cells_rc.mean(axis=1)
+    weights = 1 / (distances + epsilon)
+    sum_weights = weights.sum(axis=1)
+    zero_weights = sum_weights == 0
+    if np.any(zero_weights):
+        print("Cảnh báo KNN: Tổng trọng số bằng 0, sử dụng KNN không trọng số.")
+    safe_sum = np.where(zero_weights, 1.0, sum_weights)
+    estimates = np.einsum('mk,mkj->mj', weights, cells_rc) / safe_sum[:, None]
+    return np.where(zero_weights[:, None], cells_rc.mean(axis=1), estimates)
+
+def predict_locations_knn_batch(observations, fingerprints_data, k=None, weighted=None, epsilon=None):
+    """
+    KNN theo lô cho M lần quét (ví dụ cả đoàn xe trong một nhịp).
+    observations: mảng (M, AP) các vector RSSI quan sát.
+    fingerprints_data: như predict_location_knn (trừ dict).
+    k, weighted, epsilon: mặc định config.K_NEIGHBORS, USE_WEIGHTED_KNN, EPSILON_WEIGHT.
+    Khoảng cách tới mọi fingerprint được tính bằng khai triển ||a||^2 + ||b||^2 - 2ab
+    (một phép nhân ma trận cho mỗi khối truy vấn; dạng gọn chỉ được giải nén theo từng khối hàng
+    fingerprint); số hàng mỗi khối truy vấn được chọn để ma trận khoảng cách không vượt
+    config.KNN_BATCH_MAX_BYTES.
+    Trả về mảng float64 (M, 2) các vị trí ước tính (hàng, cột), hoặc None nếu không có fingerprint.
+    """
+    k = config.K_NEIGHBORS if k is None else k
+    weighted = config.USE_WEIGHTED_KNN if weighted is None else weighted
+    epsilon = config.EPSILON_WEIGHT if epsilon is None else epsilon
+
+    if isinstance(fingerprints_data, KNN_INDEX_TYPES):
+        # Chỉ mục dựng sẵn trả lời từng truy vấn một (mỗi truy vấn đã dưới 1 ms)
+        estimates = [predict_location_knn(o, fingerprints_data, k, weighted, epsilon) for o in observations]
+        if any(e is None for e in estimates):
+            return None
+        return np.asarray(estimates, dtype=np.float64).reshape(-1, 2)
+
+    fingerprint_matrix = as_fingerprint_matrix(fingerprints_data)
+    observations = np.asarray(observations, dtype=np.float64)
+    if observations.ndim != 2 or observations.shape[1] != fingerprint_matrix.num_aps:
+        raise ValueError("Các vector RSSI phải có cùng độ dài")
+    norms_sq = fingerprint_matrix.squared_norms()
+    num_points = norms_sq.shape[0]
+    actual_k = min(k, num_points)
+    if actual_k <= 0:
+        print("Lỗi KNN: Không có điểm nào trong fingerprint map.")
+        return None
+
+    cells_rc = np.column_stack(fingerprint_matrix.cell_positions()).astype(np.float64)
+    num_queries = observations.shape[0]
+    estimates = np.empty((num_queries, 2))
+    chunk_rows = max(1, int(config.KNN_BATCH_MAX_BYTES // (num_points * 8)))
+    for start in range(0, num_queries, chunk_rows):
+        chunk = observations[start:start + chunk_rows]
+        dist_sq = norms_sq[None, :] - 2 * fingerprint_matrix.dot_products(chunk)
+        dist_sq += np.einsum('ij,ij->i', chunk, chunk)[:, None]
+        nearest_idx = np.argpartition(dist_sq, actual_k - 1, axis=1)[:, :actual_k]
+        nearest_dist_sq = np.take_along_axis(dist_sq, nearest_idx, axis=1)
+        # Sai số làm tròn của khai triển có thể cho giá trị âm rất nhỏ
+        distances = np.sqrt(np.maximum(nearest_dist_sq, 0.0))
+        estimates[start:start + chunk_rows] = _batch_centroids(cells_rc[nearest_idx], distances, weighted, epsilon)
+    return estimates
+
+class SpatialBucketIndex:
+    """
+    Chỉ mục không gian của các điểm fingerprint theo ô lưới: mỗi xô (bucket) là một ô vuông
+    bucket_size x bucket_size ô lưới, các điểm được sắp theo xô (dạng CSR: order + bucket_starts)
+    để lấy nhanh các điểm quanh một vị trí.
+    """
+
+    def __init__(self, cells_r, cells_c, bucket_size=None):
+        self.bucket_size = max(1, int(config.TRACKING_BUCKET_SIZE_CELLS if bucket_size is None else bucket_size))
+        self.cells_r = np.asarray(cells_r, dtype=np.int64)
+        self.cells_c = np.asarray(cells_c, dtype=np.int64)
+        bucket_r = self.cells_r // self.bucket_size
+        bucket_c = self.cells_c // self.bucket_size
+        self.num_bucket_rows = int(bucket_r.max()) + 1 if bucket_r.size else 0
+        self.num_bucket_cols = int(bucket_c.max()) + 1 if bucket_c.size else 0
+        bucket_ids = bucket_r * self.num_bucket_cols + bucket_c
+        self.order = np.argsort(bucket_ids, kind='stable') # Chỉ số điểm, sắp theo xô
+        counts = np.bincount(bucket_ids, minlength=self.num_bucket_rows * self.num_bucket_cols)
+        self.bucket_starts = np.concatenate([[0], np.cumsum(counts)])
+
+    def points_within(self, center_rc, radius_cells):
+        """Chỉ số các điểm cách center_rc (hàng, cột) không quá radius_cells ô."""
+        if self.order.size == 0:
+            return self.order
+        r0 = max(int(math.floor((center_rc[0] - radius_cells) / self.bucket_size)), 0)
+        r1 = min(int(math.floor((center_rc[0] + radius_cells) / self.bucket_size)), self.num_bucket_rows - 1)
+        c0 = max(int(math.floor((center_rc[1] - radius_cells) / self.bucket_size)), 0)
+        c1 = min(int(math.floor((center_rc[1] + radius_cells) / self.bucket_size)), self.num_bucket_cols - 1)
+        if r0 > r1 or c0 > c1:
+            return self.order[:0]
+        # Các xô trên cùng một hàng xô nằm liền nhau trong order
+        row_ids = np.arange(r0, r1 + 1) * self.num_bucket_cols
+        starts = self.bucket_starts[row_ids + c0]
+        ends = self.bucket_starts[row_ids + c1 + 1]
+        candidates = np.concatenate([self.order[b:e] for b, e in zip(starts, ends)])
+        dist_sq = (self.cells_r[candidates] - center_rc[0]) ** 2 + (self.cells_c[candidates] - center_rc[1]) ** 2
+        return candidates[dist_sq <= radius_cells ** 2]
+
+class KNNTracker:
+    """
+    KNN bám vết cho một xe đang di chuyển: chỉ so sánh với các fingerprint trong bán kính
+    đi bộ radius_m (nhưng không dưới min_radius_cells ô) quanh ước tính trước (lấy từ
+    SpatialBucketIndex), thay vì cả bản đồ. Ước tính trước trễ hơn vị trí thật, nên bán kính
+    chỉ bằng một bước đi thường bỏ sót ô thật.
+    Tìm kiếm toàn cục khi chưa có ước tính trước, không có ứng viên, hoặc khi láng giềng
+    gần nhất vẫn cách quá fallback_distance_db (xe đã đi xa hơn dự kiến hoặc ước tính trước sai).
+    global_index: tùy chọn, ví dụ FingerprintKDTree, dùng cho tìm kiếm toàn cục.
+    """
+
+    def __init__(self, fingerprints_data, k=None, weighted=None, epsilon=None, radius_m=None,
+                 fallback_distance_db=None, global_index=None, min_radius_cells=None):
+        self.fingerprint_matrix = as_fingerprint_matrix(fingerprints_data)
+        self.k = config.K_NEIGHBORS if k is None else k
+        self.weighted = config.USE_WEIGHTED_KNN if weighted is None else weighted
+        self.epsilon = config.EPSILON_WEIGHT if epsilon is None else epsilon
+        self.radius_m = config.TRACKING_RADIUS_M if radius_m is None else radius_m
+        self.min_radius_cells = config.TRACKING_MIN_RADIUS_CELLS if min_radius_cells is None else min_radius_cells
+        self.fallback_distance_db = config.TRACKING_FALLBACK_DISTANCE_DB \
+            if fallback_distance_db is None else fallback_distance_db
+        self.global_index = global_index
+        self.bucket_index = SpatialBucketIndex(*self.fingerprint_matrix.cell_positions())
+        self.last_estimate = None
+        self.num_local_searches = 0
+        self.num_global_searches = 0
+
+    def reset(self, last_estimate=None):
+        """Bắt đầu bám vết lại, tùy chọn từ một ước tính (hàng, cột) đã biết."""
+        self.last_estimate = last_estimate
+
+    def _global_neighbours(self, observed_rssi):
+        self.num_global_searches += 1
+        if self.global_index is not None:
+            return self.global_index.query_neighbours(observed_rssi, self.k)
+        return _matrix_knn_neighbours(observed_rssi, self.fingerprint_matrix, self.k)
+
+    def _local_neighbours(self, observed_rssi):
+        radius_cells = max(self.radius_m / config.GRID_RESOLUTION_M, self.min_radius_cells)
+        candidates = self.bucket_index.points_within(self.last_estimate, radius_cells)
+        if candidates.size == 0:
+            return []
+        self.num_local_searches += 1
+        diff = self.fingerprint_matrix.decode_rows(candidates) - np.asarray(observed_rssi, dtype=np.float32)
+        dist_sq = np.einsum('ij,ij->i', diff, diff)
+        actual_k = min(self.k, dist_sq.shape[0])
+        nearest = np.argpartition(dist_sq, actual_k - 1)[:actual_k]
+        nearest = nearest[np.argsort(dist_sq[nearest], kind='stable')]
+        cells_r, cells_c = self.bucket_index.cells_r, self.bucket_index.cells_c
+        return [((int(cells_r[candidates[i]]), int(cells_c[candidates[i]])),
+                 math.sqrt(float(dist_sq[i])))
+                for i in nearest]
+
+    def predict(self, observed_rssi):
+        """Ước tính vị trí (hàng, cột) cho lần quét tiếp theo, hoặc None nếu không có fingerprint."""
+        if len(observed_rssi) != self.fingerprint_matrix.num_aps:
+            raise ValueError("Các vector RSSI phải có cùng độ dài")
+        k_nearest = []
+        if self.last_estimate is not None:
+            k_nearest = self._local_neighbours(observed_rssi)
+        if not k_nearest or k_nearest[0][1] > self.fallback_distance_db:
+            k_nearest = self._global_neighbours(observed_rssi)
+        if not k_nearest:
+            print("Lỗi KNN: Không có điểm nào trong fingerprint map.")
+            return None
+        self.last_estimate = _knn_centroid(k_nearest, self.weighted, self.epsilon)
+        return self.last_estimate
+
+class LocalizationResultCache:
+    """
+    Bộ đệm LRU có giới hạn đặt trước KNN: xe đứng yên hoặc đi chậm gửi lại gần như cùng một lần
+    quét, nên kết quả được tra theo vector RSSI làm tròn tới bước quantization_db (dB).
+    Hai lần quét rơi vào cùng một ô lượng tử nhận cùng một ước tính.
+    Mọi mục bị xóa (invalidate) khi nguồn fingerprint đổi: đối tượng fingerprints_data khác
+    (update_rssi_fingerprints_from_map trả về tensor mới), source_version khác
+    (ví dụ SupermarketMap.layout_version), hoặc tham số k/weighted/epsilon khác.
+    """
+
+    def __init__(self, max_entries=None, quantization_db=None):
+        self.max_entries = config.RESULT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.quantization_db = config.RESULT_CACHE_QUANTIZATION_DB if quantization_db is None else quantization_db
+        self._entries = collections.OrderedDict() # khóa lượng tử -> (hàng, cột), mục dùng gần nhất ở cuối
+        self._source = None
+        self._source_signature = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _key(self, observed_rssi):
+        observed_rssi = np.nan_to_num(np.asarray(observed_rssi, dtype=np.float64), nan=config.MIN_RSSI_THRESHOLD)
+        return np.rint(observed_rssi / self.quantization_db).astype(np.int32).tobytes()
+
+    def _signature(self, k, weighted, epsilon, source_version):
+        return (config.K_NEIGHBORS if k is None else k,
+                config.USE_WEIGHTED_KNN if weighted is None else weighted,
+                config.EPSILON_WEIGHT if epsilon is None else epsilon,
+                source_version)
+
+    def invalidate(self):
+        """Xóa mọi kết quả đã lưu (bộ đếm hit/miss/eviction được giữ nguyên)."""
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+
+    def _check_source(self, fingerprints_data, signature):
+        if fingerprints_data is not self._source or signature != self._source_signature:
+            self.invalidate()
+            self._source, self._source_signature = fingerprints_data, signature
+
+    def lookup(self, observed_rssi, fingerprints_data, k=None, weighted=None, epsilon=None, source_version=None):
+        """Kết quả đã lưu cho lần quét này (và đánh dấu dùng gần nhất), hoặc None nếu chưa có."""
+        self._check_source(fingerprints_data, self._signature(k, weighted, epsilon, source_version))
+        key = self._key(observed_rssi)
+        estimate = self._entries.get(key)
+        if estimate is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return estimate
+
+    def store(self, observed_rssi, estimate, fingerprints_data, k=None, weighted=None, epsilon=None,
+              source_version=None):
+        """Lưu ước tính (hàng, cột) cho lần quét; bỏ mục ít dùng nhất khi vượt max_entries."""
+        if estimate is None or self.max_entries <= 0:
+            return
+        self._check_source(fingerprints_data, self._signature(k, weighted, epsilon, source_version))
+        key = self._key(observed_rssi)
+        self._entries[key] = estimate
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def predict(self, observed_rssi, fingerprints_data, k=None, weighted=None, epsilon=None, source_version=None):
+        """predict_location_knn đi qua bộ đệm: chỉ tính KNN khi lần quét (đã lượng tử) chưa có trong bộ đệm."""
+        estimate = self.lookup(observed_rssi, fingerprints_data, k, weighted, epsilon, source_version)
+        if estimate is not None:
+            return estimate
+        k, weighted, epsilon, _ = self._signature(k, weighted, epsilon, source_version)
+        estimate = predict_location_knn(observed_rssi, fingerprints_data, k, weighted, epsilon)
+        self.store(observed_rssi, estimate, fingerprints_data, k, weighted, epsilon, source_version)
+        return estimate
+
+    def stats(self):
+        """Số mục hiện có, hit/miss/eviction/invalidation và tỉ lệ hit."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+def verify_knn_index(index, fingerprints_data, observations, k=None, weighted=None, epsilon=None):
+    """
+    Đối chiếu chỉ mục (FingerprintKDTree, FingerprintIVFIndex) với KNN vét cạn trên cùng
+    fingerprints_data cho các vector quan sát trong `observations` (mảng (M, AP)).
+    Trả về dict: số truy vấn, số truy vấn có cùng tập K láng giềng, số truy vấn có cùng
+    khoảng cách K láng giềng (khác tập chỉ khi có điểm cách đều), recall@K (tỉ lệ trung bình
+    láng giềng chính xác mà chỉ mục tìm được), sai khác ước tính lớn nhất (ô)
+    và thời gian trung bình mỗi truy vấn (ms) của hai cách.
+    """
+    k = config.K_NEIGHBORS if k is None else k
+    weighted = config.USE_WEIGHTED_KNN if weighted is None else weighted
+    epsilon = config.EPSILON_WEIGHT if epsilon is None else epsilon
+    fingerprint_matrix = as_fingerprint_matrix(fingerprints_data)
+    observations = np.asarray(observations, dtype=np.float64).reshape(-1, fingerprint_matrix.num_aps)
+
+    same_neighbours, same_distances, max_estimate_diff, recall_sum = 0, 0, 0.0, 0.0
+    brute_time, index_time = 0.0, 0.0
+    for observed_rssi in observations:
+        t_start = time.perf_counter()
+        brute_nearest = _matrix_knn_neighbours(observed_rssi, fingerprint_matrix, k)
+        brute_time += time.perf_counter() - t_start
+        t_start = time.perf_counter()
+        index_nearest = index.query_neighbours(observed_rssi, k)
+        index_time += time.perf_counter() - t_start
+
+        brute_cells = {cell for cell, _ in brute_nearest}
+        index_cells = {cell for cell, _ in index_nearest}
+        if brute_cells == index_cells:
+            same_neighbours += 1
+        if brute_cells:
+            recall_sum += len(brute_cells & index_cells) / len(brute_cells)
+        if np.allclose([d for _, d in brute_nearest], [d for _, d in index_nearest]):
+            same_distances += 1
+        if brute_nearest and index_nearest:
+            brute_estimate = _knn_centroid(brute_nearest, weighted, epsilon)
+            index_estimate = _knn_centroid(index_nearest, weighted, epsilon)
+            max_estimate_diff = max(max_estimate_diff, math.dist(brute_estimate, index_estimate))
+
+    num_queries = observations.shape[0]
+    return {
+        "num_queries": num_queries,
+        "same_neighbours": same_neighbours,
+        "same_distances": same_distances,
+        "recall_at_k": recall_sum / max(num_queries, 1),
+        "max_estimate_diff_cells": max_estimate_diff,
+        "brute_force_ms_per_query": brute_time / max(num_queries, 1) * 1e3,
+        "index_ms_per_query": index_time / max(num_queries, 1) * 1e3,
+    }
+
+class _TrackedAStarFinder(AStarFinder):
+    """AStarFinder ghi lại các nút đã đụng tới để chỉ dọn các nút đó sau khi tìm đường."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.touched_nodes = []
+
+    def process_node(self, graph, node, parent, end, open_list, open_value=True):
+        if not node.opened:
+            self.touched_nodes.append(node)
+        super().process_node(graph, node, parent, end, open_list, open_value)
+
+def _checked_path_endpoints(grid_astar, start_node_rc, end_node_rc):
+    """
+    Điểm đầu/cuối dạng (int, int) nếu cả hai là ô đi được, None (kèm thông báo) nếu một trong hai
+    là vật cản; IndexError nếu nằm ngoài lưới.
+    """
+    start_node_rc = (int(start_node_rc[0]), int(start_node_rc[1]))
+    end_node_rc = (int(end_node_rc[0]), int(end_node_rc[1]))
+    for node_rc in (start_node_rc, end_node_rc):
+        if not (0 <= node_rc[0] < grid_astar.num_rows and 0 <= node_rc[1] < grid_astar.num_cols):
+            raise IndexError(f"({node_rc[0]}, {node_rc[1]}) nằm ngoài lưới")
+    if not grid_astar.is_walkable(start_node_rc):
+        print(f"Lỗi tìm đường: Điểm bắt đầu ({start_node_rc}) là vật cản trong pathfinding matrix.")
+        return None
+    if not grid_astar.is_walkable(end_node_rc):
+        print(f"Lỗi tìm đường: Điểm kết thúc ({end_node_rc}) là vật cản trong pathfinding matrix.")
+        return None
+    return start_node_rc, end_node_rc
+
 def find_path_astar(supermarket_map_obj, start_node_rc, end_node_rc):
     """
     Tìm đường đi ngắn nhất bằng thuật toán A*.
     supermarket_map_obj: instance của SupermarketMap.
     start_node_rc: (hàng, cột) của điểm bắt đầu.
     end_node_rc: (hàng, cột) của điểm kết thúc.
+    Dùng A* tự viết trên chỉ số phẳng (grid_pathfinding.GridAStar, do bản đồ giữ và dùng lại);
+    trả về danh sách (hàng, cột) từ điểm bắt đầu tới điểm kết thúc, hoặc None.
+    """
+    try:
+        grid_astar = supermarket_map_obj.get_grid_astar()
+        endpoints = _checked_path_endpoints(grid_astar, start_node_rc, end_node_rc)
+        if endpoints is None:
+            return None
+        start_node_rc, end_node_rc = endpoints
+
+        path_rc = grid_astar.find_path(start_node_rc, end_node_rc)
+        if path_rc:
+            return path_rc
+        print(f"A* không tìm thấy đường từ {start_node_rc} đến {end_node_rc}.")
+        return None
+    except IndexError as e:
+        print(f"Lỗi IndexError khi tìm đường (có thể điểm ra ngoài biên): {e}")
+        print(f"  Start: {start_node_rc}, End: {end_node_rc}, Map dims: {supermarket_map_obj.num_rows}x{supermarket_map_obj.num_cols}")
+        return None
+
+def find_path_flow_field(supermarket_map_obj, start_node_rc, end_node_rc, flow_field_cache):
+    """
+    Như find_path_astar nhưng đi theo trường khoảng cách-tới-đích của end_node_rc
+    (flow_fields.FlowFieldCache): trường được tính một lần cho mỗi đích và bố cục, các xe sau
+    cùng tới đích đó chỉ còn đi xuống dần theo trường. Hợp khi nhiều xe cùng tới một mặt hàng.
     """
-    grid_data_for_pathfinding = supermarket_map_obj.grid_map
-    matrix = []
-    for r_idx in range(grid_data_for_pathfinding.shape[0]):
-        row_data = []
-        for c_idx in range(grid_data_for_pathfinding.shape[1]):
-            # Thư viện pathfinding: >0 là đi được (trọng số), <=0 là vật cản
-            if grid_data_for_pathfinding[r_idx, c_idx] == PATHWAY_ID or \
-               grid_data_for_pathfinding[r_idx, c_idx] == AP_ID: # Coi ô AP cũng là lối đi
-                row_data.append(1)
-            else: # Tất cả các ID khác (OBSTACLE, STALL, ITEM) là vật cản
-                row_data.append(0)
-        matrix.append(row_data)
+    try:
+        grid_astar = supermarket_map_obj.get_grid_astar()
+        endpoints = _checked_path_endpoints(grid_astar, start_node_rc, end_node_rc)
+        if endpoints is None:
+            return None
+        start_node_rc, end_node_rc = endpoints
 
+        path_rc = flow_field_cache.find_path(supermarket_map_obj, start_node_rc, end_node_rc)
+        if path_rc:
+            return path_rc
+        print(f"Flow field không tìm thấy đường từ {start_node_rc} đến {end_node_rc}.")
+        return None
+    except IndexError as e:
+        print(f"Lỗi IndexError khi tìm đường (có thể điểm ra ngoài biên): {e}")
+        print(f"  Start: {start_node_rc}, End: {end_node_rc}, Map dims: {supermarket_map_obj.num_rows}x{supermarket_map_obj.num_cols}")
+        return None
+
+def find_path_hierarchical(supermarket_map_obj, start_node_rc, end_node_rc):
+    """
+    Như find_path_astar nhưng dùng tìm đường phân cấp HPA* (hierarchical_pathfinding, đồ thị cụm
+    do bản đồ giữ và cập nhật theo từng cụm khi bố cục đổi): tìm trên đồ thị lối vào giữa các cụm
+    trước rồi tinh chỉnh từng chặng ngắn. Nhanh hơn nhiều trên lưới độ phân giải cao; đường đi
+    gần tối ưu (có thể dài hơn đường của find_path_astar vài phần trăm).
+    """
     try:
-        path_grid = PathfindingGrid(matrix=matrix) # Sử dụng tên đã import
+        hierarchical_pathfinder = supermarket_map_obj.get_hierarchical_pathfinder()
+        endpoints = _checked_path_endpoints(hierarchical_pathfinder.grid_astar, start_node_rc, end_node_rc)
+        if endpoints is None:
+            return None
+        start_node_rc, end_node_rc = endpoints
 
-        start_pf_node = path_grid.node(start_node_rc[1], start_node_rc[0]) # (col, row)
-        end_pf_node = path_grid.node(end_node_rc[1], end_node_rc[0])     # (col, row)
+        path_rc = hierarchical_pathfinder.find_path(start_node_rc, end_node_rc)
+        if path_rc:
+            return path_rc
+        print(f"HPA* không tìm thấy đường từ {start_node_rc} đến {end_node_rc}.")
+        return None
+    except IndexError as e:
+        print(f"Lỗi IndexError khi tìm đường (có thể điểm ra ngoài biên): {e}")
+        print(f"  Start: {start_node_rc}, End: {end_node_rc}, Map dims: {supermarket_map_obj.num_rows}x{supermarket_map_obj.num_cols}")
+        return None
 
-        if not start_pf_node.walkable:
+def find_path_astar_pathfinding(supermarket_map_obj, start_node_rc, end_node_rc):
+    """
+    Như find_path_astar nhưng dùng thư viện pathfinding (AStarFinder); giữ lại để đối chiếu
+    và benchmark (xem pathfinding_benchmark.py).
+    Lưới pathfinding do supermarket_map_obj giữ và dùng lại giữa các lần gọi; sau mỗi lần tìm
+    chỉ các nút đã được mở mới bị dọn, thay vì dựng lại (hoặc dọn toàn bộ) lưới.
+    """
+    try:
+        walkable = supermarket_map_obj.get_walkable_mask()
+        num_rows, num_cols = walkable.shape
+        for node_rc in (start_node_rc, end_node_rc):
+            if not (0 <= node_rc[0] < num_rows and 0 <= node_rc[1] < num_cols):
+                raise IndexError(f"({node_rc[0]}, {node_rc[1]}) nằm ngoài lưới")
+        if not walkable[start_node_rc[0], start_node_rc[1]]:
             print(f"Lỗi tìm đường: Điểm bắt đầu ({start_node_rc}) là vật cản trong pathfinding matrix.")
             return None
-        if not end_pf_node.walkable:
+        if not walkable[end_node_rc[0], end_node_rc[1]]:
             print(f"Lỗi tìm đường: Điểm kết thúc ({end_node_rc}) là vật cản trong pathfinding matrix.")
             return None
 
-        finder = AStarFinder(diagonal_movement=DiagonalMovement.never) # Chỉ đi ngang/dọc cho đơn giản
-        path, runs = finder.find_path(start_pf_node, end_pf_node, path_grid)
+        path_grid = supermarket_map_obj.get_pathfinding_grid()
+        start_pf_node = path_grid.node(start_node_rc[1], start_node_rc[0]) # (col, row)
+        end_pf_node = path_grid.node(end_node_rc[1], end_node_rc[0])     # (col, row)
+
+        finder = _TrackedAStarFinder(diagonal_movement=DiagonalMovement.never) # Chỉ đi ngang/dọc cho đơn giản
+        path_grid.dirty = False # Trạng thái nút đã được dọn sau lần tìm trước, không cần dọn toàn bộ
+        try:
+            path, runs = finder.find_path(start_pf_node, end_pf_node, path_grid)
+            path_rc = [(node.y, node.x) for node in path] # Chuyển lại (hàng, cột)
+        finally:
+            for node in [start_pf_node] + finder.touched_nodes:
+                node.cleanup()
+            path_grid.dirty = False
 
-        if path:
-            return [(node.y, node.x) for node in path] # Chuyển lại (hàng, cột)
+        if path_rc:
+            return path_rc
         else:
             print(f"A* không tìm thấy đường từ {start_node_rc} đến {end_node_rc}.")
             return None
@@ -0,0 +1,217 @@
+# localization_benchmark.py
+# Benchmark độ chính xác và thông lượng của các bộ định vị: dựng bản đồ (bố cục demo của
+# main_speech_interactive và các bố cục tổng hợp lớn hơn), tạo fingerprint, chạy quan sát từ
+# mọi ô có fingerprint qua từng bộ định vị và ghi kết quả (truy vấn/giây, độ trễ p50/p95/p99,
+# CDF sai số theo mét) ra JSON để so sánh giữa các phiên bản.
+#
+# Ví dụ: python localization_benchmark.py --layouts demo synthetic-100x60 --output bench.json
+import argparse
+import datetime
+import json
+import subprocess
+import time
+import numpy as np
+import config
+import noise_models
+import rssi_simulation
+import fingerprint_cache
+import fingerprint_storage
+import localization_algorithms
+import store_layouts
+import trilateration
+from fingerprint_index import FingerprintKDTree, FingerprintIVFIndex
+from particle_filter import ParticleFilterLocalizer
+
+# Tên bố cục -> hàm dựng SupermarketMap (kích thước theo mét, độ phân giải theo config)
+LAYOUTS = {
+    "demo": lambda: store_layouts.build_demo_supermarket(quiet=True),
+    "synthetic-100x60": lambda: store_layouts.build_synthetic_supermarket(100, 60),
+    "synthetic-200x120": lambda: store_layouts.build_synthetic_supermarket(200, 120),
+    "synthetic-400x240": lambda: store_layouts.build_synthetic_supermarket(400, 240),
+}
+DEFAULT_LAYOUTS = ("demo", "synthetic-100x60")
+
+ERROR_CDF_THRESHOLDS_M = (0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+PERCENTILES = (50, 95, 99)
+
+# --- Các bộ định vị ---
+# Mỗi mục: tên -> (hàm dựng, số lần quét mỗi lời gọi). Hàm dựng nhận (supermarket, fingerprint_matrix)
+# và trả về hàm định vị nhận một lô quan sát (M, AP) và trả về danh sách M ước tính (hàng, cột) hoặc None.
+# Bộ định vị bám vết (tracker, particle) nhận các quan sát như một lộ trình liên tiếp.
+
+def _per_query(predict_fn):
+    return lambda observations: [predict_fn(observed_rssi) for observed_rssi in observations]
+
+def _knn_engine(source_factory):
+    def build(supermarket, fingerprint_matrix):
+        source = source_factory(fingerprint_matrix)
+        return _per_query(lambda obs: localization_algorithms.predict_location_knn(
+            obs, source, config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT))
+    return build
+
+def _build_batch(supermarket, fingerprint_matrix):
+    return lambda observations: localization_algorithms.predict_locations_knn_batch(observations, fingerprint_matrix)
+
+def _build_trilateration(supermarket, fingerprint_matrix):
+    """Không dùng fingerprint: đảo mô hình log-distance (xem trilateration.py)."""
+    return lambda observations: trilateration.predict_locations_trilateration_batch(observations, supermarket)
+
+def _build_tracker(supermarket, fingerprint_matrix):
+    return _per_query(localization_algorithms.KNNTracker(fingerprint_matrix).predict)
+
+def _build_particle(supermarket, fingerprint_matrix):
+    particle_filter = ParticleFilterLocalizer(supermarket, fingerprint_matrix, seed=0)
+    particle_filter.reset()
+    return _per_query(particle_filter.predict)
+
+ENGINES = {
+    "brute": (_knn_engine(lambda fingerprint_matrix: fingerprint_matrix), 1),
+    "batch": (_build_batch, 256), # Độ trễ của mỗi lần quét là thời gian xử lý cả lô chứa nó
+    "kdtree": (_knn_engine(FingerprintKDTree), 1),
+    "ivf": (_knn_engine(FingerprintIVFIndex), 1),
+    "trilateration": (_build_trilateration, 256),
+    "tracker": (_build_tracker, 1),
+    "particle": (_build_particle, 1),
+}
+
+# --- Thống kê ---
+
+def git_commit_hash():
+    """Mã commit hiện tại (nếu chạy trong kho git), để gắn kết quả với phiên bản mã."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def summarize_values(values):
+    if values.size == 0:
+        return None
+    summary = {"mean": float(values.mean())}
+    summary.update({f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES})
+    summary["max"] = float(values.max())
+    return summary
+
+def _serpentine_order(cells_r, cells_c):
+    """Thứ tự quét kiểu luống cày (hàng chẵn trái->phải, hàng lẻ phải->trái) để các ô liên tiếp kề nhau."""
+    return np.lexsort((np.where(cells_r % 2 == 0, cells_c, -cells_c), cells_r))
+
+def benchmark_engine(engine_name, supermarket, fingerprint_matrix, observations, true_cells):
+    """
+    Chạy một bộ định vị trên mọi quan sát; trả về dict thời gian dựng, thông lượng,
+    độ trễ (ms) và sai số (m) so với ô thực true_cells.
+    """
+    build_fn, batch_size = ENGINES[engine_name]
+    t_start = time.perf_counter()
+    localize = build_fn(supermarket, fingerprint_matrix)
+    setup_s = time.perf_counter() - t_start
+
+    num_queries = observations.shape[0]
+    estimates = np.full((num_queries, 2), np.nan)
+    latencies = np.empty(num_queries)
+    busy_s = 0.0
+    for start in range(0, num_queries, batch_size):
+        chunk = slice(start, start + batch_size)
+        t_start = time.perf_counter()
+        results = localize(observations[chunk])
+        elapsed = time.perf_counter() - t_start
+        busy_s += elapsed
+        latencies[chunk] = elapsed
+        for i, estimate in enumerate(results, start):
+            if estimate is not None:
+                estimates[i] = estimate
+
+    located = ~np.isnan(estimates[:, 0])
+    errors_m = np.array([rssi_simulation.euclidean_distance_m(estimate, true_rc)
+                         for estimate, true_rc in zip(estimates[located], true_cells[located])])
+    error_summary = summarize_values(errors_m)
+    if error_summary is not None:
+        error_summary["cdf"] = {str(threshold): float(np.mean(errors_m <= threshold))
+                                for threshold in ERROR_CDF_THRESHOLDS_M}
+    return {
+        "num_queries": num_queries,
+        "num_failed": int(num_queries - located.sum()),
+        "batch_size": batch_size,
+        "setup_s": setup_s, # Dựng chỉ mục/bộ lọc, không tính vào thông lượng
+        "qps": num_queries / busy_s if busy_s > 0 else None,
+        "latency_ms": summarize_values(latencies * 1e3),
+        "error_m": error_summary,
+    }
+
+def benchmark_layout(layout_name, engine_names, max_queries=None, seed=0):
+    """Dựng bố cục, tạo fingerprint và quan sát, rồi benchmark từng bộ định vị."""
+    print(f"--- Bố cục '{layout_name}' ---")
+    supermarket = LAYOUTS[layout_name]()
+    # Fingerprint dùng rng riêng từ seed, quan sát dùng rng của mô hình nhiễu (seed + 1) để hai
+    # chuỗi nhiễu độc lập; trường bóng mờ (nếu có) vẫn dùng chung vì là thuộc tính của môi trường
+    noise_model = noise_models.create_noise_model(seed=seed + 1)
+
+    t_start = time.perf_counter()
+    fingerprints = rssi_simulation.generate_rssi_fingerprints_from_map(supermarket, seed=seed,
+                                                                      noise_model=noise_model)
+    fingerprint_time_s = time.perf_counter() - t_start
+    fingerprint_matrix = localization_algorithms.as_fingerprint_matrix(fingerprint_storage.to_storage_mode(fingerprints))
+
+    # Mỗi ô có fingerprint là một vị trí quan sát (tùy chọn lấy mẫu ngẫu nhiên max_queries ô)
+    cells_r, cells_c = fingerprint_matrix.cell_positions()
+    if max_queries is not None and cells_r.shape[0] > max_queries:
+        chosen = np.random.default_rng(seed).choice(cells_r.shape[0], max_queries, replace=False)
+        cells_r, cells_c = cells_r[chosen], cells_c[chosen]
+    order = _serpentine_order(cells_r, cells_c)
+    true_cells = np.column_stack([cells_r[order], cells_c[order]])
+    observations = rssi_simulation.get_observed_rssi_batch_on_map(supermarket, true_cells,
+                                                                  noise_model=noise_model)
+
+    result = {
+        "grid_shape": list(supermarket.grid_map.shape),
+        "num_aps": len(supermarket.access_points),
+        "num_fingerprints": int(fingerprint_matrix.values.shape[0]),
+        "fingerprint_storage_mode": fingerprint_matrix.mode,
+        "fingerprint_bytes": int(fingerprint_matrix.nbytes),
+        "fingerprint_time_s": fingerprint_time_s,
+        "engines": {},
+    }
+    print(f"Lưới {result['grid_shape']}, {result['num_aps']} AP, {result['num_fingerprints']} fingerprint "
+          f"(tạo trong {fingerprint_time_s:.2f}s), {observations.shape[0]} truy vấn.")
+    for engine_name in engine_names:
+        engine_result = benchmark_engine(engine_name, supermarket, fingerprint_matrix, observations, true_cells)
+        result["engines"][engine_name] = engine_result
+        latency, error = engine_result["latency_ms"], engine_result["error_m"] or {}
+        qps = engine_result["qps"] if engine_result["qps"] is not None else float('nan')
+        print(f"  {engine_name:>13}: {qps:10.1f} truy vấn/s | độ trễ p50/p95/p99 "
+              f"{latency['p50']:.3f}/{latency['p95']:.3f}/{latency['p99']:.3f} ms | sai số trung bình "
+              f"{error.get('mean', float('nan')):.2f} m, p95 {error.get('p95', float('nan')):.2f} m")
+    return result
+
+def run_benchmark(layout_names=DEFAULT_LAYOUTS, engine_names=tuple(ENGINES), max_queries=None, seed=0):
+    """Benchmark toàn bộ; trả về dict kết quả (kèm phiên bản mã và tham số) sẵn sàng ghi JSON."""
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit_hash(),
+        "fingerprint_format_version": fingerprint_cache.FINGERPRINT_FORMAT_VERSION,
+        "radio_model": fingerprint_cache.radio_model_params(),
+        "knn": {"k": config.K_NEIGHBORS, "weighted": config.USE_WEIGHTED_KNN,
+                "ivf_nprobe": config.IVF_NPROBE, "kdtree_leaf_size": config.KDTREE_LEAF_SIZE},
+        "seed": seed,
+        "max_queries": max_queries,
+        "layouts": {layout_name: benchmark_layout(layout_name, engine_names, max_queries, seed)
+                    for layout_name in layout_names},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark độ chính xác và thông lượng định vị WinCart")
+    parser.add_argument("--layouts", nargs="+", choices=sorted(LAYOUTS), default=list(DEFAULT_LAYOUTS))
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument("--max-queries", type=int, default=None,
+                        help="Giới hạn số ô quan sát mỗi bố cục (lấy mẫu ngẫu nhiên); mặc định mọi ô")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="localization_benchmark.json", help="File JSON kết quả")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.layouts, args.engines, args.max_queries, args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Đã ghi kết quả benchmark vào {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# localization_service.py
+# Dịch vụ định vị chạy nền (không cần giao diện) bằng asyncio.
+# Giao thức: JSON theo dòng (NDJSON) qua TCP hoặc UNIX socket.
+#   Yêu cầu:  {"cart_id": "xe-1", "seq": 7, "rssi": [-52.1, -60.3, ...]}
+#   Trả lời:  {"cart_id": "xe-1", "seq": 7, "position": [hàng, cột]}
+#             hoặc {"cart_id": ..., "seq": ..., "error": "..."} (kể cả khi quá tải, xem SERVICE_DROP_STALE_SCANS)
+#   Thống kê: {"type": "stats"} -> {"type": "stats", ...}
+# Các lần quét đến gần nhau được gom thành lô nhỏ (micro-batch) và chạy qua
+# localization_algorithms.predict_locations_knn_batch; thời gian chờ gom lô được rút ngắn
+# tự động để độ trễ p99 nằm trong config.SERVICE_P99_LATENCY_BUDGET_MS.
+# Lần quét lặp lại (xe đứng yên) được trả lời ngay từ LocalizationResultCache, không vào lô.
+import argparse
+import asyncio
+import collections
+import functools
+import json
+import time
+import numpy as np
+import config
+import localization_algorithms
+
+class LocalizationService:
+    """
+    Bộ gom lô: mỗi lần quét được đưa vào hàng đợi cùng một Future; một tác vụ nền lấy
+    lần quét đầu tiên, chờ thêm tối đa một khoảng ngắn (hoặc tới khi đủ kích thước lô),
+    rồi định vị cả lô trong một luồng phụ để vòng lặp sự kiện vẫn tiếp tục nhận dữ liệu.
+    """
+
+    def __init__(self, fingerprints_data, k=None, weighted=None, epsilon=None,
+                 max_batch_size=None, latency_budget_ms=None, max_batch_wait_ms=None, drop_stale_scans=None,
+                 result_cache=None):
+        self.fingerprint_matrix = localization_algorithms.as_fingerprint_matrix(fingerprints_data)
+        self.fingerprint_matrix.squared_norms() # Chuẩn bị trước, không để lô đầu tiên phải trả
+        self.k = config.K_NEIGHBORS if k is None else k
+        self.weighted = config.USE_WEIGHTED_KNN if weighted is None else weighted
+        self.epsilon = config.EPSILON_WEIGHT if epsilon is None else epsilon
+        self.max_batch_size = config.SERVICE_MAX_BATCH_SIZE if max_batch_size is None else max_batch_size
+        self.latency_budget_s = (config.SERVICE_P99_LATENCY_BUDGET_MS if latency_budget_ms is None
+                                 else latency_budget_ms) / 1e3
+        self.max_batch_wait_s = (config.SERVICE_MAX_BATCH_WAIT_MS if max_batch_wait_ms is None
+                                 else max_batch_wait_ms) / 1e3
+        self.drop_stale_scans = config.SERVICE_DROP_STALE_SCANS if drop_stale_scans is None else drop_stale_scans
+        if result_cache is None and config.USE_RESULT_CACHE:
+            result_cache = localization_algorithms.LocalizationResultCache()
+        self.result_cache = result_cache # None để tắt bộ đệm kết quả
+
+        self._queue = None
+        self._batch_task = None
+        self._servers = []
+        # Cửa sổ trượt các số đo gần nhất (giây) để tính p50/p99
+        self._latencies = collections.deque(maxlen=config.SERVICE_STATS_WINDOW)
+        self._batch_times = collections.deque(maxlen=256) # (kích thước lô, thời gian tính) của các lô gần đây
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_errors = 0
+        self.num_dropped = 0
+        self.num_computed = 0
+
+    # --- Gom lô ---
+    def _batch_cost_model(self):
+        """
+        (chi phí cố định, chi phí mỗi lần quét) tính bằng giây: mô hình tuyến tính thời gian tính
+        một lô, khớp trên các lô gần đây; None khi chưa đủ số đo.
+        """
+        if len(self._batch_times) < 2:
+            return None
+        sizes, seconds = np.array(self._batch_times).T
+        if np.ptp(sizes) > 0:
+            per_scan_s, fixed_s = np.polyfit(sizes, seconds, 1)
+        else:
+            per_scan_s, fixed_s = float(np.mean(seconds / sizes)), 0.0
+        return max(fixed_s, 0.0), max(per_scan_s, 1e-7)
+
+    def _batch_limits(self):
+        """
+        (thời gian chờ gom lô, kích thước lô tối đa) theo ngân sách độ trễ p99: lô được giới hạn
+        để tính xong trong nửa ngân sách, thời gian chờ gom lô chỉ dùng phần còn lại của nửa đó.
+        """
+        cost_model = self._batch_cost_model()
+        if cost_model is None:
+            return self.max_batch_wait_s, self.max_batch_size
+        fixed_s, per_scan_s = cost_model
+        half_budget_s = self.latency_budget_s / 2
+        max_size = int((half_budget_s - fixed_s) / per_scan_s)
+        max_size = max(1, min(self.max_batch_size, max_size))
+        wait_s = max(0.0, min(self.max_batch_wait_s, half_budget_s - fixed_s - max_size * per_scan_s))
+        return wait_s, max_size
+
+    async def _collect_batch(self):
+        first = await self._queue.get()
+        batch = [first]
+        wait_s, max_size = self._batch_limits()
+        deadline = first[2] + wait_s
+        while len(batch) < max_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Lấy nốt các lần quét đã chờ sẵn mà không phải đợi thêm
+        while len(batch) < max_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    def _drop_stale(self, batch):
+        """
+        Khi quá tải, các lần quét mà (thời gian đã chờ + thời gian tính lô dự kiến) vượt ngân sách
+        độ trễ được trả lỗi ngay thay vì tính: với xe đang di chuyển, lần quét cũ không còn giá trị,
+        và hàng đợi không dồn thêm.
+        """
+        cost_model = self._batch_cost_model()
+        compute_s = 0.0 if cost_model is None else cost_model[0] + cost_model[1] * len(batch)
+        deadline = time.perf_counter() + compute_s - self.latency_budget_s
+        fresh = []
+        for item in batch:
+            _, future, t_arrival = item
+            if t_arrival < deadline:
+                self.num_dropped += 1
+                if not future.done():
+                    future.set_exception(TimeoutError("Dịch vụ quá tải: lần quét đã chờ quá ngân sách độ trễ"))
+            else:
+                fresh.append(item)
+        return fresh
+
+    def _localize_batch(self, observations):
+        return localization_algorithms.predict_locations_knn_batch(
+            observations, self.fingerprint_matrix, self.k, self.weighted, self.epsilon
+        )
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            if self.drop_stale_scans:
+                batch = self._drop_stale(batch)
+                if not batch:
+                    continue
+            observations = np.stack([observed for observed, _, _ in batch])
+            t_start = time.perf_counter()
+            try:
+                estimates = await loop.run_in_executor(None, self._localize_batch, observations)
+            except Exception as e: # Không để một lô lỗi làm dừng dịch vụ
+                estimates, error = None, e
+            else:
+                error = None if estimates is not None else ValueError("Không có điểm nào trong fingerprint map.")
+            t_end = time.perf_counter()
+            self._batch_times.append((len(batch), t_end - t_start))
+            self.num_batches += 1
+            self.num_computed += len(batch)
+            for i, (_, future, t_arrival) in enumerate(batch):
+                self._latencies.append(t_end - t_arrival)
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    estimate = (float(estimates[i, 0]), float(estimates[i, 1]))
+                    if self.result_cache is not None:
+                        self.result_cache.store(batch[i][0], estimate, self.fingerprint_matrix,
+                                                self.k, self.weighted, self.epsilon)
+                    future.set_result(estimate)
+
+    def submit(self, observed_rssi):
+        """Đưa một lần quét vào bộ gom lô; trả về Future có kết quả (hàng, cột)."""
+        observed_rssi = np.asarray(observed_rssi, dtype=np.float64).reshape(-1) # Kiểm tra dữ liệu trước khi vào lô
+        if len(observed_rssi) != self.fingerprint_matrix.num_aps:
+            raise ValueError(f"Cần {self.fingerprint_matrix.num_aps} giá trị RSSI, nhận được {len(observed_rssi)}")
+        if self._batch_task is None:
+            self._start_batcher()
+        future = asyncio.get_running_loop().create_future()
+        self.num_requests += 1
+        if self.result_cache is not None:
+            estimate = self.result_cache.lookup(observed_rssi, self.fingerprint_matrix,
+                                                self.k, self.weighted, self.epsilon)
+            if estimate is not None:
+                future.set_result(estimate)
+                return future
+        self._queue.put_nowait((observed_rssi, future, time.perf_counter()))
+        return future
+
+    async def localize(self, observed_rssi):
+        """Định vị một lần quét qua bộ gom lô; trả về (hàng, cột)."""
+        return await self.submit(observed_rssi)
+
+    def _start_batcher(self):
+        self._queue = asyncio.Queue()
+        self._batch_task = asyncio.create_task(self._batch_loop())
+
+    # --- Giao thức NDJSON ---
+    def stats(self):
+        """
+        Thống kê: số yêu cầu/lô/lỗi/bị bỏ, kích thước lô trung bình, độ trễ p50/p99 (ms) của các lần
+        quét đã tính (không gồm lần quét trả từ bộ đệm) và bộ đếm của bộ đệm kết quả.
+        """
+        latencies_ms = np.array(self._latencies) * 1e3
+        return {
+            "requests": self.num_requests,
+            "batches": self.num_batches,
+            "errors": self.num_errors,
+            "dropped": self.num_dropped,
+            "mean_batch_size": self.num_computed / self.num_batches if self.num_batches else 0.0,
+            "latency_p50_ms": float(np.percentile(latencies_ms, 50)) if latencies_ms.size else None,
+            "latency_p99_ms": float(np.percentile(latencies_ms, 99)) if latencies_ms.size else None,
+            "latency_budget_ms": self.latency_budget_s * 1e3,
+            "result_cache": self.result_cache.stats() if self.result_cache is not None else None,
+        }
+
+    def _write_reply(self, writer, reply):
+        if not writer.is_closing():
+            writer.write((json.dumps(reply, ensure_ascii=False) + "\n").encode())
+
+    def _reply_when_done(self, writer, reply, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.num_errors += 1
+            reply["error"] = f"{type(future.exception()).__name__}: {future.exception()}"
+        else:
+            reply["position"] = list(future.result())
+        self._write_reply(writer, reply)
+
+    def _handle_line(self, line, writer):
+        """
+        Xử lý một dòng; với lần quét, trả về Future (câu trả lời được ghi khi Future xong),
+        nên xe gửi liên tục không phải đợi kết quả lần quét trước.
+        """
+        try:
+            request = json.loads(line)
+            if request.get("type") == "stats":
+                self._write_reply(writer, {"type": "stats", **self.stats()})
+                return None
+            reply = {"cart_id": request.get("cart_id"), "seq": request.get("seq")}
+        except (ValueError, AttributeError) as e: # ValueError gồm cả JSONDecodeError và UnicodeDecodeError
+            self.num_errors += 1
+            self._write_reply(writer, {"error": f"Dòng JSON không hợp lệ: {e}"})
+            return None
+        try:
+            future = self.submit(request["rssi"])
+        except (KeyError, TypeError, ValueError) as e: # Lỗi của một lần quét chỉ trả về cho xe đó
+            self.num_errors += 1
+            reply["error"] = f"{type(e).__name__}: {e}"
+            self._write_reply(writer, reply)
+            return None
+        future.add_done_callback(functools.partial(self._reply_when_done, writer, reply))
+        return future
+
+    async def _handle_connection(self, reader, writer):
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                future = self._handle_line(line, writer)
+                if future is not None:
+                    pending.add(future)
+                    future.add_done_callback(pending.discard)
+                await writer.drain()
+            if pending:
+                await asyncio.wait(pending)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=None, port=None, unix_path=None):
+        """Mở cổng TCP (host, port) và/hoặc UNIX socket unix_path; trả về danh sách server."""
+        if self._batch_task is None:
+            self._start_batcher()
+        if unix_path:
+            self._servers.append(await asyncio.start_unix_server(self._handle_connection, path=unix_path))
+            print(f"Dịch vụ định vị đang nghe trên UNIX socket {unix_path}")
+        if port is not None or not unix_path:
+            host = config.SERVICE_HOST if host is None else host
+            port = config.SERVICE_PORT if port is None else port
+            server = await asyncio.start_server(self._handle_connection, host, port)
+            self._servers.append(server)
+            bound = server.sockets[0].getsockname()
+            print(f"Dịch vụ định vị đang nghe trên TCP {bound[0]}:{bound[1]}")
+        return self._servers
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            try:
+                await self._batch_task
+            except asyncio.CancelledError:
+                pass
+            self._batch_task = None
+
+async def serve_forever(fingerprints_data, host=None, port=None, unix_path=None):
+    service = LocalizationService(fingerprints_data)
+    servers = await service.start(host, port, unix_path)
+    try:
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+    finally:
+        await service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Dịch vụ định vị WinCart (NDJSON qua TCP/UNIX socket)")
+    parser.add_argument("fingerprints", help="File .npy chứa tensor fingerprint (hàng, cột, AP)")
+    parser.add_argument("--host", default=None, help=f"Mặc định {config.SERVICE_HOST}")
+    parser.add_argument("--port", type=int, default=None, help=f"Mặc định {config.SERVICE_PORT}")
+    parser.add_argument("--unix", default=None, help="Đường dẫn UNIX socket (thay cho/thêm vào TCP)")
+    args = parser.parse_args()
+
+    fingerprints = np.load(args.fingerprints, mmap_mode='r')
+    try:
+        asyncio.run(serve_forever(fingerprints, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("Đã dừng dịch vụ định vị.")
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,29 @@
 # main_speech_interactive.py
-import numpy as np
 import time
 import matplotlib.pyplot as plt # Cần cho plt.show() và plt.pause()
 import speech_recognition as sr
 import re # Cho hàm extract_keywords
-import sys
 import config # Các hằng số cấu hình chung
-from supermarket_model import SupermarketMap # Lớp quản lý bản đồ
+from supermarket_model import SupermarketMap, PATHWAY_ID, AP_ID # Lớp quản lý bản đồ và ID ô
+import store_layouts
 import rssi_simulation
+import fingerprint_cache
+import fingerprint_storage
+from fingerprint_index import FingerprintKDTree, FingerprintIVFIndex
+from particle_filter import ParticleFilterLocalizer
 import localization_algorithms
+import trilateration
+import route_planner
+from flow_fields import FlowFieldCache
 import interactive_visualization # Lớp quản lý plot tương tác
 
 # --- Biến trạng thái toàn cục của mô phỏng ---
 supermarket = None
 rssi_fingerprints_data = None
+rssi_knn_source = None # FingerprintMatrix (vét cạn) hoặc FingerprintKDTree, dùng cho KNN
+rssi_result_cache = None # LocalizationResultCache: kết quả KNN cho các lần quét lặp lại
+rssi_tracker = None # KNNTracker hoặc ParticleFilterLocalizer: định vị có nhớ khi xe di chuyển
+route_flow_field_cache = None # FlowFieldCache khi config.USE_FLOW_FIELD_ROUTING
 interactive_plotter = None # Instance của InteractiveSupermarketPlotter
 
 # Biến lưu trạng thái xe đẩy hiện tại
@@ -105,9 +115,29 @@ def extract_target_from_speech(text, supermarket_obj: SupermarketMap):
     print(f"Không tìm thấy từ khóa nào phù hợp trong: '{text}'")
     return None, None
 
+def extract_items_from_speech(text, supermarket_obj: SupermarketMap):
+    """
+    Trích xuất mọi mặt hàng được nhắc tới trong văn bản (ví dụ "mua sữa, bánh mì và nước ngọt"),
+    theo thứ tự xuất hiện. Tên dài được khớp trước và phần văn bản đã khớp không được dùng lại,
+    để tên ngắn nằm trong tên dài hơn không bị đếm hai lần.
+    """
+    if not text: return []
+    text_lower = text.lower()
+    matched = [False] * len(text_lower)
+    found = [] # (vị trí, tên)
+    sorted_item_names = sorted({props['name'] for props in supermarket_obj.item_definitions.values()},
+                               key=len, reverse=True)
+    for item_name in sorted_item_names:
+        for match in re.finditer(re.escape(item_name.lower()), text_lower):
+            if not any(matched[match.start():match.end()]):
+                matched[match.start():match.end()] = [True] * (match.end() - match.start())
+                found.append((match.start(), item_name))
+                break
+    return [item_name for _, item_name in sorted(found)]
+
 # --- HÀM XỬ LÝ LOGIC KHI CLICK LÊN BẢN ĐỒ ---
 def handle_map_click_event(clicked_cart_actual_rc):
-    global supermarket, rssi_fingerprints_data, interactive_plotter
+    global supermarket, rssi_knn_source, rssi_result_cache, interactive_plotter
     global current_cart_actual_rc, current_cart_estimated_rc_float
 
     print(f"handle_map_click_event được gọi với vị trí: {clicked_cart_actual_rc}")
@@ -119,13 +149,24 @@ def handle_map_click_event(clicked_cart_actual_rc):
     )
     # print(f"  RSSI quan sát được (từ click): {[round(val, 1) for val in observed_rssi]}")
 
-    estimated_pos = localization_algorithms.predict_location_knn(
-        observed_rssi,
-        rssi_fingerprints_data,
-        config.K_NEIGHBORS,
-        config.USE_WEIGHTED_KNN,
-        config.EPSILON_WEIGHT
-    )
+    estimated_pos = None
+    if rssi_knn_source is not None and rssi_result_cache is not None:
+        estimated_pos = rssi_result_cache.predict(
+            observed_rssi, rssi_knn_source,
+            config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT,
+            source_version=supermarket.layout_version
+        )
+    elif rssi_knn_source is not None:
+        estimated_pos = localization_algorithms.predict_location_knn(
+            observed_rssi,
+            rssi_knn_source,
+            config.K_NEIGHBORS,
+            config.USE_WEIGHTED_KNN,
+            config.EPSILON_WEIGHT
+        )
+    if estimated_pos is None:
+        # Chưa có fingerprint map (hoặc KNN thất bại): trilateration theo mô hình, không cần tính trước
+        estimated_pos = trilateration.predict_location_trilateration(observed_rssi, supermarket)
 
     if estimated_pos:
         current_cart_estimated_rc_float = estimated_pos
@@ -147,7 +188,7 @@ def handle_map_click_event(clicked_cart_actual_rc):
 
 # --- HÀM MÔ PHỎNG DI CHUYỂN XE ĐẨY ---
 def simulate_cart_movement_along_path(path_rc_nodes):
-    global supermarket, rssi_fingerprints_data, interactive_plotter
+    global supermarket, rssi_knn_source, rssi_tracker, interactive_plotter
     global current_cart_actual_rc, current_cart_estimated_rc_float
 
     if not path_rc_nodes or interactive_plotter is None:
@@ -156,18 +197,25 @@ def simulate_cart_movement_along_path(path_rc_nodes):
 
     print("\n🚗 Bắt đầu mô phỏng di chuyển xe đẩy...")
     initial_estimated_pos_for_path = current_cart_estimated_rc_float # Giữ lại vị trí ước tính ban đầu
+    # Mô phỏng trước RSSI quan sát được trên toàn bộ lộ trình trong một lần gọi
+    observed_rssi_along_path = rssi_simulation.get_observed_rssi_batch_on_map(supermarket, path_rc_nodes)
+    if rssi_tracker is not None:
+        rssi_tracker.reset(initial_estimated_pos_for_path) # Bám vết từ vị trí ước tính hiện tại
 
     for i, step_rc in enumerate(path_rc_nodes):
         current_cart_actual_rc = step_rc # Cập nhật vị trí thực tế của xe đẩy
 
         # Định vị lại xe đẩy tại vị trí mới này
-        observed_rssi_at_step = rssi_simulation.get_observed_rssi_at_cart_on_map(
-            supermarket, current_cart_actual_rc
-        )
-        estimated_pos_at_step = localization_algorithms.predict_location_knn(
-            observed_rssi_at_step, rssi_fingerprints_data,
-            config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT
-        )
+        observed_rssi_at_step = observed_rssi_along_path[i]
+        if rssi_tracker is not None:
+            estimated_pos_at_step = rssi_tracker.predict(observed_rssi_at_step)
+        elif rssi_knn_source is not None:
+            estimated_pos_at_step = localization_algorithms.predict_location_knn(
+                observed_rssi_at_step, rssi_knn_source,
+                config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT
+            )
+        else:
+            estimated_pos_at_step = trilateration.predict_location_trilateration(observed_rssi_at_step, supermarket)
 
         error_m_at_step = None
         if estimated_pos_at_step:
@@ -197,73 +245,43 @@ def simulate_cart_movement_along_path(path_rc_nodes):
 
 # --- HÀM CHÍNH ĐỂ CHẠY MÔ PHỎNG ---
 def run_interactive_simulation():
-    global supermarket, rssi_fingerprints_data, interactive_plotter
-    global current_cart_actual_rc, current_cart_estimated_rc_float
-
-    # 1. Khởi tạo đối tượng SupermarketMap
-    supermarket = SupermarketMap(
-        width_m=config.SUPERMARKET_WIDTH_M,
-        height_m=config.SUPERMARKET_HEIGHT_M,
-        resolution_m=config.GRID_RESOLUTION_M
-    )
+    global supermarket, rssi_fingerprints_data, rssi_knn_source, rssi_result_cache, rssi_tracker, interactive_plotter
+    global route_flow_field_cache, current_cart_actual_rc, current_cart_estimated_rc_float
 
-    # 2. Thêm các thành phần vào bản đồ (tường, gian hàng, vật phẩm, AP)
-    # --- TƯỜNG BAO ---
-    supermarket.add_general_obstacle(0, 0, 1, supermarket.num_cols) # Tường trên
-    supermarket.add_general_obstacle(supermarket.num_rows - 1, 0, 1, supermarket.num_cols) # Tường dưới
-    supermarket.add_general_obstacle(0, 0, supermarket.num_rows, 1) # Tường trái
-    supermarket.add_general_obstacle(0, supermarket.num_cols - 1, supermarket.num_rows, 1) # Tường phải
-
-    # --- GIAN HÀNG VÀ MẶT HÀNG ---
-    # (Đây là phần bạn cần tùy chỉnh nhiều nhất cho bản đồ của mình)
-    # Kệ Trái (chứa Sữa và Bánh mì)
-    shelf1_r, shelf1_c = supermarket.num_rows // 4, supermarket.num_cols // 5
-    shelf1_h, shelf1_w = supermarket.num_rows // 2, 3 # Kệ cao, rộng 3 ô
-    stall_id_shelf1 = supermarket.add_stall_area(shelf1_r, shelf1_c, shelf1_h, shelf1_w, "Kệ Đồ Khô")
-    if stall_id_shelf1 != -1:
-        supermarket.add_item_to_grid(shelf1_r, shelf1_c, shelf1_h // 2, shelf1_w, "Sữa", on_stall_id=stall_id_shelf1)
-        supermarket.add_item_to_grid(shelf1_r + shelf1_h // 2, shelf1_c, shelf1_h - (shelf1_h // 2), shelf1_w, "Bánh mì", on_stall_id=stall_id_shelf1)
-
-    # Kệ Phải (chứa Nước ngọt)
-    shelf2_r, shelf2_c = supermarket.num_rows // 4, (supermarket.num_cols // 5) * 3
-    shelf2_h, shelf2_w = supermarket.num_rows // 2, 3
-    stall_id_shelf2 = supermarket.add_stall_area(shelf2_r, shelf2_c, shelf2_h, shelf2_w, "Kệ Nước Giải Khát")
-    if stall_id_shelf2 != -1:
-        supermarket.add_item_to_grid(shelf2_r, shelf2_c, shelf2_h, shelf2_w, "Nước ngọt", on_stall_id=stall_id_shelf2)
-    
-    # Thêm một kệ nữa cho đa dạng
-    shelf3_r, shelf3_c = supermarket.num_rows // 2 + 5 , supermarket.num_cols - 15
-    shelf3_h, shelf3_w = 10, 4
-    stall_id_shelf3 = supermarket.add_stall_area(shelf3_r, shelf3_c, shelf3_h, shelf3_w, "Kệ Gia Vị")
-    if stall_id_shelf3 != -1:
-        supermarket.add_item_to_grid(shelf3_r, shelf3_c, shelf3_h, shelf3_w, "Nước mắm", on_stall_id=stall_id_shelf3)
-
-
-    # 3. Thêm Access Points
-    ap_coords = [
-        (config.AP_MARGIN_CELLS, config.AP_MARGIN_CELLS),
-        (config.AP_MARGIN_CELLS, supermarket.num_cols - 1 - config.AP_MARGIN_CELLS),
-        (supermarket.num_rows - 1 - config.AP_MARGIN_CELLS, config.AP_MARGIN_CELLS),
-        (supermarket.num_rows - 1 - config.AP_MARGIN_CELLS, supermarket.num_cols - 1 - config.AP_MARGIN_CELLS)
-        # (supermarket.num_rows // 2, supermarket.num_cols // 2) # AP ở giữa (tùy chọn)
-    ]
-    for r_ap, c_ap in ap_coords:
-        supermarket.add_access_point(r_ap, c_ap)
+    # 1-3. Khởi tạo bản đồ và thêm tường, gian hàng, mặt hàng, Access Points
+    # (bố cục dùng chung với localization_benchmark, xem store_layouts.build_demo_supermarket)
+    supermarket = store_layouts.build_demo_supermarket()
     print(f"Đã thêm {len(supermarket.access_points)} APs.")
+    if config.USE_FLOW_FIELD_ROUTING:
+        route_flow_field_cache = FlowFieldCache()
 
 
     # 4. Tạo bản đồ fingerprint RSSI
     print("Đang tạo bản đồ RSSI fingerprints...")
-    rssi_fingerprints_data = rssi_simulation.generate_rssi_fingerprints_from_map(supermarket)
-    print(f"Kích thước của rssi_fingerprints_data trong bộ nhớ: {sys.getsizeof(rssi_fingerprints_data)} bytes")
-    if rssi_fingerprints_data:
-        # Kiểm tra kích thước của một vài value (là list hoặc numpy array)
-        example_key = next(iter(rssi_fingerprints_data))
-        example_value = rssi_fingerprints_data[example_key]
-        print(f"Kích thước của một value trong fingerprints: {sys.getsizeof(example_value)} bytes, kiểu: {type(example_value)}")
-        if isinstance(example_value, np.ndarray):
-            print(f"  Kiểu dữ liệu của array: {example_value.dtype}, số phần tử: {example_value.size}")
-    print(f"Hoàn thành tạo bản đồ RSSI fingerprints với {len(rssi_fingerprints_data)} điểm.")
+    # Dùng bộ đệm trên đĩa: chỉ tạo lại khi bố cục, AP hoặc tham số vô tuyến thay đổi
+    # rồi chuyển sang định dạng lưu trữ config.FINGERPRINT_STORAGE_MODE (int8/float16 gọn hơn float32)
+    rssi_fingerprints_data = fingerprint_storage.to_storage_mode(
+        fingerprint_cache.load_or_generate_fingerprints(supermarket))
+    print(f"Kích thước của rssi_fingerprints_data: {rssi_fingerprints_data.nbytes} bytes, "
+          f"định dạng: {config.FINGERPRINT_STORAGE_MODE}, shape: {rssi_fingerprints_data.shape}")
+    # Trải phẳng một lần các ô có fingerprint thành ma trận (N, AP) cho KNN
+    fingerprint_matrix = localization_algorithms.as_fingerprint_matrix(rssi_fingerprints_data)
+    num_fingerprint_points = fingerprint_matrix.values.shape[0]
+    rssi_knn_source = fingerprint_matrix
+    if config.USE_KNN_INDEX:
+        # Dựng chỉ mục một lần cho bản đồ này
+        if config.KNN_INDEX_TYPE == "ivf":
+            rssi_knn_source = FingerprintIVFIndex(fingerprint_matrix)
+        else:
+            rssi_knn_source = FingerprintKDTree(fingerprint_matrix)
+    if config.USE_RESULT_CACHE:
+        rssi_result_cache = localization_algorithms.LocalizationResultCache()
+    if config.USE_PARTICLE_FILTER:
+        rssi_tracker = ParticleFilterLocalizer(supermarket, rssi_fingerprints_data)
+    elif config.USE_MOTION_GATED_TRACKING:
+        global_index = rssi_knn_source if config.USE_KNN_INDEX else None
+        rssi_tracker = localization_algorithms.KNNTracker(fingerprint_matrix, global_index=global_index)
+    print(f"Hoàn thành tạo bản đồ RSSI fingerprints với {num_fingerprint_points} điểm.")
 
     # 5. Khởi tạo và hiển thị bản đồ tương tác
     print("\nĐang khởi tạo giao diện đồ họa...")
@@ -321,8 +339,29 @@ def run_interactive_simulation():
 
 
                     keyword_type, found_name = extract_target_from_speech(spoken_text, supermarket)
-
-                    if found_name:
+                    shopping_list = extract_items_from_speech(spoken_text, supermarket)
+
+                    if len(shopping_list) > 1 and current_cart_estimated_rc_float:
+                        # Nhiều mặt hàng: lập một lộ trình ghé tất cả theo thứ tự ngắn nhất
+                        start_node_path = (round(current_cart_estimated_rc_float[0]),
+                                           round(current_cart_estimated_rc_float[1]))
+                        if supermarket.grid_map[start_node_path[0],start_node_path[1]] != PATHWAY_ID and \
+                           supermarket.grid_map[start_node_path[0],start_node_path[1]] != AP_ID :
+                            print(f"  Cảnh báo: Vị trí ước tính {start_node_path} không phải lối đi. Dùng vị trí thực tế.")
+                            start_node_path = current_cart_actual_rc
+                        print(f"  Lập lộ trình cho {len(shopping_list)} mặt hàng: {shopping_list}")
+                        shopping_route = route_planner.plan_shopping_route(supermarket, start_node_path, shopping_list)
+                        if shopping_route:
+                            stop_names = " → ".join(name for name, _ in shopping_route["stops"])
+                            print(f"  Thứ tự ghé: {stop_names} ({shopping_route['total_steps']} bước)")
+                            path_for_plot = shopping_route["path"]
+                            plot_msg = f"Đang dẫn đường: {stop_names}"
+                            interactive_plotter.update_path_to_target(stop_names, shopping_route["stops"][-1][1],
+                                                                      path_for_plot, plot_msg)
+                            simulate_cart_movement_along_path(path_for_plot) # Mô phỏng di chuyển
+                        else:
+                            plot_msg = f"Không lập được lộ trình cho: {', '.join(shopping_list)}"
+                    elif found_name:
                         target_name_for_plot = found_name
                         if keyword_type == "item":
                             target_approachable_rc = supermarket.get_approachable_item_location_by_name(
@@ -346,9 +385,18 @@ def run_interactive_simulation():
                                     start_node_path = current_cart_actual_rc
 
                                 print(f"  Tìm đường từ {start_node_path} đến {target_approachable_rc}...")
-                                path_nodes = localization_algorithms.find_path_astar(
-                                    supermarket, start_node_path, target_approachable_rc
-                                )
+                                if config.USE_HIERARCHICAL_PATHFINDING:
+                                    path_nodes = localization_algorithms.find_path_hierarchical(
+                                        supermarket, start_node_path, target_approachable_rc
+                                    )
+                                elif route_flow_field_cache is not None:
+                                    path_nodes = localization_algorithms.find_path_flow_field(
+                                        supermarket, start_node_path, target_approachable_rc, route_flow_field_cache
+                                    )
+                                else:
+                                    path_nodes = localization_algorithms.find_path_astar(
+                                        supermarket, start_node_path, target_approachable_rc
+                                    )
                                 if path_nodes:
                                     path_for_plot = path_nodes
                                     plot_msg = f"Đang dẫn đường đến: {found_name}"
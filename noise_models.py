@@ -0,0 +1,174 @@
+# noise_models.py
+# Các mô hình nhiễu cho bộ mô phỏng RSSI (rssi_simulation).
+# Mọi mô hình trả về nhiễu "chuẩn hóa" (phương sai 1); rssi_simulation nhân với
+# config.NOISE_STD_DEV_DB (hoặc NOISE_STD_DEV_DB / 3 khi ở sát AP) để ra dB.
+import numpy as np
+import config
+
+class NoiseModel:
+    """
+    Giao diện chung. Mọi lần rút mẫu đều theo lô và dùng np.random.Generator:
+    rng truyền vào (nếu có) được ưu tiên, ngược lại dùng self.rng của mô hình.
+    """
+    name = "base"
+    per_cart_state = False # True nếu observation_noise phụ thuộc lịch sử của từng xe
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def prepare(self, grid_shape, num_aps):
+        """Chuẩn bị trạng thái phụ thuộc bản đồ (nếu có) trước khi gửi mô hình sang tiến trình khác."""
+
+    def reset(self):
+        """Xóa mọi trạng thái đã lưu (trường bóng mờ, trạng thái theo xe đẩy)."""
+
+    def fingerprint_noise(self, cells_r, cells_c, ap_indices, grid_shape, rng=None):
+        """Nhiễu cho fingerprint: mảng (N, len(ap_indices)) tại các ô (cells_r, cells_c)."""
+        raise NotImplementedError
+
+    def observation_noise(self, cells_r, cells_c, ap_indices, grid_shape, cart_id=None, rng=None):
+        """
+        Nhiễu cho quan sát của xe đẩy: mảng (N, len(ap_indices)).
+        Các hàng là các lần quét liên tiếp (theo thứ tự) của cùng một xe cart_id.
+        """
+        raise NotImplementedError
+
+
+class GaussianNoiseModel(NoiseModel):
+    """Nhiễu Gaussian độc lập (i.i.d.) cho mọi cặp (ô, AP) - hành vi gốc của bộ mô phỏng."""
+    name = "iid"
+
+    def fingerprint_noise(self, cells_r, cells_c, ap_indices, grid_shape, rng=None):
+        rng = self.rng if rng is None else rng
+        # Thứ tự rút mẫu: ô -> AP, giống vòng lặp vô hướng trong rssi_simulation
+        return rng.standard_normal((len(cells_r), len(ap_indices)))
+
+    def observation_noise(self, cells_r, cells_c, ap_indices, grid_shape, cart_id=None, rng=None):
+        return self.fingerprint_noise(cells_r, cells_c, ap_indices, grid_shape, rng)
+
+
+class ShadowFadingNoiseModel(NoiseModel):
+    """
+    Bóng mờ (shadow fading) tương quan theo không gian: mỗi AP có một trường ngẫu nhiên trên
+    toàn lưới, tạo bằng cách lọc nhiễu trắng qua bộ lọc Gauss trong miền tần số (FFT).
+    Trường là thuộc tính của môi trường nên được tạo một lần và dùng chung cho fingerprint
+    lẫn quan sát; mỗi lần đo cộng thêm một phần nhiễu độc lập (iid_fraction của phương sai).
+    """
+    name = "shadowing"
+
+    def __init__(self, seed=None, corr_distance_m=None, iid_fraction=None):
+        super().__init__(seed)
+        self.corr_distance_m = config.SHADOW_FADING_CORR_DISTANCE_M if corr_distance_m is None else corr_distance_m
+        self.iid_fraction = config.SHADOW_FADING_IID_FRACTION if iid_fraction is None else iid_fraction
+        self._field = None # (hàng, cột, AP), phương sai 1
+
+    def reset(self):
+        self._field = None
+
+    def prepare(self, grid_shape, num_aps):
+        self._get_field(grid_shape, num_aps)
+
+    def _get_field(self, grid_shape, num_aps):
+        num_rows, num_cols = grid_shape
+        if self._field is not None and self._field.shape[:2] == (num_rows, num_cols) \
+                and self._field.shape[2] >= num_aps:
+            return self._field
+
+        sigma_cells = self.corr_distance_m / config.GRID_RESOLUTION_M
+        # Đệm thêm 3 sigma để tránh tương quan vòng quanh biên của FFT
+        pad = int(np.ceil(3 * sigma_cells))
+        rows_p, cols_p = num_rows + 2 * pad, num_cols + 2 * pad
+        freq_sq = np.fft.fftfreq(rows_p)[:, None] ** 2 + np.fft.fftfreq(cols_p)[None, :] ** 2
+        transfer = np.exp(-2 * (np.pi * sigma_cells) ** 2 * freq_sq) # Biến đổi Fourier của nhân Gauss
+
+        num_old = 0 if self._field is None or self._field.shape[:2] != (num_rows, num_cols) else self._field.shape[2]
+        field = np.empty((num_rows, num_cols, num_aps))
+        if num_old:
+            field[:, :, :num_old] = self._field # Giữ nguyên trường của các AP đã có
+        white = self.rng.standard_normal((num_aps - num_old, rows_p, cols_p))
+        half_transfer = transfer[:, :cols_p // 2 + 1] # Phần tần số dùng bởi rfft2
+        filtered = np.fft.irfft2(np.fft.rfft2(white) * half_transfer, s=(rows_p, cols_p))
+        filtered = filtered[:, pad:pad + num_rows, pad:pad + num_cols]
+        # Chuẩn hóa phương sai 1 theo lý thuyết (định lý Parseval) thay vì theo mẫu
+        filtered /= np.sqrt(np.mean(transfer ** 2))
+        field[:, :, num_old:] = np.moveaxis(filtered, 0, -1)
+        self._field = field
+        return field
+
+    def _sample(self, cells_r, cells_c, ap_indices, grid_shape, rng):
+        rng = self.rng if rng is None else rng
+        ap_indices = np.asarray(ap_indices, dtype=np.int64)
+        num_aps = int(ap_indices.max()) + 1 if ap_indices.size else 0
+        field = self._get_field(grid_shape, num_aps)
+        shadow = field[np.asarray(cells_r)[:, None], np.asarray(cells_c)[:, None], ap_indices[None, :]]
+        independent = rng.standard_normal(shadow.shape)
+        return np.sqrt(1 - self.iid_fraction) * shadow + np.sqrt(self.iid_fraction) * independent
+
+    def fingerprint_noise(self, cells_r, cells_c, ap_indices, grid_shape, rng=None):
+        return self._sample(cells_r, cells_c, ap_indices, grid_shape, rng)
+
+    def observation_noise(self, cells_r, cells_c, ap_indices, grid_shape, cart_id=None, rng=None):
+        return self._sample(cells_r, cells_c, ap_indices, grid_shape, rng)
+
+
+class TemporalFadingNoiseModel(NoiseModel):
+    """
+    Fading tương quan theo thời gian cho xe đang di chuyển: mỗi xe giữ một trạng thái AR(1)
+    cho từng AP, x_t = a * x_{t-1} + sqrt(1 - a^2) * e_t với a = exp(-quãng đường / corr_distance_m)
+    (mô hình Gudmundson). Xe đứng yên thấy nhiễu gần như không đổi, xe đi xa thấy nhiễu mới.
+    Fingerprint được khảo sát độc lập nên dùng nhiễu i.i.d.
+    """
+    name = "temporal"
+    per_cart_state = True
+
+    def __init__(self, seed=None, corr_distance_m=None):
+        super().__init__(seed)
+        self.corr_distance_m = config.TEMPORAL_FADING_CORR_DISTANCE_M if corr_distance_m is None else corr_distance_m
+        self._cart_states = {} # cart_id -> (vị trí (hàng, cột) cuối, trạng thái theo AP {ap_idx: giá trị})
+
+    def reset(self):
+        self._cart_states = {}
+
+    def fingerprint_noise(self, cells_r, cells_c, ap_indices, grid_shape, rng=None):
+        rng = self.rng if rng is None else rng
+        return rng.standard_normal((len(cells_r), len(ap_indices)))
+
+    def observation_noise(self, cells_r, cells_c, ap_indices, grid_shape, cart_id=None, rng=None):
+        rng = self.rng if rng is None else rng
+        num_obs, num_aps = len(cells_r), len(ap_indices)
+        innovations = rng.standard_normal((num_obs, num_aps))
+        noise = np.empty((num_obs, num_aps))
+        positions = np.column_stack([cells_r, cells_c]).astype(np.float64)
+
+        last_pos, ap_state = self._cart_states.get(cart_id, (None, {}))
+        state = np.array([ap_state.get(int(k), np.nan) for k in ap_indices])
+        for i in range(num_obs):
+            if last_pos is None:
+                a = 0.0
+            else:
+                moved_m = np.hypot(*(positions[i] - last_pos)) * config.GRID_RESOLUTION_M
+                a = np.exp(-moved_m / self.corr_distance_m) if self.corr_distance_m > 0 else 0.0
+            # AP chưa có trạng thái (xe mới hoặc AP mới) bắt đầu từ nhiễu độc lập
+            state = np.where(np.isnan(state), innovations[i], a * state + np.sqrt(1 - a * a) * innovations[i])
+            noise[i] = state
+            last_pos = positions[i]
+
+        if num_obs:
+            ap_state = dict(ap_state)
+            ap_state.update({int(k): v for k, v in zip(ap_indices, state)})
+            self._cart_states[cart_id] = (last_pos, ap_state)
+        return noise
+
+
+NOISE_MODELS = {
+    GaussianNoiseModel.name: GaussianNoiseModel,
+    ShadowFadingNoiseModel.name: ShadowFadingNoiseModel,
+    TemporalFadingNoiseModel.name: TemporalFadingNoiseModel,
+}
+
+def create_noise_model(name=None, seed=None):
+    """Tạo mô hình nhiễu theo tên (mặc định config.NOISE_MODEL)."""
+    name = config.NOISE_MODEL if name is None else name
+    if name not in NOISE_MODELS:
+        raise ValueError(f"Mô hình nhiễu không hợp lệ: '{name}'. Chọn một trong {sorted(NOISE_MODELS)}")
+    return NOISE_MODELS[name](seed=seed)
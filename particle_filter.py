@@ -0,0 +1,122 @@
+# particle_filter.py
+# Bộ lọc hạt (particle filter) cho định vị xe đẩy: các hạt là mảng NumPy (không phải đối tượng),
+# mỗi lần quét gồm: dịch chuyển ngẫu nhiên trong ô lối đi -> cập nhật trọng số theo likelihood
+# Gauss của RSSI so với tensor fingerprint -> lấy mẫu lại hệ thống (systematic resampling).
+# Cùng giao diện reset()/predict() với localization_algorithms.KNNTracker.
+import numpy as np
+import config
+from supermarket_model import PATHWAY_ID, AP_ID
+
+class ParticleFilterLocalizer:
+    """
+    Vị trí hạt là số thực (hàng, cột); likelihood tra fingerprint tại ô làm tròn của mỗi hạt.
+    Một phần nhỏ hạt (random_fraction) được rải lại ngẫu nhiên sau mỗi lần lấy mẫu lại,
+    để bộ lọc tự phục hồi khi ước tính bị lạc.
+    """
+
+    def __init__(self, supermarket_map_obj, fingerprints_data, num_particles=None, motion_std_m=None,
+                 rssi_sigma_db=None, resample_threshold=None, random_fraction=None, seed=None):
+        self.num_particles = config.PARTICLE_COUNT if num_particles is None else num_particles
+        self.motion_std_cells = (config.PARTICLE_MOTION_STD_M if motion_std_m is None else motion_std_m) \
+            / config.GRID_RESOLUTION_M
+        self.rssi_sigma_db = config.PARTICLE_RSSI_SIGMA_DB if rssi_sigma_db is None else rssi_sigma_db
+        self.resample_threshold = config.PARTICLE_RESAMPLE_THRESHOLD if resample_threshold is None \
+            else resample_threshold
+        self.random_fraction = config.PARTICLE_RANDOM_FRACTION if random_fraction is None else random_fraction
+        self.rng = np.random.default_rng(config.PARTICLE_SEED if seed is None else seed)
+
+        # Tensor (hàng, cột, AP); FingerprintMatrix / CompactFingerprints được giải nén
+        fingerprints = fingerprints_data.to_float32() if hasattr(fingerprints_data, "to_float32") \
+            else np.asarray(fingerprints_data, dtype=np.float32)
+        self.num_rows, self.num_cols, self.num_aps = fingerprints.shape
+        self.fingerprints_flat = fingerprints.reshape(self.num_rows * self.num_cols, self.num_aps)
+        grid = supermarket_map_obj.grid_map
+        walkable = ((grid == PATHWAY_ID) | (grid == AP_ID)) & ~np.any(np.isnan(fingerprints), axis=2)
+        self.walkable_flat = walkable.ravel()
+        self.walkable_cells = np.flatnonzero(self.walkable_flat)
+
+        self.particles_r = np.empty(0)
+        self.particles_c = np.empty(0)
+        self.weights = np.empty(0)
+        self.last_estimate = None
+
+    def _scatter_uniform(self, count):
+        """`count` hạt rải đều trên các ô lối đi có fingerprint."""
+        cells = self.walkable_cells[self.rng.integers(0, self.walkable_cells.shape[0], count)]
+        return cells // self.num_cols + 0.0, cells % self.num_cols + 0.0
+
+    def reset(self, last_estimate=None):
+        """
+        Khởi tạo lại các hạt: quanh last_estimate (hàng, cột) nếu có, ngược lại rải đều toàn bản đồ.
+        """
+        self.last_estimate = last_estimate
+        if self.walkable_cells.shape[0] == 0:
+            self.particles_r = self.particles_c = self.weights = np.empty(0)
+            return
+        self.particles_r, self.particles_c = self._scatter_uniform(self.num_particles)
+        if last_estimate is not None:
+            spread = 2 * self.motion_std_cells
+            self.particles_r = last_estimate[0] + self.rng.normal(0, spread, self.num_particles)
+            self.particles_c = last_estimate[1] + self.rng.normal(0, spread, self.num_particles)
+            # Hạt rơi vào vật cản được rải lại ngẫu nhiên
+            invalid = ~self._is_walkable(self.particles_r, self.particles_c)
+            self.particles_r[invalid], self.particles_c[invalid] = self._scatter_uniform(int(invalid.sum()))
+        self.weights = np.full(self.num_particles, 1.0 / self.num_particles)
+
+    def _cell_index(self, particles_r, particles_c):
+        r = np.rint(particles_r).astype(np.int64)
+        c = np.rint(particles_c).astype(np.int64)
+        inside = (r >= 0) & (r < self.num_rows) & (c >= 0) & (c < self.num_cols)
+        return np.where(inside, r * self.num_cols + c, -1)
+
+    def _is_walkable(self, particles_r, particles_c):
+        cells = self._cell_index(particles_r, particles_c)
+        return (cells >= 0) & self.walkable_flat[np.maximum(cells, 0)]
+
+    def _move(self):
+        """Mô hình chuyển động: bước Gauss; bước rơi ra ngoài lối đi bị hủy (hạt đứng yên)."""
+        new_r = self.particles_r + self.rng.normal(0, self.motion_std_cells, self.num_particles)
+        new_c = self.particles_c + self.rng.normal(0, self.motion_std_cells, self.num_particles)
+        valid = self._is_walkable(new_r, new_c)
+        self.particles_r = np.where(valid, new_r, self.particles_r)
+        self.particles_c = np.where(valid, new_c, self.particles_c)
+
+    def _update_weights(self, observed_rssi):
+        """Nhân trọng số với likelihood Gauss của vector quan sát (tính trong miền log)."""
+        expected = self.fingerprints_flat[self._cell_index(self.particles_r, self.particles_c)]
+        diff = expected - np.asarray(observed_rssi, dtype=np.float32)
+        log_likelihood = -np.einsum('ij,ij->i', diff, diff) / (2 * self.rssi_sigma_db ** 2)
+        log_weights = np.log(np.maximum(self.weights, 1e-300)) + log_likelihood
+        log_weights -= log_weights.max()
+        weights = np.exp(log_weights)
+        self.weights = weights / weights.sum()
+
+    def _systematic_resample(self):
+        positions = (self.rng.random() + np.arange(self.num_particles)) / self.num_particles
+        cumulative = np.cumsum(self.weights)
+        cumulative[-1] = 1.0 # Tránh sai số làm tròn vượt quá vị trí cuối
+        idx = np.searchsorted(cumulative, positions)
+        self.particles_r = self.particles_r[idx]
+        self.particles_c = self.particles_c[idx]
+        num_random = int(self.random_fraction * self.num_particles)
+        if num_random:
+            self.particles_r[:num_random], self.particles_c[:num_random] = self._scatter_uniform(num_random)
+        self.weights = np.full(self.num_particles, 1.0 / self.num_particles)
+
+    def predict(self, observed_rssi):
+        """Cập nhật bộ lọc với một lần quét; trả về ước tính (hàng, cột) hoặc None nếu không có fingerprint."""
+        if len(observed_rssi) != self.num_aps:
+            raise ValueError("Các vector RSSI phải có cùng độ dài")
+        if self.walkable_cells.shape[0] == 0:
+            print("Lỗi bộ lọc hạt: Không có điểm nào trong fingerprint map.")
+            return None
+        if self.weights.shape[0] != self.num_particles:
+            self.reset(self.last_estimate)
+        else:
+            self._move()
+        self._update_weights(observed_rssi)
+        self.last_estimate = (float(self.weights @ self.particles_r), float(self.weights @ self.particles_c))
+        effective_size = 1.0 / np.sum(self.weights ** 2)
+        if effective_size < self.resample_threshold * self.num_particles:
+            self._systematic_resample()
+        return self.last_estimate
@@ -0,0 +1,181 @@
+# pathfinding_benchmark.py
+# Benchmark tìm đường: so sánh các bộ tìm đường trên cùng một bố cục tổng hợp (mặc định lưới
+# 1000x600 ô) với cùng các cặp điểm ngẫu nhiên trên lối đi; ghi thời gian mỗi tuyến
+# (p50/p95), tổng thời gian, độ dài đường đi (và tỉ lệ độ dài) và tốc độ so với các bộ trước đó
+# ra JSON.
+#
+# Ví dụ: python pathfinding_benchmark.py --cols 1000 --rows 600 --routes 20 --output path_bench.json
+#        python pathfinding_benchmark.py --routes 200 --targets 2 --pathfinders grid_astar flow_field
+#        python pathfinding_benchmark.py --pathfinders grid_astar --shopping-items 30
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import time
+import numpy as np
+from pathfinding.core.diagonal_movement import DiagonalMovement
+from pathfinding.core.grid import Grid as PathfindingGrid
+from pathfinding.finder.a_star import AStarFinder
+import localization_algorithms
+import route_planner
+import store_layouts
+from flow_fields import FlowFieldCache
+from localization_benchmark import git_commit_hash, summarize_values
+
+def find_path_astar_rebuilding_grid(supermarket_map_obj, start_node_rc, end_node_rc):
+    """
+    Cách find_path_astar hoạt động trước khi có lưới dùng lại: mỗi lần gọi dựng ma trận đi được
+    và một Grid (một đối tượng Node cho mỗi ô) mới của thư viện pathfinding. Chỉ dùng để so sánh.
+    """
+    matrix = supermarket_map_obj.get_walkable_mask().astype(np.int8).tolist()
+    path_grid = PathfindingGrid(matrix=matrix)
+    finder = AStarFinder(diagonal_movement=DiagonalMovement.never)
+    path, _ = finder.find_path(path_grid.node(start_node_rc[1], start_node_rc[0]),
+                               path_grid.node(end_node_rc[1], end_node_rc[0]), path_grid)
+    return [(node.y, node.x) for node in path] or None
+
+_flow_field_cache = FlowFieldCache()
+
+# Tên -> hàm tìm đường cùng chữ ký find_path_astar(bản đồ, điểm đầu, điểm cuối)
+PATHFINDERS = {
+    "pathfinding_rebuild": find_path_astar_rebuilding_grid, # Dựng lại lưới mỗi lần gọi
+    "pathfinding": localization_algorithms.find_path_astar_pathfinding, # Lưới thư viện dùng lại
+    "grid_astar": localization_algorithms.find_path_astar, # A* tự viết (mặc định)
+    "hpa": localization_algorithms.find_path_hierarchical, # HPA* (đường gần tối ưu)
+    "flow_field": lambda supermarket_map_obj, start_node_rc, end_node_rc: localization_algorithms.find_path_flow_field(
+        supermarket_map_obj, start_node_rc, end_node_rc, _flow_field_cache), # Một trường cho mỗi đích
+}
+# flow_field chỉ có lợi khi nhiều tuyến cùng đích (--targets), nên không chạy mặc định
+DEFAULT_PATHFINDERS = ("pathfinding_rebuild", "pathfinding", "grid_astar", "hpa")
+
+def build_benchmark_map(num_cols, num_rows, resolution_m):
+    """Bố cục tổng hợp (dãy kệ, lối đi ngang) có đúng num_rows x num_cols ô."""
+    return store_layouts.build_synthetic_supermarket(num_cols * resolution_m, num_rows * resolution_m,
+                                                     resolution_m=resolution_m)
+
+def random_route_pairs(supermarket, num_routes, seed=0, num_targets=None):
+    """
+    num_routes cặp (điểm đầu, điểm cuối) ngẫu nhiên trên lối đi. Với num_targets, điểm cuối
+    chỉ lấy từ num_targets ô cố định (nhiều xe cùng tới vài mặt hàng, như lúc khuyến mãi).
+    """
+    free_cells = np.argwhere(supermarket.get_walkable_mask())
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, free_cells.shape[0], (num_routes, 2))
+    if num_targets is not None:
+        targets = rng.integers(0, free_cells.shape[0], num_targets)
+        picks[:, 1] = targets[rng.integers(0, num_targets, num_routes)]
+    return [(tuple(map(int, free_cells[a])), tuple(map(int, free_cells[b]))) for a, b in picks]
+
+def benchmark_pathfinder(name, supermarket, route_pairs):
+    """Thời gian dựng (lần gọi đầu tiên trên bản đồ) và thời gian từng tuyến của một bộ tìm đường."""
+    find_path = PATHFINDERS[name]
+    with contextlib.redirect_stdout(io.StringIO()): # Ẩn thông báo "không tìm thấy đường"
+        t_start = time.perf_counter()
+        find_path(supermarket, *route_pairs[0]) # Lần gọi đầu dựng cấu trúc dùng lại (lưới, mảng)
+        setup_s = time.perf_counter() - t_start
+        paths, route_times = [], []
+        for start_rc, end_rc in route_pairs:
+            t_start = time.perf_counter()
+            paths.append(find_path(supermarket, start_rc, end_rc))
+            route_times.append(time.perf_counter() - t_start)
+    route_times = np.array(route_times)
+    return paths, {
+        "first_call_s": setup_s,
+        "total_s": float(route_times.sum()),
+        "route_ms": summarize_values(route_times * 1e3),
+        "num_unreachable": sum(path is None for path in paths),
+    }
+
+def benchmark_shopping_routes(supermarket, num_items, num_lists=5, seed=0):
+    """
+    Thời gian dựng bảng quãng đường giữa các mặt hàng và thời gian lập lộ trình cho num_lists
+    danh sách num_items mặt hàng ngẫu nhiên (BFS từ điểm xuất phát, sắp thứ tự, dựng đường đi).
+    """
+    t_start = time.perf_counter()
+    table = supermarket.get_item_distance_table()
+    table_s = time.perf_counter() - t_start
+    item_names = sorted(table.item_spots)
+    rng = np.random.default_rng(seed)
+    starts = random_route_pairs(supermarket, num_lists, seed)
+    timings = {"distances_ms": [], "order_ms": [], "path_ms": [], "total_ms": []}
+    total_steps = []
+    for start_rc, _ in starts:
+        shopping_list = list(rng.choice(item_names, min(num_items, len(item_names)), replace=False))
+        t_start = time.perf_counter()
+        route = route_planner.plan_shopping_route(supermarket, start_rc, shopping_list)
+        timings["total_ms"].append((time.perf_counter() - t_start) * 1e3)
+        for key in ("distances_ms", "order_ms", "path_ms"):
+            timings[key].append(route[key])
+        total_steps.append(route["total_steps"])
+    result = {"num_items": num_items, "num_lists": num_lists, "num_spots": len(table.spots),
+              "table_build_s": table_s, "total_steps": total_steps}
+    result.update({key: summarize_values(np.array(values)) for key, values in timings.items()})
+    print(f"  Lộ trình {num_items} mặt hàng: bảng {len(table.spots)} điểm dựng trong {table_s:.2f}s | "
+          f"sắp thứ tự p50 {result['order_ms']['p50']:.1f} ms | tổng p50 {result['total_ms']['p50']:.1f} ms")
+    return result
+
+def run_benchmark(num_cols=1000, num_rows=600, resolution_m=0.2, num_routes=20, pathfinders=DEFAULT_PATHFINDERS,
+                  seed=0, num_targets=None, shopping_items=0):
+    supermarket = build_benchmark_map(num_cols, num_rows, resolution_m)
+    route_pairs = random_route_pairs(supermarket, num_routes, seed, num_targets)
+    print(f"Lưới {supermarket.num_rows}x{supermarket.num_cols}, {num_routes} tuyến ngẫu nhiên"
+          + (f" tới {num_targets} đích." if num_targets is not None else "."))
+
+    results = {}
+    for name in pathfinders:
+        paths, result = benchmark_pathfinder(name, supermarket, route_pairs)
+        result["path_lengths"] = [None if path is None else len(path) for path in paths]
+        # Các bộ tìm đường có thể chọn đường khác nhau nhưng độ dài ngắn nhất phải bằng nhau
+        result["same_lengths_as"] = [other for other in results
+                                     if results[other]["path_lengths"] == result["path_lengths"]]
+        # HPA* chỉ gần tối ưu: tỉ lệ độ dài đường so với từng bộ trước đó (trung bình, lớn nhất)
+        result["length_ratio_vs"] = {}
+        for other in results:
+            ratios = [len_self / len_other for len_self, len_other in zip(result["path_lengths"], results[other]["path_lengths"])
+                      if len_self is not None and len_other is not None]
+            if ratios:
+                result["length_ratio_vs"][other] = {"mean": float(np.mean(ratios)), "max": float(np.max(ratios))}
+        result["speedup_vs"] = {other: results[other]["total_s"] / result["total_s"]
+                                for other in results if result["total_s"] > 0}
+        results[name] = result
+        speedups = ", ".join(f"nhanh hơn {other} {ratio:.1f}x" for other, ratio in result["speedup_vs"].items())
+        print(f"  {name:>19}: lần đầu {result['first_call_s']:.2f}s | mỗi tuyến p50/p95 "
+              f"{result['route_ms']['p50']:.1f}/{result['route_ms']['p95']:.1f} ms"
+              + (f" | {speedups}" if speedups else ""))
+    shopping = benchmark_shopping_routes(supermarket, shopping_items, seed=seed) if shopping_items else None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit_hash(),
+        "grid_shape": [supermarket.num_rows, supermarket.num_cols],
+        "resolution_m": resolution_m,
+        "num_routes": num_routes,
+        "num_targets": num_targets,
+        "seed": seed,
+        "pathfinders": results,
+        "shopping_routes": shopping,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tìm đường WinCart")
+    parser.add_argument("--cols", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=600)
+    parser.add_argument("--resolution", type=float, default=0.2, help="Kích thước ô (m) của bố cục tổng hợp")
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--targets", type=int, default=None,
+                        help="Số đích cố định mà các tuyến cùng tới; mặc định mỗi tuyến một đích ngẫu nhiên")
+    parser.add_argument("--pathfinders", nargs="+", choices=list(PATHFINDERS), default=list(DEFAULT_PATHFINDERS))
+    parser.add_argument("--shopping-items", type=int, default=0,
+                        help="Số mặt hàng mỗi danh sách khi benchmark lập lộ trình mua sắm; 0 để bỏ qua")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="pathfinding_benchmark.json", help="File JSON kết quả")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.cols, args.rows, args.resolution, args.routes, args.pathfinders, args.seed,
+                            args.targets, args.shopping_items)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Đã ghi kết quả benchmark vào {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# route_planner.py
+# Lập lộ trình cho cả danh sách mua sắm: thứ tự ghé các mặt hàng được dựng bằng láng giềng gần
+# nhất rồi cải thiện bằng 2-opt và Or-opt trên quãng đường đi bộ thật (item_distances), điểm tiếp
+# cận của mỗi mặt hàng được chọn lại tối ưu cho thứ tự đó (quy hoạch động). Kết quả là một đường
+# đi nối liền mà simulate_cart_movement_along_path có thể đi theo.
+import time
+import numpy as np
+import grid_pathfinding
+
+_UNREACHABLE = 1 << 40 # Chi phí thay cho -1 (không đi tới được) trong ma trận quãng đường
+
+def _route_cost(order, choice, start_costs, spot_costs, end_costs):
+    cost = start_costs[choice[order[0]]]
+    for a, b in zip(order, order[1:]):
+        cost += spot_costs[choice[a], choice[b]]
+    return cost + end_costs[choice[order[-1]]]
+
+def _improve_order(order, choice, start_costs, spot_costs, end_costs):
+    """
+    2-opt (đảo một đoạn) và Or-opt (dời một đoạn 1-3 mặt hàng, có thể đảo chiều, sang chỗ khác)
+    với điểm tiếp cận cố định, lặp tới khi không còn bước nào làm ngắn lộ trình.
+    """
+    # Ma trận chi phí giữa các mặt hàng (danh sách Python, tra nhanh hơn ndarray trong vòng lặp);
+    # chỉ số n là điểm xuất phát, n + 1 là điểm kết thúc
+    n = len(order)
+    spots = np.array([choice[item] for item in range(n)])
+    cost = np.zeros((n + 2, n + 2), dtype=np.int64)
+    cost[:n, :n] = spot_costs[np.ix_(spots, spots)]
+    cost[n, :n] = start_costs[spots]
+    cost[:n, n + 1] = end_costs[spots]
+    cost = cost.tolist()
+    tour = [n] + list(order) + [n + 1]
+
+    improved = True
+    while improved:
+        improved = False
+        # 2-opt: đảo tour[i..j]; khoảng cách đối xứng nên phần giữa đoạn đảo không đổi chi phí
+        for i in range(1, n):
+            for j in range(i + 1, n + 1):
+                a, b, c, d = tour[i - 1], tour[i], tour[j], tour[j + 1]
+                if cost[a][c] + cost[b][d] < cost[a][b] + cost[c][d]:
+                    tour[i:j + 1] = tour[i:j + 1][::-1]
+                    improved = True
+        # Or-opt: dời tour[i:i+length] vào giữa hai mặt hàng liền nhau khác
+        for length in (1, 2, 3):
+            i = 1
+            while i + length <= n + 1:
+                first, last = tour[i], tour[i + length - 1]
+                before, after = tour[i - 1], tour[i + length]
+                removed = cost[before][first] + cost[last][after] - cost[before][after]
+                best = None
+                for k in range(len(tour) - 1):
+                    if i - 1 <= k <= i + length - 1:
+                        continue # Cạnh nằm trong hoặc kề đoạn đang dời
+                    left, right = tour[k], tour[k + 1]
+                    gain = removed - (cost[left][first] + cost[last][right] - cost[left][right])
+                    gain_reversed = removed - (cost[left][last] + cost[first][right] - cost[left][right])
+                    if gain > 0 and (best is None or gain > best[0]):
+                        best = (gain, k, False)
+                    if gain_reversed > 0 and (best is None or gain_reversed > best[0]):
+                        best = (gain_reversed, k, True)
+                if best is not None:
+                    _, k, reverse = best
+                    segment = tour[i:i + length]
+                    if reverse:
+                        segment.reverse()
+                    rest = tour[:i] + tour[i + length:]
+                    insert_at = k + 1 if k < i else k + 1 - length
+                    tour = rest[:insert_at] + segment + rest[insert_at:]
+                    improved = True
+                i += 1
+    return tour[1:-1]
+
+def _choose_spots(order, item_spots, start_costs, spot_costs, end_costs):
+    """Điểm tiếp cận tối ưu cho từng mặt hàng theo thứ tự `order` (quy hoạch động trên chuỗi)."""
+    costs = {spot: start_costs[spot] for spot in item_spots[order[0]]}
+    back_links = []
+    for prev_item, item in zip(order, order[1:]):
+        links, next_costs = {}, {}
+        for spot in item_spots[item]:
+            best_prev = min(costs, key=lambda prev_spot: costs[prev_spot] + spot_costs[prev_spot, spot])
+            links[spot] = best_prev
+            next_costs[spot] = costs[best_prev] + spot_costs[best_prev, spot]
+        back_links.append(links)
+        costs = next_costs
+    spot = min(costs, key=lambda last_spot: costs[last_spot] + end_costs[last_spot])
+    choice = {order[-1]: spot}
+    for item, links in zip(reversed(order[:-1]), reversed(back_links)):
+        spot = links[spot]
+        choice[item] = spot
+    return choice
+
+def order_stops(item_spots, start_costs, spot_costs, end_costs=None):
+    """
+    Thứ tự ghé và điểm tiếp cận cho các mặt hàng.
+    item_spots: danh sách, mỗi mặt hàng một danh sách chỉ số điểm tiếp cận;
+    start_costs[p]: quãng đường từ điểm xuất phát tới điểm p; spot_costs[p, q]: giữa hai điểm;
+    end_costs[p]: từ p về điểm kết thúc (None: lộ trình mở, kết thúc ở mặt hàng cuối).
+    Trả về (thứ tự các mặt hàng, điểm tiếp cận của từng mặt hàng theo thứ tự đó, tổng quãng đường).
+    """
+    end_costs = np.zeros_like(start_costs) if end_costs is None else end_costs
+    num_items = len(item_spots)
+    # Láng giềng gần nhất: từ vị trí hiện tại tới điểm tiếp cận gần nhất của mặt hàng chưa ghé
+    order, choice = [], {}
+    current_costs = start_costs
+    remaining = set(range(num_items))
+    while remaining:
+        item, spot = min(((item, spot) for item in remaining for spot in item_spots[item]),
+                         key=lambda item_spot: current_costs[item_spot[1]])
+        order.append(item)
+        choice[item] = spot
+        remaining.remove(item)
+        current_costs = spot_costs[spot]
+
+    # Cải thiện thứ tự với điểm tiếp cận cố định, rồi chọn lại điểm tiếp cận cho thứ tự mới
+    cost = _route_cost(order, choice, start_costs, spot_costs, end_costs)
+    while True:
+        order = _improve_order(order, choice, start_costs, spot_costs, end_costs)
+        choice = _choose_spots(order, item_spots, start_costs, spot_costs, end_costs)
+        new_cost = _route_cost(order, choice, start_costs, spot_costs, end_costs)
+        if new_cost >= cost:
+            break
+        cost = new_cost
+    return order, [choice[item] for item in order], int(new_cost)
+
+def plan_shopping_route(supermarket_map_obj, start_rc, item_names, return_to_start=False):
+    """
+    Lộ trình ghé mọi mặt hàng trong item_names (tên không phân biệt hoa thường) từ start_rc.
+    Quãng đường giữa các điểm tiếp cận lấy từ SupermarketMap.get_item_distance_table();
+    quãng đường từ start_rc tới các điểm tiếp cận do một BFS từ start_rc (dừng khi đã tới mọi điểm).
+    Mặt hàng không có trên bản đồ hoặc không đi tới được bị bỏ qua (có thông báo).
+    Trả về dict:
+      "stops": danh sách (tên mặt hàng, điểm tiếp cận) theo thứ tự ghé,
+      "path": đường đi nối liền (hàng, cột) từ start_rc qua mọi điểm dừng (như find_path_astar),
+      "total_steps": số bước của path, "skipped_items": tên bị bỏ qua,
+      "distances_ms"/"order_ms"/"path_ms": thời gian BFS từ điểm xuất phát, sắp thứ tự
+      và dựng đường đi;
+    hoặc None nếu start_rc không đi được hay không còn mặt hàng nào để ghé.
+    """
+    table = supermarket_map_obj.get_item_distance_table()
+    grid_astar = supermarket_map_obj.get_grid_astar()
+    start_rc = (int(start_rc[0]), int(start_rc[1]))
+    if not grid_astar.is_walkable(start_rc):
+        print(f"Lỗi lập lộ trình: Điểm bắt đầu ({start_rc}) không phải lối đi.")
+        return None
+
+    item_names_found, skipped_items = [], []
+    for item_name in item_names:
+        canonical_name = table.canonical_item_name(item_name)
+        if canonical_name is None:
+            skipped_items.append(item_name)
+        elif canonical_name not in item_names_found:
+            item_names_found.append(canonical_name)
+
+    t_start = time.perf_counter()
+    # Quãng đường từ điểm xuất phát tới mọi điểm tiếp cận của các mặt hàng cần ghé
+    candidate_spots = sorted({spot for name in item_names_found for spot in table.item_spots[name]})
+    candidate_ids = [grid_astar.node_id(table.spots[spot]) for spot in candidate_spots]
+    start_fields, start_directions = grid_pathfinding.bfs_distance_fields(
+        grid_astar.walkable_flat, grid_astar.stride, [grid_astar.node_id(start_rc)],
+        with_directions=True, stop_ids=candidate_ids)
+    start_costs = np.full(len(table.spots), _UNREACHABLE, dtype=np.int64)
+    start_costs[candidate_spots] = np.where(start_fields[0, candidate_ids] >= 0, start_fields[0, candidate_ids], _UNREACHABLE)
+    spot_costs = np.where(table.distances >= 0, table.distances, _UNREACHABLE).astype(np.int64)
+
+    # Mặt hàng không có điểm tiếp cận nào đi tới được từ điểm xuất phát
+    item_spots = []
+    for item_name in list(item_names_found):
+        reachable = [spot for spot in table.item_spots[item_name] if start_costs[spot] < _UNREACHABLE]
+        if reachable:
+            item_spots.append(reachable)
+        else:
+            item_names_found.remove(item_name)
+            skipped_items.append(item_name)
+    if skipped_items:
+        print(f"Lập lộ trình: bỏ qua mặt hàng không có hoặc không tới được: {skipped_items}")
+    if not item_spots:
+        return None
+
+    distances_ms = (time.perf_counter() - t_start) * 1e3
+
+    t_start = time.perf_counter()
+    end_costs = start_costs if return_to_start else None
+    order, spots, _ = order_stops(item_spots, start_costs, spot_costs, end_costs)
+    order_ms = (time.perf_counter() - t_start) * 1e3
+
+    # Nối các chặng: điểm xuất phát -> điểm dừng đầu theo BFS ở trên, giữa các điểm dừng theo bảng
+    # (dựng lại từ mảng hướng nếu bảng giữ chúng, xem config.ITEM_DISTANCE_STORE_PREDECESSORS)
+    t_start = time.perf_counter()
+    first_leg = grid_pathfinding.trace_bfs_path(start_directions[0], grid_astar.stride,
+                                                grid_astar.node_id(table.spots[spots[0]]))
+    path = [grid_astar.node_rc(node_id) for node_id in first_leg]
+    for spot_a, spot_b in zip(spots, spots[1:]):
+        path.extend(table.path_between_spots(table.spots[spot_a], table.spots[spot_b])[1:])
+    if return_to_start: # Chặng về: đảo chiều đường BFS từ điểm xuất phát tới điểm dừng cuối
+        last_leg = grid_pathfinding.trace_bfs_path(start_directions[0], grid_astar.stride,
+                                                   grid_astar.node_id(table.spots[spots[-1]]))
+        path.extend(grid_astar.node_rc(node_id) for node_id in reversed(last_leg[:-1]))
+    path_ms = (time.perf_counter() - t_start) * 1e3
+
+    return {
+        "stops": [(item_names_found[item], table.spots[spot]) for item, spot in zip(order, spots)],
+        "path": path,
+        "total_steps": len(path) - 1,
+        "skipped_items": skipped_items,
+        "distances_ms": distances_ms,
+        "order_ms": order_ms,
+        "path_ms": path_ms,
+    }
@@ -1,7 +1,40 @@
 import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np
 import config # Import các hằng số từ config.py
-from supermarket_model import PATHWAY_ID, AP_ID # Import ID cần thiết
+import noise_models
+from supermarket_model import PATHWAY_ID, AP_ID, OBSTACLE_ID, STALL_ID_START, STALL_ID_END, ITEM_ID_START # Import ID cần thiết
+
+# Các hằng số trong config.py mà mô hình vô tuyến sử dụng
+RADIO_MODEL_CONFIG_KEYS = (
+    "GRID_RESOLUTION_M",
+    "P_TX_MAX_RSSI",
+    "PATH_LOSS_EXPONENT_N",
+    "SHELF_ATTENUATION_DB",
+    "MATERIAL_ATTENUATION_DB",
+    "NOISE_STD_DEV_DB",
+    "MIN_RSSI_THRESHOLD",
+    "NOISE_MODEL",
+    "NOISE_SEED",
+    "SHADOW_FADING_CORR_DISTANCE_M",
+    "SHADOW_FADING_IID_FRACTION",
+)
+
+_default_noise_model = None # Tạo lần đầu khi cần, theo config.NOISE_MODEL / config.NOISE_SEED
+
+def get_default_noise_model():
+    """Mô hình nhiễu dùng chung khi hàm gọi không truyền noise_model."""
+    global _default_noise_model
+    if _default_noise_model is None:
+        _default_noise_model = noise_models.create_noise_model(config.NOISE_MODEL, seed=config.NOISE_SEED)
+    return _default_noise_model
+
+def set_default_noise_model(noise_model):
+    """Thay mô hình nhiễu mặc định (None để tạo lại từ config ở lần dùng tiếp theo)."""
+    global _default_noise_model
+    _default_noise_model = noise_model
 
 def euclidean_distance_m(p1_grid_rc, p2_grid_rc): # Đổi tên tham số cho rõ ràng (row, col)
     """Tính khoảng cách Euclide giữa hai điểm trên lưới (tính bằng mét)."""
@@ -31,7 +64,7 @@ def get_line_cells_rc(r1, c1, r2, c2): # Đổi tên và tham số để rõ rà
             err -= dy
             current_x += sx
         if e2 < dx:
-            err += dy
+            err += dx
             current_y += sy
     return points
 
@@ -57,26 +90,249 @@ def count_obstacle_intersections_on_map(supermarket_map_obj, ap_pos_rc, cell_pos
                 obstacle_crossings += 1
     return obstacle_crossings
 
-def calculate_single_rssi_on_map(supermarket_map_obj, ap_pos_rc, cell_pos_rc):
+def material_attenuation_db(cell_id):
+    """
+    Suy hao (dB) của một ô có mã cell_id theo bảng config.MATERIAL_ATTENUATION_DB.
+    Lối đi và ô AP không suy hao; mã không thuộc nhóm nào dùng config.SHELF_ATTENUATION_DB.
+    """
+    materials = config.MATERIAL_ATTENUATION_DB
+    if cell_id == PATHWAY_ID or cell_id == AP_ID:
+        return 0.0
+    if cell_id == OBSTACLE_ID:
+        return float(materials.get("wall", config.SHELF_ATTENUATION_DB))
+    if STALL_ID_START <= cell_id <= STALL_ID_END:
+        return float(materials.get("stall", config.SHELF_ATTENUATION_DB))
+    if cell_id >= ITEM_ID_START:
+        return float(materials.get("item", config.SHELF_ATTENUATION_DB))
+    return float(config.SHELF_ATTENUATION_DB)
+
+def build_attenuation_raster(grid):
+    """
+    Bản đồ suy hao theo ô: mảng float64 (hàng, cột), giá trị như material_attenuation_db
+    nhưng tính cho cả lưới bằng NumPy.
+    """
+    materials = config.MATERIAL_ATTENUATION_DB
+    fallback = config.SHELF_ATTENUATION_DB
+    return np.select(
+        [(grid == PATHWAY_ID) | (grid == AP_ID),
+         grid == OBSTACLE_ID,
+         (grid >= STALL_ID_START) & (grid <= STALL_ID_END),
+         grid >= ITEM_ID_START],
+        [0.0,
+         materials.get("wall", fallback),
+         materials.get("stall", fallback),
+         materials.get("item", fallback)],
+        default=fallback,
+    ).astype(np.float64)
+
+def sum_obstacle_attenuation_on_map(supermarket_map_obj, ap_pos_rc, cell_pos_rc):
+    """
+    Tổng suy hao vật liệu (dB) trên đường thẳng từ AP đến cell_pos_rc,
+    bỏ qua ô đầu và ô cuối như count_obstacle_intersections_on_map.
+    """
+    line_cells = get_line_cells_rc(ap_pos_rc[0], ap_pos_rc[1], cell_pos_rc[0], cell_pos_rc[1])
+    grid = supermarket_map_obj.grid_map
+    num_r, num_c = grid.shape
+    total_attenuation_db = 0.0
+    # Cộng theo đúng thứ tự dọc tia như _integrate_along_rays để hai bản cho cùng kết quả
+    for r, c in line_cells[1:-1]:
+        if 0 <= r < num_r and 0 <= c < num_c:
+            total_attenuation_db += material_attenuation_db(grid[r, c])
+    return total_attenuation_db
+
+def _integrate_along_rays(raster, start_r, start_c, end_r, end_c):
+    """
+    Bước song song mọi tia Bresenham (start -> end) và cộng dồn giá trị của raster
+    trên đường đi, bỏ qua ô đầu và ô cuối như count_obstacle_intersections_on_map.
+    Các tia được sắp xếp theo độ dài giảm dần để ở mỗi bước chỉ xử lý một lát cắt
+    đầu mảng gồm các tia còn đang đi (không cần mặt nạ hay chỉ mục nâng cao).
+    raster: mảng (hàng, cột), ví dụ số int32 0/1 (đếm vật cản) hoặc suy hao dB float64;
+            kết quả có cùng kiểu với raster.
+    start_r, start_c, end_r, end_c: mảng 1 chiều cùng độ dài (int64).
+    """
+    # Cùng quy ước (c,r) -> (x,y) như get_line_cells_rc
+    dx = np.abs(end_c - start_c)
+    dy = np.abs(end_r - start_r)
+    num_steps = np.maximum(dx, dy) # Số bước để tia chạm tới ô đích
+    order = np.argsort(-num_steps, kind='stable')
+
+    x = start_c[order].copy()
+    y = start_r[order].copy()
+    dx, dy, num_steps = dx[order], dy[order], num_steps[order]
+    sx = np.where(x < end_c[order], 1, -1)
+    sy = np.where(y < end_r[order], 1, -1)
+    err = dx - dy
+
+    totals_sorted = np.zeros(num_steps.shape[0], dtype=raster.dtype)
+    max_steps = int(num_steps[0]) if num_steps.shape[0] else 0
+    # num_steps giảm dần nên số tia còn ô trung gian ở bước `step` là một tiền tố
+    num_alive_by_step = np.searchsorted(-num_steps, -np.arange(max_steps), side='left')
+    # Bước cuối cùng rơi vào ô đích (không được cộng) nên chỉ đi tới max_steps - 1
+    for step in range(1, max_steps):
+        n = num_alive_by_step[step]
+        e2 = 2 * err[:n]
+        move_x = e2 > -dy[:n]
+        move_y = e2 < dx[:n]
+        err[:n] += dx[:n] * move_y - dy[:n] * move_x
+        x[:n] += sx[:n] * move_x
+        y[:n] += sy[:n] * move_y
+        totals_sorted[:n] += raster[y[:n], x[:n]]
+
+    totals = np.empty_like(totals_sorted)
+    totals[order] = totals_sorted
+    return totals
+
+def _blocking_raster(grid):
+    """Mảng int32 (hàng, cột): 1 nếu ô chặn tín hiệu (không phải lối đi, không phải AP)."""
+    return ((grid != PATHWAY_ID) & (grid != AP_ID)).astype(np.int32)
+
+def _ray_batch(raster, ap_pos_rc, cells_r, cells_c):
+    cells_r = np.asarray(cells_r, dtype=np.int64)
+    cells_c = np.asarray(cells_c, dtype=np.int64)
+    start_r = np.full(cells_r.shape[0], ap_pos_rc[0], dtype=np.int64)
+    start_c = np.full(cells_c.shape[0], ap_pos_rc[1], dtype=np.int64)
+    return _integrate_along_rays(raster, start_r, start_c, cells_r, cells_c)
+
+def count_obstacle_intersections_batch(grid, ap_pos_rc, cells_r, cells_c):
+    """
+    Phiên bản vector hóa của count_obstacle_intersections_on_map:
+    đếm số ô vật cản trên đường từ một AP đến nhiều ô cùng lúc.
+    grid: mảng grid_map (hàng, cột).
+    ap_pos_rc: (hàng_ap, cột_ap)
+    cells_r, cells_c: mảng 1 chiều chỉ số hàng/cột của các ô đích.
+    Trả về mảng int32 cùng độ dài với cells_r.
+    """
+    return _ray_batch(_blocking_raster(grid), ap_pos_rc, cells_r, cells_c)
+
+def sum_obstacle_attenuation_batch(attenuation_raster, ap_pos_rc, cells_r, cells_c):
+    """
+    Phiên bản vector hóa của sum_obstacle_attenuation_on_map trên một raster suy hao
+    đã tính sẵn (build_attenuation_raster). Trả về mảng float64 cùng độ dài với cells_r.
+    """
+    return _ray_batch(attenuation_raster, ap_pos_rc, cells_r, cells_c)
+
+def _integrate_raster_tensor(raster, access_points):
+    """Tích phân raster dọc tia từ mỗi AP tới mỗi ô; trả về mảng (hàng, cột, AP) cùng kiểu raster."""
+    num_rows, num_cols = raster.shape
+    num_aps = len(access_points)
+    if num_aps == 0:
+        return np.zeros((num_rows, num_cols, 0), dtype=raster.dtype)
+
+    cells_r, cells_c = np.indices((num_rows, num_cols)).reshape(2, -1)
+    ap_rc = np.asarray(access_points, dtype=np.int64).reshape(num_aps, 2)
+    # Bố cục (ô, AP) phẳng: ô thay đổi chậm, AP thay đổi nhanh
+    end_r = np.repeat(cells_r, num_aps)
+    end_c = np.repeat(cells_c, num_aps)
+    start_r = np.tile(ap_rc[:, 0], cells_r.shape[0])
+    start_c = np.tile(ap_rc[:, 1], cells_c.shape[0])
+    totals = _integrate_along_rays(raster, start_r, start_c, end_r, end_c)
+    return totals.reshape(num_rows, num_cols, num_aps)
+
+def compute_obstacle_crossings_tensor(grid, access_points):
+    """
+    Tính số ô vật cản giữa mỗi AP và mỗi ô của bản đồ trong một lượt duyệt tia
+    (tất cả các cặp AP-ô được bước cùng lúc).
+    Trả về mảng int32 (hàng, cột, AP), cùng bố cục với tensor fingerprint.
+    """
+    return _integrate_raster_tensor(_blocking_raster(grid), access_points)
+
+def compute_obstacle_attenuation_tensor(grid, access_points):
+    """
+    Như compute_obstacle_crossings_tensor nhưng cộng suy hao vật liệu (build_attenuation_raster)
+    thay vì đếm ô: trả về mảng float64 (hàng, cột, AP), đơn vị dB.
+    """
+    return _integrate_raster_tensor(build_attenuation_raster(grid), access_points)
+
+def rays_affected_by_changes(grid_shape, access_points, changes):
+    """
+    Xác định các cặp (ô, AP) có thể bị ảnh hưởng bởi danh sách thay đổi bố cục
+    (xem SupermarketMap.get_layout_changes_since).
+    Với vùng ("rect", r0, c0, r1, c1): tia AP -> ô bị ảnh hưởng nếu đoạn thẳng nối tâm hai ô
+    cắt vùng đó nới rộng thêm 1 ô (ô Bresenham luôn lệch dưới nửa ô so với đoạn thẳng lý tưởng,
+    nên phép thử này không bỏ sót tia nào). Với ("ap", k): mọi ô của AP k.
+    Trả về mảng bool (hàng, cột, AP).
+    """
+    num_rows, num_cols = grid_shape
+    num_aps = len(access_points)
+    affected = np.zeros((num_rows, num_cols, num_aps), dtype=bool)
+    if num_aps == 0:
+        return affected
+    cells_r, cells_c = np.indices((num_rows, num_cols))
+    ap_rc = np.asarray(access_points, dtype=np.float64).reshape(num_aps, 2)
+
+    for change in changes:
+        if change[0] == "ap":
+            affected[:, :, change[1]] = True
+            continue
+        _, r0, c0, r1, c1 = change
+        lo_r, hi_r = r0 - 1.0, r1 # Ô [r0, r1) nới rộng 1 ô mỗi phía, theo tọa độ tâm ô
+        lo_c, hi_c = c0 - 1.0, c1
+        for ap_idx in range(num_aps):
+            start_r, start_c = ap_rc[ap_idx]
+            # Thuật toán Liang-Barsky: đoạn start + t * (ô - start), t trong [0, 1]
+            t_min = np.zeros((num_rows, num_cols))
+            t_max = np.ones((num_rows, num_cols))
+            inside = np.ones((num_rows, num_cols), dtype=bool)
+            for start, delta, lo, hi in ((start_r, cells_r - start_r, lo_r, hi_r),
+                                         (start_c, cells_c - start_c, lo_c, hi_c)):
+                parallel = delta == 0
+                inside &= ~parallel | ((lo <= start) & (start <= hi))
+                safe_delta = np.where(parallel, 1.0, delta)
+                t1 = (lo - start) / safe_delta
+                t2 = (hi - start) / safe_delta
+                t_min = np.where(parallel, t_min, np.maximum(t_min, np.minimum(t1, t2)))
+                t_max = np.where(parallel, t_max, np.minimum(t_max, np.maximum(t1, t2)))
+            affected[:, :, ap_idx] |= inside & (t_min <= t_max)
+    return affected
+
+def update_obstacle_attenuation_tensor(grid, access_points, attenuation, changes):
+    """
+    Cập nhật tensor suy hao vật cản (từ compute_obstacle_attenuation_tensor) sau các thay đổi
+    bố cục: chỉ dò lại các tia đi qua vùng thay đổi hoặc xuất phát từ AP mới.
+    Trả về tensor mới (có thể thêm kênh nếu có AP mới); tensor cũ không bị sửa.
+    """
+    num_rows, num_cols = grid.shape
+    num_aps = len(access_points)
+    updated = np.zeros((num_rows, num_cols, num_aps), dtype=np.float64)
+    num_old_aps = min(attenuation.shape[2], num_aps)
+    updated[:, :, :num_old_aps] = attenuation[:, :, :num_old_aps]
+    changes = list(changes) + [("ap", k) for k in range(num_old_aps, num_aps)]
+
+    affected = rays_affected_by_changes(grid.shape, access_points, changes)
+    end_r, end_c, ap_idx = np.nonzero(affected)
+    if end_r.shape[0] == 0:
+        return updated
+    ap_rc = np.asarray(access_points, dtype=np.int64).reshape(num_aps, 2)
+    updated[end_r, end_c, ap_idx] = _integrate_along_rays(
+        build_attenuation_raster(grid), ap_rc[ap_idx, 0], ap_rc[ap_idx, 1], end_r, end_c
+    )
+    return updated
+
+def calculate_single_rssi_on_map(supermarket_map_obj, ap_pos_rc, cell_pos_rc, rng=None):
     """
     Tính toán RSSI mô phỏng tại cell_pos_rc từ một AP cụ thể trên supermarket_map_obj.
+    rng: nguồn nhiễu (np.random.Generator), mặc định là rng của mô hình nhiễu mặc định.
+    Luôn dùng nhiễu Gaussian i.i.d. (đây là bản tham chiếu vô hướng).
     """
+    if rng is None:
+        rng = get_default_noise_model().rng
     distance_m = euclidean_distance_m(ap_pos_rc, cell_pos_rc)
 
     if distance_m < config.GRID_RESOLUTION_M / 2: # Ở rất gần hoặc trùng AP
-        return config.P_TX_MAX_RSSI + np.random.normal(0, config.NOISE_STD_DEV_DB / 3)
+        return config.P_TX_MAX_RSSI + rng.normal(0, config.NOISE_STD_DEV_DB / 3)
 
     path_loss_db = 10 * config.PATH_LOSS_EXPONENT_N * math.log10(distance_m)
     
-    num_obstacles = count_obstacle_intersections_on_map(supermarket_map_obj, ap_pos_rc, cell_pos_rc)
-    total_obstacle_attenuation_db = num_obstacles * config.SHELF_ATTENUATION_DB # Sử dụng chung suy hao
+    # Suy hao theo vật liệu của từng ô trên tia (config.MATERIAL_ATTENUATION_DB)
+    total_obstacle_attenuation_db = sum_obstacle_attenuation_on_map(supermarket_map_obj, ap_pos_rc, cell_pos_rc)
 
-    noise_db = np.random.normal(0, config.NOISE_STD_DEV_DB)
+    noise_db = rng.normal(0, config.NOISE_STD_DEV_DB)
     
     rssi = config.P_TX_MAX_RSSI - path_loss_db - total_obstacle_attenuation_db + noise_db
     return max(rssi, config.MIN_RSSI_THRESHOLD)
 
-def generate_rssi_fingerprints_from_map(supermarket_map_obj):
+def _generate_rssi_fingerprints_scalar(supermarket_map_obj, rng):
+    """Bản cài đặt gốc: lặp từng ô, từng AP bằng Python (dùng để đối chiếu)."""
     grid = supermarket_map_obj.grid_map
     num_rows, num_cols = supermarket_map_obj.num_rows, supermarket_map_obj.num_cols
     access_points = supermarket_map_obj.access_points
@@ -90,17 +346,317 @@ def generate_rssi_fingerprints_from_map(supermarket_map_obj):
         for c_idx in range(num_cols):
             if grid[r_idx, c_idx] == PATHWAY_ID or grid[r_idx, c_idx] == AP_ID:
                 for ap_idx, ap_pos in enumerate(access_points):
-                    rssi_val = calculate_single_rssi_on_map(supermarket_map_obj, ap_pos, (r_idx, c_idx))
+                    rssi_val = calculate_single_rssi_on_map(supermarket_map_obj, ap_pos, (r_idx, c_idx), rng)
                     fingerprints_array[r_idx, c_idx, ap_idx] = rssi_val
     return fingerprints_array # Trả về mảng NumPy
 
-def get_observed_rssi_at_cart_on_map(supermarket_map_obj, cart_pos_rc):
+def _cell_ap_offsets(cells_r, cells_c, access_points):
+    """Trả về hiệu (ô - AP) theo hàng và cột, dạng mảng (N, số AP)."""
+    num_aps = len(access_points)
+    ap_rc = np.asarray(access_points, dtype=np.int64).reshape(num_aps, 2)
+    return cells_r[:, None] - ap_rc[None, :, 0], cells_c[:, None] - ap_rc[None, :, 1]
+
+def _model_rssi_db(offset_r, offset_c, obstacle_attenuation_db, standard_noise):
     """
-    Tính toán RSSI 'quan sát được' tại vị trí xe đẩy trên supermarket_map_obj.
+    Mô hình log-distance dạng vector, cùng công thức với calculate_single_rssi_on_map.
+    offset_r, offset_c: hiệu (ô - AP) theo hàng/cột của từng cặp (ô, AP).
+    obstacle_attenuation_db: tổng suy hao vật cản (dB) trên mỗi tia.
+    standard_noise: mẫu chuẩn N(0, 1), được nhân với độ lệch chuẩn phù hợp.
+    Mọi tham số có cùng shape; trả về mảng float64 cùng shape.
     """
-    observed_rssi = []
+    distance_m = np.sqrt((offset_r ** 2 + offset_c ** 2).astype(np.float64)) * config.GRID_RESOLUTION_M
+    near_ap = distance_m < config.GRID_RESOLUTION_M / 2 # Ở rất gần hoặc trùng AP
+
+    path_loss_db = 10 * config.PATH_LOSS_EXPONENT_N * np.log10(np.where(near_ap, 1.0, distance_m))
+    noise_std = np.where(near_ap, config.NOISE_STD_DEV_DB / 3, config.NOISE_STD_DEV_DB)
+    noise_db = standard_noise * noise_std
+
+    rssi = config.P_TX_MAX_RSSI - path_loss_db - obstacle_attenuation_db + noise_db
+    return np.where(near_ap, config.P_TX_MAX_RSSI + noise_db,
+                    np.maximum(rssi, config.MIN_RSSI_THRESHOLD))
+
+def _generate_rssi_fingerprints_vectorized(supermarket_map_obj, noise_model, rng):
+    """
+    Tính toàn bộ tensor (hàng, cột, AP) bằng NumPy: khoảng cách, suy hao đường truyền,
+    suy hao vật cản và nhiễu cho mọi ô lối đi cùng lúc.
+    Suy hao vật cản được tra từ bộ đệm của bản đồ (SupermarketMap.get_obstacle_attenuation_db).
+    Với mô hình i.i.d., nhiễu được rút theo đúng thứ tự hàng -> cột -> AP của bản vô hướng,
+    nên với cùng một rng hai bản cho ra cùng kết quả.
+    """
+    grid = supermarket_map_obj.grid_map
+    num_rows, num_cols = supermarket_map_obj.num_rows, supermarket_map_obj.num_cols
+    access_points = supermarket_map_obj.access_points
+    num_aps = len(access_points)
+
+    fingerprints_array = np.full((num_rows, num_cols, num_aps), np.nan, dtype=np.float32)
+    walkable = (grid == PATHWAY_ID) | (grid == AP_ID)
+    cells_r, cells_c = np.nonzero(walkable) # np.nonzero trả về theo thứ tự hàng -> cột
+    num_cells = cells_r.shape[0]
+    if num_cells == 0 or num_aps == 0:
+        return fingerprints_array
+
+    obstacle_attenuation_db = supermarket_map_obj.get_obstacle_attenuation_db()[cells_r, cells_c, :]
+    standard_noise = noise_model.fingerprint_noise(cells_r, cells_c, np.arange(num_aps), grid.shape, rng)
+    offset_r, offset_c = _cell_ap_offsets(cells_r, cells_c, access_points)
+    fingerprints_array[cells_r, cells_c, :] = _model_rssi_db(
+        offset_r, offset_c, obstacle_attenuation_db, standard_noise
+    )
+    return fingerprints_array
+
+def generate_rssi_fingerprints_from_map(supermarket_map_obj, seed=None, vectorized=True, workers=None,
+                                        noise_model=None):
+    """
+    Tạo tensor fingerprint RSSI (hàng, cột, AP) kiểu float32, NaN ở các ô không phải lối đi.
+    seed: nếu có, nhiễu được rút từ np.random.default_rng(seed) riêng thay vì rng của mô hình
+          nhiễu; với cùng seed, bản vector hóa và bản vô hướng cho kết quả giống hệt nhau.
+    vectorized: False để dùng vòng lặp Python gốc (chậm, chỉ dùng để đối chiếu, chỉ hỗ trợ
+                nhiễu i.i.d.).
+    workers: số tiến trình; nếu có, công việc được chia theo (AP, dải hàng) với seed dẫn xuất
+             cho từng phần, nên kết quả giống hệt nhau với mọi số worker (nhưng khác chuỗi nhiễu
+             của chế độ workers=None).
+    noise_model: một noise_models.NoiseModel, mặc định get_default_noise_model().
+    """
+    noise_model = get_default_noise_model() if noise_model is None else noise_model
+    if workers is not None:
+        return _generate_rssi_fingerprints_parallel(supermarket_map_obj, seed, workers, noise_model)
+    rng = None if seed is None else np.random.default_rng(seed)
+    if vectorized:
+        return _generate_rssi_fingerprints_vectorized(supermarket_map_obj, noise_model, rng)
+    if not isinstance(noise_model, noise_models.GaussianNoiseModel):
+        raise ValueError(f"Bản vô hướng chỉ hỗ trợ nhiễu i.i.d., không hỗ trợ '{noise_model.name}'.")
+    return _generate_rssi_fingerprints_scalar(supermarket_map_obj, noise_model.rng if rng is None else rng)
+
+# --- Tạo fingerprint song song bằng nhiều tiến trình ---
+# Công việc được chia thành các ô (AP, dải hàng) có kích thước cố định, không phụ thuộc số worker;
+# mỗi ô có seed dẫn xuất riêng từ (seed, chỉ số AP, chỉ số dải), nên kết quả giống hệt nhau
+# với mọi giá trị workers.
+PARALLEL_ROW_BAND = 32 # Số hàng mỗi dải
+
+_worker_state = {} # Trạng thái của tiến trình worker (mảng chia sẻ), gán bởi _init_fingerprint_worker
+
+def _attach_shared_array(shm_name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _init_fingerprint_worker(grid_spec, out_spec, config_values, noise_model):
+    """Chạy một lần trong mỗi worker: gắn vào vùng nhớ chia sẻ và đồng bộ tham số config."""
+    for key, value in config_values.items():
+        setattr(config, key, value)
+    grid_shm, grid = _attach_shared_array(*grid_spec)
+    out_shm, out = _attach_shared_array(*out_spec)
+    # Giữ tham chiếu tới SharedMemory để vùng nhớ không bị đóng khi còn dùng
+    _worker_state.update(grid=grid, out=out, shm=(grid_shm, out_shm), noise_model=noise_model,
+                         attenuation=build_attenuation_raster(grid))
+
+def _compute_fingerprint_tile(grid, attenuation_raster, fingerprints_array, tile, noise_model):
+    """
+    Tính các giá trị fingerprint của một AP cho các ô lối đi trong dải hàng [row_start, row_end)
+    và ghi thẳng vào fingerprints_array.
+    attenuation_raster: build_attenuation_raster(grid), tính một lần cho mọi ô.
+    tile: (ap_idx, ap_pos_rc, row_start, row_end, seed_seq)
+    """
+    ap_idx, ap_pos_rc, row_start, row_end, seed_seq = tile
+    band = grid[row_start:row_end]
+    walkable = (band == PATHWAY_ID) | (band == AP_ID)
+    cells_r, cells_c = np.nonzero(walkable)
+    if cells_r.shape[0] == 0:
+        return
+    cells_r = cells_r + row_start
+    obstacle_attenuation_db = sum_obstacle_attenuation_batch(attenuation_raster, ap_pos_rc, cells_r, cells_c)
+    standard_noise = noise_model.fingerprint_noise(
+        cells_r, cells_c, [ap_idx], grid.shape, np.random.default_rng(seed_seq)
+    )[:, 0]
+    fingerprints_array[cells_r, cells_c, ap_idx] = _model_rssi_db(
+        cells_r - ap_pos_rc[0], cells_c - ap_pos_rc[1], obstacle_attenuation_db, standard_noise
+    )
+
+def _fingerprint_tile_worker(tile):
+    _compute_fingerprint_tile(_worker_state["grid"], _worker_state["attenuation"], _worker_state["out"], tile,
+                              _worker_state["noise_model"])
+
+def _fingerprint_tiles(num_rows, access_points, seed):
+    root_seq = np.random.SeedSequence(seed)
+    tiles = []
+    for ap_idx, ap_pos in enumerate(access_points):
+        for band_idx, row_start in enumerate(range(0, num_rows, PARALLEL_ROW_BAND)):
+            tile_seq = np.random.SeedSequence(root_seq.entropy, spawn_key=(ap_idx, band_idx))
+            tiles.append((ap_idx, tuple(ap_pos), row_start, min(row_start + PARALLEL_ROW_BAND, num_rows), tile_seq))
+    return tiles
+
+def _generate_rssi_fingerprints_parallel(supermarket_map_obj, seed, workers, noise_model):
+    """
+    Chia việc tạo fingerprint theo (AP, dải hàng) cho một ProcessPoolExecutor.
+    grid_map và tensor kết quả nằm trong vùng nhớ chia sẻ (multiprocessing.shared_memory),
+    nên không phải pickle bản đồ hay kết quả qua lại giữa các tiến trình.
+    workers=1 chạy cùng các ô trong tiến trình hiện tại (không tạo pool).
+    """
+    grid = np.ascontiguousarray(supermarket_map_obj.grid_map)
+    num_rows, num_cols = grid.shape
     access_points = supermarket_map_obj.access_points
-    for ap_pos in access_points:
-        rssi_val = calculate_single_rssi_on_map(supermarket_map_obj, ap_pos, cart_pos_rc)
-        observed_rssi.append(rssi_val)
-    return observed_rssi
\ No newline at end of file
+    out_shape = (num_rows, num_cols, len(access_points))
+    tiles = _fingerprint_tiles(num_rows, access_points, seed)
+    # Tạo trước trạng thái phụ thuộc bản đồ (ví dụ trường bóng mờ) để mọi worker nhận cùng một bản
+    noise_model.prepare(grid.shape, len(access_points))
+
+    if workers <= 1 or len(tiles) <= 1:
+        fingerprints_array = np.full(out_shape, np.nan, dtype=np.float32)
+        attenuation_raster = build_attenuation_raster(grid)
+        for tile in tiles:
+            _compute_fingerprint_tile(grid, attenuation_raster, fingerprints_array, tile, noise_model)
+        return fingerprints_array
+
+    out_nbytes = int(np.prod(out_shape)) * np.dtype(np.float32).itemsize
+    grid_shm = shared_memory.SharedMemory(create=True, size=max(grid.nbytes, 1))
+    out_shm = shared_memory.SharedMemory(create=True, size=max(out_nbytes, 1))
+    try:
+        np.ndarray(grid.shape, dtype=grid.dtype, buffer=grid_shm.buf)[:] = grid
+        shared_out = np.ndarray(out_shape, dtype=np.float32, buffer=out_shm.buf)
+        shared_out[:] = np.nan
+        config_values = {key: getattr(config, key) for key in RADIO_MODEL_CONFIG_KEYS}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_fingerprint_worker,
+            initargs=((grid_shm.name, grid.shape, grid.dtype),
+                      (out_shm.name, out_shape, np.float32),
+                      config_values, noise_model),
+        ) as executor:
+            # list() để đợi tất cả các ô và ném lại ngoại lệ (nếu có) từ worker
+            list(executor.map(_fingerprint_tile_worker, tiles))
+        fingerprints_array = shared_out.copy()
+        del shared_out # Giải phóng view trước khi đóng vùng nhớ
+    finally:
+        grid_shm.close()
+        grid_shm.unlink()
+        out_shm.close()
+        out_shm.unlink()
+    return fingerprints_array
+
+def benchmark_parallel_fingerprint_generation(supermarket_map_obj, workers_options=(1, 2, 4), seed=0):
+    """
+    Đo thời gian tạo fingerprint với nhiều giá trị workers và in tốc độ so với đường đơn tiến trình
+    (generate_rssi_fingerprints_from_map với workers=None).
+    Đồng thời kiểm tra kết quả giống hệt nhau giữa các giá trị workers.
+    Trả về dict {workers: (thời gian giây, hệ số tăng tốc)}.
+    """
+    start = time.perf_counter()
+    generate_rssi_fingerprints_from_map(supermarket_map_obj, seed=seed)
+    baseline_s = time.perf_counter() - start
+    print(f"Đơn tiến trình: {baseline_s:.3f}s")
+
+    results = {}
+    reference = None
+    for workers in workers_options:
+        start = time.perf_counter()
+        fingerprints_array = generate_rssi_fingerprints_from_map(supermarket_map_obj, seed=seed, workers=workers)
+        elapsed_s = time.perf_counter() - start
+        if reference is None:
+            reference = fingerprints_array
+        identical = np.array_equal(reference, fingerprints_array, equal_nan=True)
+        speedup = baseline_s / elapsed_s if elapsed_s > 0 else float('inf')
+        results[workers] = (elapsed_s, speedup)
+        print(f"workers={workers}: {elapsed_s:.3f}s, tăng tốc x{speedup:.2f}, giống hệt workers={workers_options[0]}: {identical}")
+    return results
+
+def update_rssi_fingerprints_from_map(supermarket_map_obj, fingerprints_array, since_version, seed=None,
+                                      noise_model=None):
+    """
+    Cập nhật tensor fingerprint đã tạo ở phiên bản bố cục `since_version`
+    (SupermarketMap.layout_version tại thời điểm tạo) theo các thay đổi kể từ đó.
+    Chỉ các cặp (ô, AP) có tia đi qua vùng thay đổi, hoặc thuộc AP mới, được tính lại
+    (với nhiễu mới); các ô không còn là lối đi được gán NaN.
+    Nếu nhật ký thay đổi không còn đủ xa, tạo lại toàn bộ.
+    Trả về tensor đã cập nhật; lưu supermarket_map_obj.layout_version làm mốc cho lần sau.
+    """
+    noise_model = get_default_noise_model() if noise_model is None else noise_model
+    changes = supermarket_map_obj.get_layout_changes_since(since_version)
+    if changes is None:
+        return generate_rssi_fingerprints_from_map(supermarket_map_obj, seed=seed, noise_model=noise_model)
+    if not changes:
+        return fingerprints_array
+
+    grid = supermarket_map_obj.grid_map
+    num_rows, num_cols = supermarket_map_obj.num_rows, supermarket_map_obj.num_cols
+    access_points = supermarket_map_obj.access_points
+    num_aps = len(access_points)
+    rng = None if seed is None else np.random.default_rng(seed)
+
+    # Sao chép: mảng đầu vào có thể là memmap chỉ đọc từ bộ đệm trên đĩa
+    updated = np.full((num_rows, num_cols, num_aps), np.nan, dtype=np.float32)
+    num_old_aps = min(fingerprints_array.shape[2], num_aps)
+    updated[:, :, :num_old_aps] = fingerprints_array[:, :, :num_old_aps]
+    changes = list(changes) + [("ap", k) for k in range(num_old_aps, num_aps)]
+
+    affected = rays_affected_by_changes(grid.shape, access_points, changes)
+    walkable = (grid == PATHWAY_ID) | (grid == AP_ID)
+    updated[~walkable] = np.nan
+    cells_r, cells_c, ap_idx = np.nonzero(affected & walkable[:, :, None])
+    if cells_r.shape[0] == 0:
+        return updated
+
+    ap_rc = np.asarray(access_points, dtype=np.int64).reshape(num_aps, 2)
+    obstacle_attenuation_db = supermarket_map_obj.get_obstacle_attenuation_db()[cells_r, cells_c, ap_idx]
+    standard_noise = np.empty(cells_r.shape[0])
+    for k in np.unique(ap_idx):
+        of_ap = ap_idx == k
+        standard_noise[of_ap] = noise_model.fingerprint_noise(
+            cells_r[of_ap], cells_c[of_ap], [k], grid.shape, rng
+        )[:, 0]
+    updated[cells_r, cells_c, ap_idx] = _model_rssi_db(
+        cells_r - ap_rc[ap_idx, 0], cells_c - ap_rc[ap_idx, 1], obstacle_attenuation_db, standard_noise
+    )
+    return updated
+
+def get_observed_rssi_batch_on_map(supermarket_map_obj, positions_rc, cart_ids=None, noise_model=None):
+    """
+    Phiên bản theo lô của get_observed_rssi_at_cart_on_map: RSSI quan sát được tại N vị trí
+    trong một lần gọi vector hóa (ví dụ cả một lộ trình, hoặc cả đoàn xe trong một nhịp).
+    positions_rc: mảng (N, 2) các ô (hàng, cột).
+    cart_ids: None/một định danh (mọi hàng là các lần quét liên tiếp của cùng một xe),
+              hoặc dãy N định danh (mỗi hàng thuộc xe tương ứng, theo thứ tự thời gian).
+    Trả về mảng float64 (N, số AP).
+    """
+    noise_model = get_default_noise_model() if noise_model is None else noise_model
+    positions_rc = np.asarray(positions_rc, dtype=np.int64).reshape(-1, 2)
+    access_points = supermarket_map_obj.access_points
+    num_obs, num_aps = positions_rc.shape[0], len(access_points)
+    if num_obs == 0 or num_aps == 0:
+        return np.empty((num_obs, num_aps))
+
+    cells_r, cells_c = positions_rc[:, 0], positions_rc[:, 1]
+    grid_shape = supermarket_map_obj.grid_map.shape
+    ap_indices = np.arange(num_aps)
+    obstacle_attenuation_db = supermarket_map_obj.get_obstacle_attenuation_db()[cells_r, cells_c, :]
+
+    if np.ndim(cart_ids) == 0 and hasattr(cart_ids, "item"):
+        cart_ids = cart_ids.item() # Số NumPy (ví dụ phần tử của mảng định danh) -> một định danh Python
+    per_row_ids = cart_ids is not None and not isinstance(cart_ids, (str, tuple)) and np.ndim(cart_ids) > 0
+    if per_row_ids and noise_model.per_cart_state:
+        # Mô hình có trạng thái theo xe: rút nhiễu riêng cho từng xe, giữ thứ tự các lần quét
+        cart_ids = np.asarray(cart_ids)
+        standard_noise = np.empty((num_obs, num_aps))
+        for cart_id in dict.fromkeys(cart_ids.tolist()):
+            rows = np.nonzero(cart_ids == cart_id)[0]
+            standard_noise[rows] = noise_model.observation_noise(
+                cells_r[rows], cells_c[rows], ap_indices, grid_shape, cart_id
+            )
+    else:
+        standard_noise = noise_model.observation_noise(
+            cells_r, cells_c, ap_indices, grid_shape, None if per_row_ids else cart_ids
+        )
+
+    offset_r, offset_c = _cell_ap_offsets(cells_r, cells_c, access_points)
+    return _model_rssi_db(offset_r, offset_c, obstacle_attenuation_db, standard_noise)
+
+def get_observed_rssi_at_cart_on_map(supermarket_map_obj, cart_pos_rc, cart_id=None, noise_model=None):
+    """
+    Tính toán RSSI 'quan sát được' tại vị trí xe đẩy trên supermarket_map_obj.
+    Suy hao vật cản được tra trực tiếp từ bộ đệm của bản đồ thay vì dò lại từng tia.
+    cart_id: định danh xe, dùng bởi các mô hình nhiễu có trạng thái theo thời gian.
+    noise_model: một noise_models.NoiseModel, mặc định get_default_noise_model().
+    """
+    if not supermarket_map_obj.access_points:
+        return []
+    observed_rssi = get_observed_rssi_batch_on_map(
+        supermarket_map_obj, [cart_pos_rc], cart_id, noise_model
+    )
+    return observed_rssi[0].tolist()
\ No newline at end of file
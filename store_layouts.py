@@ -0,0 +1,117 @@
+# store_layouts.py
+# Các bố cục siêu thị dựng sẵn: bố cục demo của main_speech_interactive và bố cục tổng hợp
+# (nhiều dãy kệ, lưới AP) ở kích thước tùy ý, dùng cho benchmark và thử nghiệm.
+import contextlib
+import io
+import config
+from supermarket_model import SupermarketMap, PATHWAY_ID
+
+def _maybe_quiet(quiet):
+    """SupermarketMap in ra mỗi lần thêm kệ/mặt hàng; quiet=True để ẩn các dòng này."""
+    return contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+
+def add_perimeter_walls(supermarket):
+    supermarket.add_general_obstacle(0, 0, 1, supermarket.num_cols) # Tường trên
+    supermarket.add_general_obstacle(supermarket.num_rows - 1, 0, 1, supermarket.num_cols) # Tường dưới
+    supermarket.add_general_obstacle(0, 0, supermarket.num_rows, 1) # Tường trái
+    supermarket.add_general_obstacle(0, supermarket.num_cols - 1, supermarket.num_rows, 1) # Tường phải
+
+def build_demo_supermarket(width_m=None, height_m=None, resolution_m=None, quiet=False):
+    """
+    Bố cục của main_speech_interactive: tường bao, ba kệ (Đồ Khô, Nước Giải Khát, Gia Vị)
+    và 4 AP ở 4 góc. Kích thước mặc định theo config.
+    """
+    with _maybe_quiet(quiet):
+        supermarket = SupermarketMap(
+            width_m=config.SUPERMARKET_WIDTH_M if width_m is None else width_m,
+            height_m=config.SUPERMARKET_HEIGHT_M if height_m is None else height_m,
+            resolution_m=config.GRID_RESOLUTION_M if resolution_m is None else resolution_m
+        )
+        add_perimeter_walls(supermarket)
+
+        # Kệ Trái (chứa Sữa và Bánh mì)
+        shelf1_r, shelf1_c = supermarket.num_rows // 4, supermarket.num_cols // 5
+        shelf1_h, shelf1_w = supermarket.num_rows // 2, 3 # Kệ cao, rộng 3 ô
+        stall_id_shelf1 = supermarket.add_stall_area(shelf1_r, shelf1_c, shelf1_h, shelf1_w, "Kệ Đồ Khô")
+        if stall_id_shelf1 != -1:
+            supermarket.add_item_to_grid(shelf1_r, shelf1_c, shelf1_h // 2, shelf1_w, "Sữa", on_stall_id=stall_id_shelf1)
+            supermarket.add_item_to_grid(shelf1_r + shelf1_h // 2, shelf1_c, shelf1_h - (shelf1_h // 2), shelf1_w, "Bánh mì", on_stall_id=stall_id_shelf1)
+
+        # Kệ Phải (chứa Nước ngọt)
+        shelf2_r, shelf2_c = supermarket.num_rows // 4, (supermarket.num_cols // 5) * 3
+        shelf2_h, shelf2_w = supermarket.num_rows // 2, 3
+        stall_id_shelf2 = supermarket.add_stall_area(shelf2_r, shelf2_c, shelf2_h, shelf2_w, "Kệ Nước Giải Khát")
+        if stall_id_shelf2 != -1:
+            supermarket.add_item_to_grid(shelf2_r, shelf2_c, shelf2_h, shelf2_w, "Nước ngọt", on_stall_id=stall_id_shelf2)
+
+        # Thêm một kệ nữa cho đa dạng
+        shelf3_r, shelf3_c = supermarket.num_rows // 2 + 5 , supermarket.num_cols - 15
+        shelf3_h, shelf3_w = 10, 4
+        stall_id_shelf3 = supermarket.add_stall_area(shelf3_r, shelf3_c, shelf3_h, shelf3_w, "Kệ Gia Vị")
+        if stall_id_shelf3 != -1:
+            supermarket.add_item_to_grid(shelf3_r, shelf3_c, shelf3_h, shelf3_w, "Nước mắm", on_stall_id=stall_id_shelf3)
+
+        # Access Points ở 4 góc
+        ap_coords = [
+            (config.AP_MARGIN_CELLS, config.AP_MARGIN_CELLS),
+            (config.AP_MARGIN_CELLS, supermarket.num_cols - 1 - config.AP_MARGIN_CELLS),
+            (supermarket.num_rows - 1 - config.AP_MARGIN_CELLS, config.AP_MARGIN_CELLS),
+            (supermarket.num_rows - 1 - config.AP_MARGIN_CELLS, supermarket.num_cols - 1 - config.AP_MARGIN_CELLS)
+        ]
+        for r_ap, c_ap in ap_coords:
+            supermarket.add_access_point(r_ap, c_ap)
+    return supermarket
+
+def build_synthetic_supermarket(width_m, height_m, resolution_m=None, shelf_width_m=1.0, aisle_width_m=2.0,
+                                cross_aisle_m=3.0, ap_spacing_m=20.0, quiet=True):
+    """
+    Bố cục tổng hợp kiểu siêu thị lớn: tường bao, các dãy kệ dọc rộng shelf_width_m cách nhau
+    aisle_width_m, cắt ngang ở giữa và hai đầu bởi lối đi ngang rộng cross_aisle_m.
+    Mỗi kệ là một gian hàng chứa hai mặt hàng (nửa trên/nửa dưới).
+    AP đặt theo lưới cách đều ap_spacing_m, dời tới ô lối đi gần nhất nếu rơi vào kệ.
+    """
+    resolution_m = config.GRID_RESOLUTION_M if resolution_m is None else resolution_m
+    to_cells = lambda metres: max(1, int(round(metres / resolution_m)))
+    with _maybe_quiet(quiet):
+        supermarket = SupermarketMap(width_m=width_m, height_m=height_m, resolution_m=resolution_m)
+        add_perimeter_walls(supermarket)
+        num_rows, num_cols = supermarket.num_rows, supermarket.num_cols
+
+        shelf_w, aisle_w, cross_w = to_cells(shelf_width_m), to_cells(aisle_width_m), to_cells(cross_aisle_m)
+        block_h = (num_rows - 2 - 3 * cross_w) // 2 # Hai khối kệ, lối đi ngang ở trên, giữa và dưới
+        item_index = 0
+        if block_h >= 2:
+            for block_r in (1 + cross_w, 1 + 2 * cross_w + block_h):
+                c = 1 + aisle_w
+                while c + shelf_w <= num_cols - 1 - aisle_w:
+                    stall_id = supermarket.add_stall_area(block_r, c, block_h, shelf_w, f"Kệ {item_index // 2 + 1}")
+                    if stall_id != -1:
+                        half_h = block_h // 2
+                        supermarket.add_item_to_grid(block_r, c, half_h, shelf_w,
+                                                     f"Mặt hàng {item_index + 1}", on_stall_id=stall_id)
+                        supermarket.add_item_to_grid(block_r + half_h, c, block_h - half_h, shelf_w,
+                                                     f"Mặt hàng {item_index + 2}", on_stall_id=stall_id)
+                        item_index += 2
+                    c += shelf_w + aisle_w
+
+        ap_step = to_cells(ap_spacing_m)
+        for r_ap in range(ap_step // 2, num_rows, ap_step):
+            for c_ap in range(ap_step // 2, num_cols, ap_step):
+                spot = _nearest_pathway_cell(supermarket, r_ap, c_ap)
+                if spot is not None:
+                    supermarket.add_access_point(*spot)
+    return supermarket
+
+def _nearest_pathway_cell(supermarket, r, c, max_radius=None):
+    """Ô lối đi gần (r, c) nhất theo vòng vuông mở rộng dần, hoặc None."""
+    max_radius = max(supermarket.num_rows, supermarket.num_cols) if max_radius is None else max_radius
+    for radius in range(max_radius + 1):
+        for dr in range(-radius, radius + 1):
+            for dc in range(-radius, radius + 1):
+                if max(abs(dr), abs(dc)) != radius:
+                    continue
+                rr, cc = r + dr, c + dc
+                if 0 <= rr < supermarket.num_rows and 0 <= cc < supermarket.num_cols \
+                        and supermarket.grid_map[rr, cc] == PATHWAY_ID:
+                    return rr, cc
+    return None
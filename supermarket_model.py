@@ -10,6 +10,9 @@ STALL_ID_START = 50
 STALL_ID_END = 99
 ITEM_ID_START = 100 # ID cho các ô chứa mặt hàng cụ thể
 
+# Number of layout changes kept for incremental updates; older consumers rebuild from scratch
+MAX_LAYOUT_CHANGE_LOG = 256
+
 class SupermarketMap:
     def __init__(self, width_m, height_m, resolution_m):
         self.width_m = width_m
@@ -31,6 +34,24 @@ class SupermarketMap:
         self.approachable_item_locations = {}
         self.access_points = []      # list of (r, c) tuples
 
+        # Every mutation bumps layout_version and logs what changed, so derived data
+        # (obstacle attenuation, fingerprints) can be patched instead of rebuilt.
+        self.layout_version = 0
+        self._layout_changes = [] # list of (version, ("rect", r0, c0, r1, c1) | ("ap", ap_index))
+
+        # Derived data computed lazily from grid_map/access_points
+        self._obstacle_attenuation = None # (rows, cols, APs) float64 obstacle attenuation (dB) per AP ray
+        self._obstacle_attenuation_version = -1
+        self._walkable_mask = None # (rows, cols) read-only bool, True for PATHWAY/AP cells
+        self._walkable_mask_version = -1
+        self._pathfinding_grid = None # pathfinding.core.grid.Grid reused across route requests
+        self._pathfinding_grid_mask = None # walkable mask the pathfinding grid currently reflects
+        self._grid_astar = None # grid_pathfinding.GridAStar built from the walkable mask
+        self._grid_astar_mask = None
+        self._hierarchical_pathfinder = None # hierarchical_pathfinding.HierarchicalPathfinder (HPA*)
+        self._item_distance_table = None # item_distances.ItemDistanceTable between approach spots
+        self._item_distance_table_inputs = None # (walkable mask, approach spots) the table was built from
+
         self._next_stall_id = STALL_ID_START
         self._next_item_id = ITEM_ID_START
         print(f"Supermarket initialized: {self.num_rows} rows, {self.num_cols} cols.")
@@ -51,6 +72,139 @@ class SupermarketMap:
         self._next_item_id += 1
         return current_id
 
+    def _record_layout_change(self, change):
+        """Logs a layout change. Called by every method that mutates grid_map or access_points."""
+        self.layout_version += 1
+        self._layout_changes.append((self.layout_version, change))
+        if len(self._layout_changes) > MAX_LAYOUT_CHANGE_LOG:
+            del self._layout_changes[:-MAX_LAYOUT_CHANGE_LOG]
+
+    def _mark_dirty_rect(self, r_start, c_start, height, width):
+        self._record_layout_change(("rect", r_start, c_start, r_start + height, c_start + width))
+
+    def get_layout_changes_since(self, version):
+        """
+        Returns the list of changes made after `version`:
+        ("rect", r0, c0, r1, c1) for a rewritten area [r0:r1, c0:c1], ("ap", ap_index) for a new AP.
+        Returns None if the log no longer reaches back that far (caller must rebuild).
+        """
+        if version >= self.layout_version:
+            return []
+        if version < 0 or not self._layout_changes or self._layout_changes[0][0] > version + 1:
+            return None
+        return [change for v, change in self._layout_changes if v > version]
+
+    def get_obstacle_attenuation_db(self):
+        """
+        Returns a float64 array (rows, cols, APs): total material attenuation (dB) along the
+        straight line from each AP to each cell, integrated over the per-cell attenuation raster
+        (see config.MATERIAL_ATTENUATION_DB). Computed once with a batched ray traversal;
+        after layout edits only the rays touching the changed areas (or starting at new APs)
+        are traced again.
+        """
+        import rssi_simulation # Local import: rssi_simulation imports the ID constants from this module
+        if self._obstacle_attenuation_version == self.layout_version:
+            return self._obstacle_attenuation
+        changes = self.get_layout_changes_since(self._obstacle_attenuation_version)
+        if self._obstacle_attenuation is None or changes is None:
+            self._obstacle_attenuation = rssi_simulation.compute_obstacle_attenuation_tensor(
+                self.grid_map, self.access_points
+            )
+        else:
+            self._obstacle_attenuation = rssi_simulation.update_obstacle_attenuation_tensor(
+                self.grid_map, self.access_points, self._obstacle_attenuation, changes
+            )
+        self._obstacle_attenuation_version = self.layout_version
+        return self._obstacle_attenuation
+
+    def get_walkable_mask(self):
+        """
+        Returns a read-only bool array (rows, cols), True where a cart can stand (PATHWAY or AP cells).
+        Cached until the layout mutates; callers must not modify it.
+        """
+        if self._walkable_mask_version != self.layout_version:
+            mask = (self.grid_map == PATHWAY_ID) | (self.grid_map == AP_ID)
+            mask.flags.writeable = False
+            self._walkable_mask = mask
+            self._walkable_mask_version = self.layout_version
+        return self._walkable_mask
+
+    def get_pathfinding_grid(self):
+        """
+        Returns a pathfinding Grid built from the walkable mask and reused across searches.
+        Built once; after layout edits only the nodes whose walkability changed are updated.
+        Searches must leave node state clean (see localization_algorithms.find_path_astar).
+        """
+        mask = self.get_walkable_mask()
+        if self._pathfinding_grid_mask is mask:
+            return self._pathfinding_grid
+        if self._pathfinding_grid is None:
+            from pathfinding.core.grid import Grid # Local import: only route planning needs the library
+            # The library treats weights > 0 as walkable
+            self._pathfinding_grid = Grid(matrix=mask.astype(np.int8).tolist())
+        else:
+            changed_r, changed_c = np.nonzero(mask != self._pathfinding_grid_mask)
+            for r, c in zip(changed_r.tolist(), changed_c.tolist()):
+                node = self._pathfinding_grid.nodes[r][c]
+                node.walkable = bool(mask[r, c])
+                node.weight = 1.0 if node.walkable else 0.0
+        self._pathfinding_grid_mask = mask
+        return self._pathfinding_grid
+
+    def get_grid_astar(self):
+        """
+        Returns the built-in grid_pathfinding.GridAStar for the current walkable mask,
+        rebuilt only when the layout changes walkability.
+        """
+        mask = self.get_walkable_mask()
+        if self._grid_astar_mask is not mask:
+            import grid_pathfinding # Local import, like rssi_simulation above
+            if self._grid_astar is None or not np.array_equal(self._grid_astar_mask, mask):
+                self._grid_astar = grid_pathfinding.GridAStar(mask)
+            self._grid_astar_mask = mask
+        return self._grid_astar
+
+    def get_hierarchical_pathfinder(self):
+        """
+        Returns the hierarchical_pathfinding.HierarchicalPathfinder (HPA* cluster graph) for the
+        current walkable mask. Built once; after layout edits only the clusters around the
+        changed cells are rebuilt.
+        """
+        mask = self.get_walkable_mask()
+        if self._hierarchical_pathfinder is None:
+            import hierarchical_pathfinding # Local import, like rssi_simulation above
+            self._hierarchical_pathfinder = hierarchical_pathfinding.HierarchicalPathfinder(mask, self.get_grid_astar())
+        elif self._hierarchical_pathfinder.grid_astar is not self.get_grid_astar():
+            self._hierarchical_pathfinder.update(mask, self.get_grid_astar())
+        return self._hierarchical_pathfinder
+
+    def get_item_distance_table(self, with_predecessors=None):
+        """
+        Returns the item_distances.ItemDistanceTable (walking distances between all item
+        approach spots) for the current layout. Built lazily; rebuilt only when walkability
+        or the approach spots changed since it was built (adding an AP does neither).
+        with_predecessors (default config.ITEM_DISTANCE_STORE_PREDECESSORS) also keeps the
+        BFS direction arrays needed to rebuild routes.
+        """
+        import config
+        import item_distances # Local import, like rssi_simulation above
+        if with_predecessors is None:
+            with_predecessors = config.ITEM_DISTANCE_STORE_PREDECESSORS
+        table = self._item_distance_table
+        if table is not None and table.layout_version == self.layout_version \
+                and (table.with_predecessors or not with_predecessors):
+            return table
+        mask = self.get_walkable_mask()
+        spots = {name: list(item_spots) for name, item_spots in self.approachable_item_locations.items()}
+        if table is None or (with_predecessors and not table.with_predecessors) \
+                or not np.array_equal(self._item_distance_table_inputs[0], mask) \
+                or self._item_distance_table_inputs[1] != spots:
+            table = item_distances.ItemDistanceTable(self, with_predecessors=with_predecessors)
+        table.layout_version = self.layout_version
+        self._item_distance_table = table
+        self._item_distance_table_inputs = (mask, spots)
+        return table
+
     def _is_within_bounds(self, r, c, h=1, w=1):
         return 0 <= r < self.num_rows and \
                0 <= c < self.num_cols and \
@@ -62,6 +216,7 @@ class SupermarketMap:
             print(f"Error: Obstacle at ({r_start},{c_start}) size ({obs_height}x{obs_width}) out of bounds.")
             return False
         self.grid_map[r_start : r_start + obs_height, c_start : c_start + obs_width] = OBSTACLE_ID
+        self._mark_dirty_rect(r_start, c_start, obs_height, obs_width)
         # print(f"Added general obstacle at ({r_start},{c_start}) size ({obs_height}x{obs_width}).")
         return True
 
@@ -78,6 +233,7 @@ class SupermarketMap:
 
         stall_id = self._get_next_stall_id()
         self.grid_map[r_start : r_start + stall_height, c_start : c_start + stall_width] = stall_id
+        self._mark_dirty_rect(r_start, c_start, stall_height, stall_width)
         self.stall_definitions[stall_id] = {
             "name": stall_name,
             "r": r_start, "c": c_start, "h": stall_height, "w": stall_width
@@ -117,6 +273,7 @@ class SupermarketMap:
         # Assign item_id to the grid cells
         self.grid_map[r_item_area_start : r_item_area_start + item_area_height,
                       c_item_area_start : c_item_area_start + item_area_width] = item_id_to_assign
+        self._mark_dirty_rect(r_item_area_start, c_item_area_start, item_area_height, item_area_width)
 
         # Store individual cell locations for this item
         for r_offset in range(item_area_height):
@@ -202,11 +359,14 @@ class SupermarketMap:
         if self.grid_map[r_ap, c_ap] == PATHWAY_ID:
             self.grid_map[r_ap, c_ap] = AP_ID # Mark the cell as AP
             self.access_points.append((r_ap, c_ap))
+            self._mark_dirty_rect(r_ap, c_ap, 1, 1)
+            self._record_layout_change(("ap", len(self.access_points) - 1))
             return True
         # Allow placing AP on an existing AP_ID cell (idempotent)
         elif self.grid_map[r_ap, c_ap] == AP_ID:
             if (r_ap, c_ap) not in self.access_points: # Should not happen if logic is correct
                 self.access_points.append((r_ap,c_ap))
+                self._record_layout_change(("ap", len(self.access_points) - 1))
             return True
         else:
             print(f"Warning: Cannot place AP at ({r_ap},{c_ap}). Location occupied by ID {self.grid_map[r_ap, c_ap]}.")
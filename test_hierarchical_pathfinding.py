@@ -0,0 +1,49 @@
+# test_hierarchical_pathfinding.py
+# Đối chiếu HierarchicalPathfinder với GridAStar: cùng khả năng tới được, đường đi hợp lệ và
+# không ngắn hơn đường ngắn nhất, kể cả khi điểm đầu/cuối là ô lối vào.
+import numpy as np
+import grid_pathfinding
+from hierarchical_pathfinding import HierarchicalPathfinder
+
+def _assert_valid_path(path, walkable_mask, start_rc, end_rc):
+    assert path[0] == start_rc and path[-1] == end_rc
+    for (r_a, c_a), (r_b, c_b) in zip(path, path[1:]):
+        assert abs(r_a - r_b) + abs(c_a - c_b) == 1
+        assert walkable_mask[r_b, c_b]
+
+def _check_against_grid_astar(walkable_mask, hierarchical_pathfinder, pairs):
+    grid_astar = grid_pathfinding.GridAStar(walkable_mask)
+    for start_rc, end_rc in pairs:
+        expected = grid_astar.find_path(start_rc, end_rc)
+        path = hierarchical_pathfinder.find_path(start_rc, end_rc)
+        assert (path is None) == (expected is None), (start_rc, end_rc)
+        if path is not None:
+            _assert_valid_path(path, walkable_mask, start_rc, end_rc)
+            assert len(path) >= len(expected)
+
+def test_entrance_start_can_leave_its_cluster():
+    walkable_mask = np.zeros((4, 8), dtype=bool)
+    walkable_mask[1, :] = True
+    hierarchical_pathfinder = HierarchicalPathfinder(walkable_mask, cluster_size=4, entrance_spacing=8)
+    path = hierarchical_pathfinder.find_path((1, 3), (1, 7))
+    assert path == [(1, c) for c in range(3, 8)]
+
+def test_random_masks_match_grid_astar_reachability():
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        num_rows, num_cols = rng.integers(6, 30, 2)
+        walkable_mask = rng.random((num_rows, num_cols)) > rng.uniform(0.1, 0.4)
+        cluster_size = int(rng.integers(3, 9))
+        hierarchical_pathfinder = HierarchicalPathfinder(walkable_mask, cluster_size=cluster_size,
+                                                         entrance_spacing=int(rng.integers(2, 9)))
+        free_cells = [tuple(map(int, cell)) for cell in np.argwhere(walkable_mask)]
+        if len(free_cells) < 2:
+            continue
+        # Điểm đầu/cuối là ô lối vào hoặc ô ngẫu nhiên
+        entrances = [divmod(node, int(num_cols)) for node in hierarchical_pathfinder._graph]
+        endpoints = entrances + free_cells
+        picks = rng.integers(0, len(endpoints), (40, 2))
+        pairs = [(endpoints[a], endpoints[b]) for a, b in picks]
+        pairs += [(entrance, free_cells[i]) for entrance, i in
+                  zip(entrances, rng.integers(0, len(free_cells), len(entrances)))]
+        _check_against_grid_astar(walkable_mask, hierarchical_pathfinder, pairs)
@@ -0,0 +1,45 @@
+# test_particle_filter.py
+# Độ chính xác của ParticleFilterLocalizer trên một lộ trình mô phỏng (các đoạn A* nối tiếp trên
+# bố cục demo, độ phân giải mặc định): không được kém KNN vét cạn trên cùng các lần quét.
+import numpy as np
+import config
+import localization_algorithms
+import noise_models
+import rssi_simulation
+import store_layouts
+from particle_filter import ParticleFilterLocalizer
+
+def _simulated_walk(supermarket, cells, num_legs, rng):
+    grid_astar = supermarket.get_grid_astar()
+    current = tuple(cells[rng.integers(len(cells))])
+    walk = [current]
+    for _ in range(num_legs):
+        target = tuple(cells[rng.integers(len(cells))])
+        path = grid_astar.find_path(current, target)
+        if path:
+            walk.extend(path[1:])
+            current = target
+    return np.array(walk)
+
+def test_particle_filter_matches_knn_along_a_walk():
+    supermarket = store_layouts.build_demo_supermarket(quiet=True)
+    fingerprints = rssi_simulation.generate_rssi_fingerprints_from_map(
+        supermarket, seed=0, noise_model=noise_models.create_noise_model(seed=0))
+    fingerprint_matrix = localization_algorithms.as_fingerprint_matrix(fingerprints)
+    cells = np.column_stack(fingerprint_matrix.cell_positions())
+    walk = _simulated_walk(supermarket, cells, 6, np.random.default_rng(3))
+    observations = rssi_simulation.get_observed_rssi_batch_on_map(
+        supermarket, walk, noise_model=noise_models.create_noise_model(seed=1))
+
+    particle_filter = ParticleFilterLocalizer(supermarket, fingerprint_matrix, seed=0)
+    particle_filter.reset()
+    filter_errors_m, knn_errors_m = [], []
+    for true_rc, observed_rssi in zip(walk, observations):
+        filter_errors_m.append(rssi_simulation.euclidean_distance_m(particle_filter.predict(observed_rssi), true_rc))
+        knn_estimate = localization_algorithms.predict_location_knn(
+            observed_rssi, fingerprint_matrix, config.K_NEIGHBORS, config.USE_WEIGHTED_KNN, config.EPSILON_WEIGHT)
+        knn_errors_m.append(rssi_simulation.euclidean_distance_m(knn_estimate, true_rc))
+
+    # Bỏ vài lần quét đầu khi các hạt còn rải đều toàn bản đồ
+    assert np.mean(filter_errors_m[5:]) <= np.mean(knn_errors_m[5:])
+    assert np.mean(filter_errors_m[5:]) < config.GRID_RESOLUTION_M
@@ -0,0 +1,37 @@
+# test_rssi_simulation.py
+# get_observed_rssi_batch_on_map với mô hình nhiễu có trạng thái theo xe: một định danh (kể cả
+# số NumPy vô hướng) và dãy định danh theo từng hàng.
+import numpy as np
+import noise_models
+import rssi_simulation
+import store_layouts
+
+def _setup():
+    supermarket = store_layouts.build_demo_supermarket(quiet=True)
+    positions = np.argwhere(supermarket.get_walkable_mask())[:6]
+    return supermarket, positions
+
+def test_scalar_cart_ids():
+    supermarket, positions = _setup()
+    expected = rssi_simulation.get_observed_rssi_batch_on_map(
+        supermarket, positions, 3, noise_models.create_noise_model("temporal", seed=0))
+    for cart_id in (np.int64(3), np.array(3), np.arange(5)[3]):
+        noise_model = noise_models.create_noise_model("temporal", seed=0)
+        observed = rssi_simulation.get_observed_rssi_batch_on_map(supermarket, positions, cart_id, noise_model)
+        assert np.array_equal(observed, expected)
+        assert list(noise_model._cart_states) == [3]
+
+def test_per_row_cart_ids():
+    supermarket, positions = _setup()
+    cart_ids = np.array([7, 8, 7, 8, 7, 8])
+    noise_model = noise_models.create_noise_model("temporal", seed=0)
+    observed = rssi_simulation.get_observed_rssi_batch_on_map(supermarket, positions, cart_ids, noise_model)
+    assert observed.shape == (len(positions), len(supermarket.access_points))
+
+    # Mỗi xe rút nhiễu riêng, theo thứ tự xe xuất hiện lần đầu
+    noise_model = noise_models.create_noise_model("temporal", seed=0)
+    for cart_id in (7, 8):
+        rows = cart_ids == cart_id
+        expected = rssi_simulation.get_observed_rssi_batch_on_map(supermarket, positions[rows], cart_id, noise_model)
+        assert np.array_equal(observed[rows], expected)
+    assert sorted(noise_model._cart_states) == [7, 8]
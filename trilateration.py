@@ -0,0 +1,151 @@
+# trilateration.py
+# Định vị bằng trilateration dựa trên mô hình: đảo mô hình log-distance của
+# rssi_simulation.calculate_single_rssi_on_map (P_TX_MAX_RSSI, PATH_LOSS_EXPONENT_N) để đổi RSSI
+# thành khoảng cách tới từng AP, rồi giải bình phương tối thiểu có trọng số cho vị trí.
+# Không cần fingerprint hay tính trước: dùng khi fingerprint map chưa có, đã cũ hoặc đang được dựng
+# (ví dụ lần định vị đầu tiên ngay khi khởi động).
+import numpy as np
+import config
+from supermarket_model import PATHWAY_ID, AP_ID
+
+def rssi_to_distance_m(rssi_db):
+    """
+    Đảo mô hình log-distance: d = 10^((P_TX_MAX_RSSI - RSSI) / (10 * n)) (mét).
+    Bỏ qua suy hao vật cản (không biết trước), nên khoảng cách sau vật cản bị ước tính dài hơn.
+    """
+    rssi_db = np.asarray(rssi_db, dtype=np.float64)
+    exponent = (config.P_TX_MAX_RSSI - rssi_db) / (10 * config.PATH_LOSS_EXPONENT_N)
+    return np.power(10.0, np.maximum(exponent, 0.0))
+
+def _residual_weights(residuals, weights, obstructed_weight):
+    """
+    Vật cản chỉ làm RSSI yếu đi, nên khoảng cách đảo từ mô hình là cận trên: vị trí gần AP hơn
+    khoảng cách đó (phần dư âm) có thể do vật cản và chỉ bị phạt với hệ số obstructed_weight.
+    """
+    return np.where(residuals < 0, weights * obstructed_weight, weights)
+
+def _weighted_range_cost(positions, ap_rc, ranges, weights, obstructed_weight):
+    """Tổng bình phương có trọng số của phần dư (|x - a_i| - d_i) cho từng lần quét."""
+    residuals = np.sqrt(((positions[:, None, :] - ap_rc[None, :, :]) ** 2).sum(axis=2)) - ranges
+    return np.einsum('ma,ma->m', _residual_weights(residuals, weights, obstructed_weight), residuals ** 2)
+
+def trilaterate_batch(observations, access_points, iterations=None, damping=None, obstructed_weight=None):
+    """
+    Trilateration theo lô cho M lần quét.
+    observations: mảng (M, AP) các vector RSSI; access_points: danh sách (hàng, cột) của AP.
+    Khởi tạo bằng trọng tâm các AP có trọng số 1/d^2, rồi tinh chỉnh bằng Levenberg-Marquardt
+    (hệ số tắt dần ban đầu `damping`, điều chỉnh riêng cho từng lần quét) cho bài toán
+    min sum w_i * (|x - a_i| - d_i)^2, với w_i = 1/d_i^2 vì sai số dB của mô hình cho sai số
+    khoảng cách tỉ lệ với chính khoảng cách; phần dư âm nhân thêm obstructed_weight
+    (xem _residual_weights).
+    Giá trị chạm ngưỡng MIN_RSSI_THRESHOLD chỉ là cận dưới nên bị loại (trọng số 0).
+    Mọi phép tính là phép toán mảng trên cả lô, giải hệ 2x2 cho tất cả các lần quét cùng lúc.
+    Trả về mảng float64 (M, 2) vị trí (hàng, cột) theo ô, NaN nếu lần quét không có AP nào dùng được.
+    """
+    iterations = config.TRILATERATION_ITERATIONS if iterations is None else iterations
+    damping = config.TRILATERATION_DAMPING if damping is None else damping
+    obstructed_weight = config.TRILATERATION_OBSTRUCTED_WEIGHT if obstructed_weight is None else obstructed_weight
+    ap_rc = np.asarray(access_points, dtype=np.float64).reshape(-1, 2)
+    observations = np.asarray(observations, dtype=np.float64).reshape(-1, ap_rc.shape[0])
+
+    ranges = rssi_to_distance_m(observations) / config.GRID_RESOLUTION_M # Đổi sang đơn vị ô
+    usable = (observations > config.MIN_RSSI_THRESHOLD) & ~np.isnan(observations)
+    weights = np.where(usable, 1.0 / np.maximum(ranges, 1.0) ** 2, 0.0)
+    weight_sums = weights.sum(axis=1)
+    located = weight_sums > 0
+    safe_sums = np.where(located, weight_sums, 1.0)[:, None]
+
+    positions = (weights @ ap_rc) / safe_sums
+    costs = _weighted_range_cost(positions, ap_rc, ranges, weights, obstructed_weight)
+    damping = np.full(positions.shape[0], damping)
+    for _ in range(iterations):
+        offset_r = positions[:, 0:1] - ap_rc[None, :, 0] # (M, AP)
+        offset_c = positions[:, 1:2] - ap_rc[None, :, 1]
+        distances = np.maximum(np.sqrt(offset_r ** 2 + offset_c ** 2), 1e-9)
+        residuals = distances - ranges
+        # Jacobian của |x - a_i| theo x là (offset / distance); hệ chuẩn 2x2 được giải dạng đóng
+        jac_r, jac_c = offset_r / distances, offset_c / distances
+        residual_weights = _residual_weights(residuals, weights, obstructed_weight)
+        n_rr = np.einsum('ma,ma,ma->m', residual_weights, jac_r, jac_r)
+        n_rc = np.einsum('ma,ma,ma->m', residual_weights, jac_r, jac_c)
+        n_cc = np.einsum('ma,ma,ma->m', residual_weights, jac_c, jac_c)
+        g_r = np.einsum('ma,ma,ma->m', residual_weights, jac_r, residuals)
+        g_c = np.einsum('ma,ma,ma->m', residual_weights, jac_c, residuals)
+        # Tắt dần theo đường chéo để hệ luôn khả nghịch (kể cả khi chỉ có 1-2 AP)
+        n_rr = n_rr * (1 + damping) + 1e-12
+        n_cc = n_cc * (1 + damping) + 1e-12
+        determinant = n_rr * n_cc - n_rc ** 2
+        step_r = (n_cc * g_r - n_rc * g_c) / determinant
+        step_c = (n_rr * g_c - n_rc * g_r) / determinant
+        candidates = positions - np.column_stack([step_r, step_c])
+        # Chỉ nhận bước làm giảm hàm mục tiêu; bước bị từ chối thì tăng hệ số tắt dần
+        candidate_costs = _weighted_range_cost(candidates, ap_rc, ranges, weights, obstructed_weight)
+        improved = candidate_costs < costs
+        positions[improved] = candidates[improved]
+        costs = np.where(improved, candidate_costs, costs)
+        damping = np.where(improved, damping / 3, damping * 3)
+    positions[~located] = np.nan
+    return positions
+
+def snap_to_walkable_cells(grid_map, positions_rc, max_radius=None):
+    """
+    Đưa mỗi vị trí (hàng, cột) thực về ô lối đi (PATHWAY/AP) gần nhất trong grid_map.
+    Ô đã làm tròn nằm trên lối đi được giữ nguyên; các vị trí còn lại được tìm theo từng vòng
+    vuông mở rộng dần quanh ô làm tròn, chọn ô gần vị trí thực nhất trên vòng đầu tiên có lối đi
+    (xử lý cùng lúc mọi vị trí còn chờ ở mỗi vòng).
+    Trả về mảng int64 (M, 2); hàng -1 nếu vị trí là NaN hoặc không có ô lối đi trong max_radius.
+    """
+    num_rows, num_cols = grid_map.shape
+    max_radius = max(num_rows, num_cols) if max_radius is None else max_radius
+    walkable = (grid_map == PATHWAY_ID) | (grid_map == AP_ID)
+    positions_rc = np.asarray(positions_rc, dtype=np.float64).reshape(-1, 2)
+    valid = ~np.isnan(positions_rc).any(axis=1)
+
+    snapped = np.full(positions_rc.shape, -1, dtype=np.int64)
+    cells = np.zeros(positions_rc.shape, dtype=np.int64)
+    cells[valid, 0] = np.clip(np.rint(positions_rc[valid, 0]), 0, num_rows - 1)
+    cells[valid, 1] = np.clip(np.rint(positions_rc[valid, 1]), 0, num_cols - 1)
+    on_path = valid & walkable[cells[:, 0], cells[:, 1]]
+    snapped[on_path] = cells[on_path]
+    pending = np.flatnonzero(valid & ~on_path)
+
+    for radius in range(1, max_radius + 1):
+        if pending.size == 0:
+            break
+        dr, dc = np.meshgrid(np.arange(-radius, radius + 1), np.arange(-radius, radius + 1), indexing='ij')
+        ring = np.maximum(np.abs(dr), np.abs(dc)) == radius
+        ring_r = cells[pending, 0][:, None] + dr[ring][None, :]
+        ring_c = cells[pending, 1][:, None] + dc[ring][None, :]
+        inside = (ring_r >= 0) & (ring_r < num_rows) & (ring_c >= 0) & (ring_c < num_cols)
+        candidate = inside & walkable[np.clip(ring_r, 0, num_rows - 1), np.clip(ring_c, 0, num_cols - 1)]
+        dist_sq = (ring_r - positions_rc[pending, 0][:, None]) ** 2 + (ring_c - positions_rc[pending, 1][:, None]) ** 2
+        dist_sq = np.where(candidate, dist_sq, np.inf)
+        best = np.argmin(dist_sq, axis=1)
+        found = candidate[np.arange(pending.size), best]
+        snapped[pending[found], 0] = ring_r[found, best[found]]
+        snapped[pending[found], 1] = ring_c[found, best[found]]
+        pending = pending[~found]
+    return snapped
+
+def predict_locations_trilateration_batch(observations, supermarket_map_obj):
+    """
+    Trilateration theo lô trên supermarket_map_obj, kết quả đã đưa về ô lối đi gần nhất.
+    Trả về mảng float64 (M, 2) (hàng, cột) như predict_locations_knn_batch; NaN cho lần quét
+    không định vị được. Trả về None nếu bản đồ chưa có AP.
+    """
+    if not supermarket_map_obj.access_points:
+        print("Lỗi trilateration: Bản đồ chưa có Access Point nào.")
+        return None
+    positions = trilaterate_batch(observations, supermarket_map_obj.access_points)
+    snapped = snap_to_walkable_cells(supermarket_map_obj.grid_map, positions).astype(np.float64)
+    snapped[snapped[:, 0] < 0] = np.nan
+    return snapped
+
+def predict_location_trilateration(observed_rssi, supermarket_map_obj):
+    """Trilateration cho một lần quét; trả về (hàng, cột) hoặc None (cùng dạng với predict_location_knn)."""
+    if len(observed_rssi) != len(supermarket_map_obj.access_points):
+        raise ValueError("Các vector RSSI phải có cùng độ dài")
+    estimates = predict_locations_trilateration_batch([observed_rssi], supermarket_map_obj)
+    if estimates is None or np.isnan(estimates[0, 0]):
+        return None
+    return float(estimates[0, 0]), float(estimates[0, 1])